@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 import io
+import hashlib
+import heapq
 from pathlib import Path
 import re
 import argparse
+import shutil
 import sys
 from datetime import datetime
 import os
-import subprocess as sp
 
+from elftools.elf.elffile import ELFFile
+from elftools.elf.constants import SH_FLAGS
+from elftools.common.exceptions import ELFError
 from tabulate import tabulate
 
 script_name = Path(sys.argv[0]).name
@@ -15,64 +20,231 @@ script_name = Path(sys.argv[0]).name
 def generated(file):
     print(f"Generated: {file.resolve()}")
 
-class Toolchain:
-    def __init__(self,toolchain_path):
-        self.path = str(toolchain_path)
-        self.readelf_cmd = self.path+'readelf'
-        self.objcopy_cmd = self.path+'objcopy'
-        self.objdump_cmd = self.path+'objdump'
-    def run(self,cmd):
-        print(cmd)
-        return sp.run(cmd,capture_output=True,encoding="utf-8",shell=True,check=True).stdout
-    def read_elf(self,elf_file):
-        return self.run(self.readelf_cmd+f' -S {elf_file}')
-    def read_elf_symbol_table(self,elf_file):
-        return self.run(self.readelf_cmd+f' -Ws {elf_file}')
-    def write_hex(self,elf_file,output_path,format='verilog'):
-        return self.run(f'{self.objcopy_cmd} -O {format} {elf_file} {output_path}')
-    def read_elf_dump_instruction_sections(self,elf_file,sections):
-        if isinstance(sections,str):
-            sections = [sections]
-        j_opt = ' '.join([f'-j {s}' for s in sections])
-        return self.run(f'{self.objdump_cmd} -S -Mno-aliases -r {elf_file} {j_opt}')
-    def read_elf_sections_header(self,elf_file):
-        return self.run(f'{self.objdump_cmd} -h {elf_file}')
-    def read_elf_dump_data_sections(self,elf_file,sections):
-        j_opt = ' '.join([f'-j {s}' for s in sections])
-        return self.run(f'{self.objdump_cmd} -s {elf_file} {j_opt}')
-
-toolchain = Toolchain('riscv64-unknown-elf-')
-
-def _generate_dissassembly_file(elf_file):
-    inst_sections = ['.init', '.text']
-    r = toolchain.read_elf_dump_instruction_sections(elf_file,inst_sections)
-    all_sections = toolchain.read_elf_sections_header(elf_file).splitlines()
-    start = next((i for i,line in enumerate(all_sections) if line.startswith('Sections:')),None)
-    all_sections = [line.split()[1] for line in all_sections[start:] if re.search('^\s+\d',line)]
-    non_inst_sections = [i for i in all_sections if not i in inst_sections]
-    r += toolchain.read_elf_dump_data_sections(elf_file,non_inst_sections)
-    return r
+## Generated artifacts are cached per ELF content, bump when their format changes
+cache_dir = Path(__file__).resolve().parent.parent/'work/scripts_cache'
+artifact_version = 2
+## Least recently used artifacts are removed past this count
+cache_entries = 256
+
+def elf_hash(elf_file):
+    digest = hashlib.sha256(f'artifact_version={artifact_version}'.encode())
+    with Path(elf_file).open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cached_artifact(elf_file, suffix, generate):
+    """Path of an artifact of elf_file, generate(elffile, path) writes it on a cache miss."""
+    path = cache_dir/(elf_hash(elf_file) + suffix)
+    try:
+        ## Mark it as used for prune_cache
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f'{path.name}.{os.getpid()}')
+    try:
+        with Path(elf_file).open('rb') as f:
+            generate(ELFFile(f), temp)
+        temp.replace(path)
+    finally:
+        temp.unlink(missing_ok=True)
+    prune_cache(cache_entries)
+    return path
+
+def prune_cache(max_entries):
+    """Remove all but the max_entries most recently used files of the cache."""
+    entries = []
+    for entry in cache_dir.iterdir():
+        try:
+            entries.append((entry.stat().st_mtime, entry))
+        except FileNotFoundError:
+            ## Removed by another process
+            continue
+    for _, entry in sorted(entries, reverse=True)[max_entries:]:
+        entry.unlink(missing_ok=True)
+
+def copy_artifact(elf_file, suffix, generate, output):
+    shutil.copyfile(cached_artifact(elf_file, suffix, generate), output)
+    generated(output)
+    return output
+
+abi_names = ['zero','ra','sp','gp','tp','t0','t1','t2','s0','s1','a0','a1','a2','a3','a4','a5',
+    'a6','a7','s2','s3','s4','s5','s6','s7','s8','s9','s10','s11','t3','t4','t5','t6']
+branch_names = {0:'beq',1:'bne',4:'blt',5:'bge',6:'bltu',7:'bgeu'}
+load_names = {0:'lb',1:'lh',2:'lw',4:'lbu',5:'lhu'}
+store_names = {0:'sb',1:'sh',2:'sw'}
+alu_imm_names = {0:'addi',2:'slti',3:'sltiu',4:'xori',6:'ori',7:'andi'}
+alu_names = {(0,0):'add',(0,0x20):'sub',(1,0):'sll',(2,0):'slt',(3,0):'sltu',(4,0):'xor',
+    (5,0):'srl',(5,0x20):'sra',(6,0):'or',(7,0):'and'}
+csr_names = {1:'csrrw',2:'csrrs',3:'csrrc',5:'csrrwi',6:'csrrsi',7:'csrrci'}
+
+def sext(value, bits):
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+def disassemble(insn, pc, symbol = lambda addr: None):
+    """RV32I mnemonic of insn, without aliases like ``objdump -Mno-aliases``."""
+    opcode = insn & 0x7F
+    rd, rs1, rs2 = [abi_names[(insn >> shift) & 0x1F] for shift in (7, 15, 20)]
+    funct3 = (insn >> 12) & 0x7
+    funct7 = insn >> 25
+    imm_i = sext(insn >> 20, 12)
+    def target(offset):
+        addr = (pc + offset) & 0xFFFFFFFF
+        name = symbol(addr)
+        return f'{addr:x}' + (f' <{name}>' if name else '')
+    if opcode == 0x37:
+        return f'lui\t{rd},0x{insn >> 12:x}'
+    if opcode == 0x17:
+        return f'auipc\t{rd},0x{insn >> 12:x}'
+    if opcode == 0x6F:
+        offset = sext(((insn >> 31) << 20) | (((insn >> 12) & 0xFF) << 12) | (((insn >> 20) & 1) << 11) | (((insn >> 21) & 0x3FF) << 1), 21)
+        return f'jal\t{rd},{target(offset)}'
+    if opcode == 0x67 and funct3 == 0:
+        return f'jalr\t{rd},{imm_i}({rs1})'
+    if opcode == 0x63 and funct3 in branch_names:
+        offset = sext(((insn >> 31) << 12) | (((insn >> 7) & 1) << 11) | (((insn >> 25) & 0x3F) << 5) | (((insn >> 8) & 0xF) << 1), 13)
+        return f'{branch_names[funct3]}\t{rs1},{rs2},{target(offset)}'
+    if opcode == 0x03 and funct3 in load_names:
+        return f'{load_names[funct3]}\t{rd},{imm_i}({rs1})'
+    if opcode == 0x23 and funct3 in store_names:
+        offset = sext((funct7 << 5) | ((insn >> 7) & 0x1F), 12)
+        return f'{store_names[funct3]}\t{rs2},{offset}({rs1})'
+    if opcode == 0x13 and funct3 in alu_imm_names:
+        return f'{alu_imm_names[funct3]}\t{rd},{rs1},{imm_i}'
+    if opcode == 0x13 and (funct3, funct7) in [(1,0),(5,0),(5,0x20)]:
+        name = {1:'slli',5:'srli' if funct7 == 0 else 'srai'}[funct3]
+        return f'{name}\t{rd},{rs1},0x{(insn >> 20) & 0x1F:x}'
+    if opcode == 0x33 and (funct3, funct7) in alu_names:
+        return f'{alu_names[(funct3, funct7)]}\t{rd},{rs1},{rs2}'
+    if opcode == 0x0F:
+        return 'fence.i' if funct3 == 1 else 'fence'
+    if opcode == 0x73:
+        if funct3 == 0:
+            return {0x00000073:'ecall',0x00100073:'ebreak',0x30200073:'mret',0x10500073:'wfi'}.get(insn, f'.word\t0x{insn:08x}')
+        if funct3 in csr_names:
+            source = rs1 if funct3 < 4 else (insn >> 15) & 0x1F
+            return f'{csr_names[funct3]}\t{rd},0x{insn >> 20:x},{source}'
+    return f'.word\t0x{insn:08x}'
+
+section_flags = [(SH_FLAGS.SHF_WRITE,'W'),(SH_FLAGS.SHF_ALLOC,'A'),(SH_FLAGS.SHF_EXECINSTR,'X')]
+
+def format_sections(elffile):
+    rows = []
+    for i, section in enumerate(elffile.iter_sections()):
+        flags = ''.join(name for flag, name in section_flags if section['sh_flags'] & flag)
+        rows.append([i, section.name, section['sh_type'].replace('SHT_',''), f"{section['sh_addr']:08x}",
+            f"{section['sh_offset']:06x}", f"{section['sh_size']:06x}", flags, section['sh_addralign']])
+    return 'Section Headers:\n' + tabulate(rows, headers=['Nr','Name','Type','Addr','Off','Size','Flg','Al'])
+
+def format_symbols(elffile):
+    symtab = elffile.get_section_by_name('.symtab')
+    if symtab is None:
+        return 'No symbol table'
+    rows = [[i, f"{s['st_value']:08x}", s['st_size'], s['st_info']['type'].replace('STT_',''),
+        s['st_info']['bind'].replace('STB_',''), str(s['st_shndx']).replace('SHN_',''), s.name]
+        for i, s in enumerate(symtab.iter_symbols())]
+    return f"Symbol table '.symtab' contains {len(rows)} entries:\n" + tabulate(rows, headers=['Num','Value','Size','Type','Bind','Ndx','Name'])
+
+def code_labels(elffile):
+    """Address to name of the function and label symbols."""
+    symtab = elffile.get_section_by_name('.symtab')
+    labels = {}
+    if symtab is not None:
+        for s in symtab.iter_symbols():
+            if s['st_info']['type'] in ('STT_FUNC','STT_NOTYPE') and s.name and not s.name.startswith('$'):
+                if s['st_value'] not in labels or s['st_info']['type'] == 'STT_FUNC':
+                    labels[s['st_value']] = s.name
+    return labels
+
+def source_lines(elffile):
+    """Address to (path, line) of the DWARF line programs, empty without debug info."""
+    lines = {}
+    if not elffile.has_dwarf_info():
+        return lines
+    try:
+        dwarf = elffile.get_dwarf_info()
+        for cu in dwarf.iter_CUs():
+            program = dwarf.line_program_for_CU(cu)
+            if program is None:
+                continue
+            comp_dir = cu.get_top_DIE().attributes.get('DW_AT_comp_dir')
+            directories = [comp_dir.value if comp_dir else b'.', *program['include_directory']]
+            for entry in program.get_entries():
+                state = entry.state
+                if state is None or state.end_sequence:
+                    continue
+                file_entry = program['file_entry'][state.file - 1]
+                path = Path(directories[file_entry.dir_index].decode(errors='replace'))/file_entry.name.decode(errors='replace')
+                lines[state.address] = (path, state.line)
+    except (AssertionError, ELFError, IndexError, KeyError) as e:
+        ## pyelftools does not parse every DWARF version, the disassembly is still useful
+        print(f"Warning: no source lines, unsupported debug info: {e!r}")
+    return lines
+
+def dump_section(section, columns = 16):
+    """Hex and ASCII dump of a section like ``objdump -s``."""
+    data = section.data()
+    out = [f'Contents of section {section.name}:']
+    for offset in range(0, len(data), columns):
+        chunk = data[offset:offset+columns]
+        words = ' '.join(chunk[i:i+4].hex() for i in range(0, columns, 4)).ljust(columns*2 + columns//4 - 1)
+        text = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+        out.append(f" {section['sh_addr'] + offset:04x} {words}  {text}")
+    return '\n'.join(out)
+
+def disassembly(elffile):
+    """Disassembly of the code sections with source lines, then a dump of the other sections."""
+    labels = code_labels(elffile)
+    lines = source_lines(elffile)
+    sources = {}
+    def source_text(path, line):
+        if path not in sources:
+            try:
+                sources[path] = path.read_text(errors='replace').splitlines()
+            except OSError:
+                sources[path] = []
+        text = sources[path]
+        return text[line - 1] if 0 < line <= len(text) else ''
+    out = []
+    dumped = []
+    for section in elffile.iter_sections():
+        if not section['sh_flags'] & SH_FLAGS.SHF_EXECINSTR:
+            if section['sh_type'] not in ('SHT_NULL','SHT_NOBITS','SHT_SYMTAB','SHT_STRTAB') and section['sh_size'] > 0:
+                dumped.append(section)
+            continue
+        out.append(f'\nDisassembly of section {section.name}:')
+        data = section.data()
+        for offset in range(0, len(data) - 3, 4):
+            addr = section['sh_addr'] + offset
+            if addr in labels:
+                out.append(f'\n{addr:08x} <{labels[addr]}>:')
+            if addr in lines:
+                path, line = lines[addr]
+                out.append(f'{path}:{line}')
+                text = source_text(path, line)
+                if text:
+                    out.append(text)
+            insn = int.from_bytes(data[offset:offset+4], 'little')
+            out.append(f'{addr:8x}:\t{insn:08x}          \t{disassemble(insn, addr, labels.get)}')
+    out.append('')
+    out.extend(dump_section(section) for section in dumped)
+    return '\n'.join(out) + '\n'
 
 def generate_dissassembly_file(diss,elf_file):
-    diss = elf_file.with_suffix('.debug')
-    if diss is not None:
-        diss = Path(diss)
-    r = _generate_dissassembly_file(elf_file)
-    diss.write_text(r)
-    generated(diss)
-    return diss
+    if diss is None:
+        diss = elf_file.with_suffix('.debug')
+    def generate(elffile, path):
+        path.write_text(disassembly(elffile))
+    return copy_artifact(elf_file, '.diss', generate, Path(diss))
 
 def generate_debug_file(output,elf_file:Path):
-    elf_sections = toolchain.read_elf(elf_file)
-    if output is not None:
-        output = Path(output)
-    else:
+    if output is None:
         output = elf_file.with_suffix('.debug')
-    temp = _generate_dissassembly_file(elf_file)
-    temp1 = toolchain.read_elf_symbol_table(elf_file)
-    output.write_text(elf_sections + '\n' + temp1 + '\n' + temp)
-    generated(output)
-    return output
+    def generate(elffile, path):
+        path.write_text(format_sections(elffile) + '\n\n' + format_symbols(elffile) + '\n' + disassembly(elffile))
+    return copy_artifact(elf_file, '.debug', generate, Path(output))
 
 def get_printer(name, width, entries):
     printer_template = """
@@ -160,103 +332,172 @@ def generate_gtkwave_filters(gtkwave_dir,rtl_header):
         out_files.append(path)
     return out_files
 
-def parse_verilog_hex(v_hex_file):
-    data = {}
+def hex_bytes(tokens, path = '', line_number = 0):
+    """Bytes of Verilog hex data tokens, one byte per address."""
+    for token in tokens:
+        if len(token) > 2:
+            raise ValueError(f"{path}:{line_number}: only one byte per address is supported, got {token}")
+    return bytes.fromhex(''.join(token.zfill(2) for token in tokens))
+
+def iter_verilog_hex(v_hex_file, chunk_size = 4096):
+    """Stream the byte runs of a Verilog hex file as (address, bytearray) pairs.
+
+    Every data token is one byte at the next address, wider tokens are
+    rejected. Runs are split at the first line past chunk_size bytes,
+    consecutive runs may be contiguous.
+    """
     addr = 0
-    for token in re.split('\s+',v_hex_file.read_text().strip()):
-        if token.startswith('@'):
-            addr = int(token.lstrip('@'),16)
-            continue
-        data[addr] = int(token,16)
-        addr += 1
-    return data
+    run_addr = 0
+    run = bytearray()
+    with Path(v_hex_file).open() as f:
+        for line_number, line in enumerate(f, 1):
+            if '@' not in line:
+                data = hex_bytes(line.split(), v_hex_file, line_number)
+                run += data
+                addr += len(data)
+            else:
+                for token in line.split():
+                    if token.startswith('@'):
+                        if run:
+                            yield run_addr, run
+                        addr = run_addr = int(token[1:],16)
+                        run = bytearray()
+                    else:
+                        run += hex_bytes([token], v_hex_file, line_number)
+                        addr += 1
+            if len(run) >= chunk_size:
+                yield run_addr, run
+                run_addr = addr
+                run = bytearray()
+    if run:
+        yield run_addr, run
+
+def parse_verilog_hex(v_hex_file):
+    """Return a Memory with the content of a Verilog hex file."""
+    mem = Memory()
+    for addr, data in iter_verilog_hex(v_hex_file):
+        mem.insert(addr, data)
+    return mem
+
+def zero_runs(zeros, chunk_size = 4096):
+    """Expand (address, size) zero ranges into runs of at most chunk_size bytes."""
+    for addr, size in sorted(zeros):
+        for offset in range(0, size, chunk_size):
+            yield addr + offset, bytes(min(chunk_size, size - offset))
 
 class VerilogHexWriter:
-    def __init__(self, out_path, addr_width = 0, data_width = 0, columns = 4):
-        self.out_path = out_path
-        self.lines = []
-        self.addr_width = addr_width
-        self.data_width = data_width
+    """Stream byte runs to a Verilog hex file, an @address line starts each discontinuity."""
+    def __init__(self, out_path, columns = 16):
+        self.out_path = Path(out_path)
         self.columns = columns
-        self.buffer = []
+        self.next_addr = None
+        self.file = None
     @staticmethod
     def hex(value, width = 0):
         return f'{value:0{width}X}'
-    def address(self, addr):
-        self.flush_columns()
-        self.lines.append('@'+self.hex(addr, self.addr_width))
-    def value(self, value):
-        self.buffer.append(self.hex(value, self.data_width))
-        if len(self.buffer) == self.columns:
-            self.flush_columns()
-    def flush_columns(self):
-        if len(self.buffer) != 0:
-            self.lines.append(' '.join(self.buffer))
-            self.buffer = []
-    def write(self):
-        self.out_path.write_text('\n'.join(self.lines)+'\n')
+    def __enter__(self):
+        self.file = self.out_path.open('w')
+        return self
+    def __exit__(self, *exc):
+        self.file.close()
+    def write(self, addr, data):
+        if addr != self.next_addr:
+            self.file.write('@'+self.hex(addr)+'\n')
+        for offset in range(0, len(data), self.columns):
+            self.file.write(data[offset:offset+self.columns].hex(' ').upper()+'\n')
+        self.next_addr = addr + len(data)
+
+def write_verilog_hex(out_path, runs):
+    with VerilogHexWriter(out_path) as writer:
+        for addr, data in runs:
+            writer.write(addr, data)
 
 class Memory:
-    def __init__(self, v_hex_file):
-        self.v_hex_file = v_hex_file
-        self.data = parse_verilog_hex(self.v_hex_file)
-    def get_max_width(self):
-        max_addr_width = max([len(VerilogHexWriter.hex(i)) for i in self.data.keys()])
-        max_data_width = max([len(VerilogHexWriter.hex(i)) for i in self.data.values()])
-        return max_addr_width, max_data_width
+    """Memory image made of contiguous byte runs and zero filled ranges, like .bss.
+
+    Zero ranges are kept as (address, size) and only expanded when written.
+    Runs and zero ranges must not overlap.
+    """
+    def __init__(self, v_hex_file = None):
+        self.segments = []
+        self.zeros = []
+        if v_hex_file is not None:
+            for addr, data in iter_verilog_hex(v_hex_file):
+                self.insert(addr, data)
     def __str__(self):
-        return tabulate(self.data.items(),headers=['address','value'])
+        table = [(addr, len(data), 'data') for addr, data in self.segments]
+        table += [(addr, size, 'zero') for addr, size in self.zeros]
+        return tabulate([(hex(addr), size, kind) for addr, size, kind in sorted(table)], headers=['address','size','kind'])
     def insert(self, start_address, data):
-        for i,value in enumerate(data):
-            addr = start_address + i
-            self.data[addr] = value
+        if self.segments and self.segments[-1][0] + len(self.segments[-1][1]) == start_address:
+            self.segments[-1][1] += data
+        else:
+            self.segments.append([start_address, bytearray(data)])
+    def insert_zeros(self, start_address, size):
+        self.zeros.append((start_address, size))
+    def runs(self):
+        """(address, data) runs in address order."""
+        segments = sorted(self.segments, key=lambda run: run[0])
+        return heapq.merge(segments, zero_runs(self.zeros), key=lambda run: run[0])
     def write_verilog_hex(self, out_path):
-        writer = VerilogHexWriter(out_path, *self.get_max_width())
-        address = sorted(self.data.keys())
-        last_addr = 0
-        for addr in address:
-            if addr != last_addr + 1:
-                writer.address(addr)
-            writer.value(self.data[addr])
-            last_addr = addr
-        writer.address(addr+1)
-        writer.write()
-
-
-readelf_regex = re.compile(r'\[\s*(\d+)]\s+(\.[\w.]+)?\s+(\w+)\s+([\da-f]+)\s+([\da-f]+)\s+([\da-f]+)\s+(\d+)\s+([A-Z]+)?\s+(\d+)\s+(\d+)\s+(\d+)')
-
-def parse_readelf(text):
-    table = []
-    for line in text.splitlines():
-        m = readelf_regex.search(line)
-        if m:
-            table.append(m.groups())
-    return table
+        write_verilog_hex(out_path, self.runs())
+
+
+def load_address(elffile, section):
+    """Load address (LMA) of an allocated section, like ``objcopy -O verilog``.
+
+    A section inside a PT_LOAD segment is loaded at the segment physical address
+    plus its offset in the segment, sections outside of one at their sh_addr.
+    """
+    for segment in elffile.iter_segments():
+        if segment['p_type'] == 'PT_LOAD' and segment.section_in_segment(section):
+            return segment['p_paddr'] + section['sh_addr'] - segment['p_vaddr']
+    return section['sh_addr']
+
+def loaded_sections(elffile):
+    """(load address, section) of the allocated sections with content and of the NOBITS ones, like .bss, by load address."""
+    sections = sorted(((load_address(elffile, s), s) for s in elffile.iter_sections() if s['sh_flags'] & SH_FLAGS.SHF_ALLOC and s['sh_size'] > 0),
+        key=lambda entry: entry[0])
+    return [e for e in sections if e[1]['sh_type'] != 'SHT_NOBITS'], [e for e in sections if e[1]['sh_type'] == 'SHT_NOBITS']
+
+def section_runs(elffile, sections, chunk_size = 4096):
+    """Stream the content of (load address, section) entries as (address, bytes) runs."""
+    stream = elffile.stream
+    for addr, section in sections:
+        for offset in range(0, section['sh_size'], chunk_size):
+            stream.seek(section['sh_offset'] + offset)
+            yield addr + offset, stream.read(min(chunk_size, section['sh_size'] - offset))
+
+def write_elf_hex(elffile, path, zeros = True):
+    data, nobits = loaded_sections(elffile)
+    runs = section_runs(elffile, data)
+    if zeros:
+        runs = heapq.merge(runs, zero_runs([(addr, s['sh_size']) for addr, s in nobits]), key=lambda run: run[0])
+    write_verilog_hex(path, runs)
 
 def generate_hex_file(hex_file: Path,elf_file: Path,v_hex_file):
-    if elf_file is not None:
-        v_hex_file = hex_file.with_suffix('.ocpy_v_hex')
-        toolchain.write_hex(elf_file,v_hex_file,format='verilog')
-        readelf_output = toolchain.read_elf(elf_file)
-        section_table = parse_readelf(readelf_output)
-        init_zeros = [{'name':line[1],'addr':int(line[3],16),'size':int(line[5],16)} for line in section_table if 'NOBITS' in line]
-    else:
-        init_zeros = []
-    mem = Memory(v_hex_file)
-    table = [{k:v if k != 'addr' else hex(v) for k,v in row.items()} for row in init_zeros]
-    if len(table) > 0:
-        print("\nZero initialized sections:")
-        print(tabulate(table,headers="keys"))
-        print()
+    """Hex image of an ELF or a Verilog hex file, .bss and other NOBITS sections are written as zeros.
+
+    The .debug_hex file has no zero initialized sections. Both images are
+    streamed, memory use does not depend on their size.
+    """
     debug_hex_file = hex_file.with_suffix('.debug_hex')
-    mem.write_verilog_hex(debug_hex_file)
+    if elf_file is not None:
+        with elf_file.open('rb') as f:
+            _, nobits = loaded_sections(ELFFile(f))
+            table = [dict(name=s.name, addr=hex(addr), size=s['sh_size']) for addr, s in nobits]
+        if len(table) > 0:
+            print("\nZero initialized sections:")
+            print(tabulate(table,headers="keys"))
+            print()
+        copy_artifact(elf_file, '.debug_hex', lambda elffile, path: write_elf_hex(elffile, path, zeros=False), debug_hex_file)
+        copy_artifact(elf_file, '.hex', write_elf_hex, hex_file)
+        return
+    write_verilog_hex(debug_hex_file, iter_verilog_hex(v_hex_file))
     generated(debug_hex_file)
-    for row in init_zeros:
-        mem.insert(row['addr'],[0]*row['size'])
-    mem.write_verilog_hex(hex_file)
+    write_verilog_hex(hex_file, iter_verilog_hex(v_hex_file))
     generated(hex_file)
 
-
 if __name__=='__main__':
     header_params = dict(
         metavar='RTL_HEADER_PATH',
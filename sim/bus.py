@@ -1,3 +1,4 @@
+from collections import deque
 import dataclasses
 import typing
 
@@ -86,24 +87,25 @@ class BusWriteTransaction:
 
 class ReadyValidBfm(SimpleBfm):
     Signals = SimpleBfm.make_signals("ReadyValidBfmSignals",["ready","valid"])
-    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns",init_valid=False):
+    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns",init_valid=False,event_driven=False):
         self.payload = payload
-        super().__init__(signals=signals, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock)
+        super().__init__(signals=signals, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock, event_driven=event_driven)
         if init_valid:
             self.bus.valid.setimmediatevalue(0)
     async def recv_payload(self):
         while(True):
-            await RisingEdge(self.clock)
-            await ReadOnly()
+            await self.sample()
             if self.in_reset:
-                self.log.debug(f"recv_payload in_reset true, continue... {self.bus.ready._name}")
+                self.log.debug("recv_payload in_reset true, continue... %s",self.bus.ready._name)
                 continue
             if self.bus.ready.value and self.bus.valid.value:
                 actual_payload = {k:int(p.value) for k,p in self.payload.items()}
-                self.log.debug(f"Receiving payload {self.bus.ready._name} {actual_payload}")
+                self.log.debug("Receiving payload %s %s",self.bus.ready._name,actual_payload)
                 yield actual_payload
+            elif self.event_driven and not self.bus.valid.value:
+                await self.sleep_until_rising(self.bus.valid)
     async def send_payload(self,**kwargs):
-        self.log.debug(f"Send payload {self.bus.ready._name} {kwargs}")
+        self.log.debug("Send payload %s %s",self.bus.ready._name,kwargs)
         await self.wait_for_signal(self.bus.ready,1)
         self.bus.valid.value = 1
         for name,payload_signal in self.payload.items():
@@ -112,37 +114,38 @@ class ReadyValidBfm(SimpleBfm):
         await NextTimeStep()
         self.bus.valid.value = 0
     async def drive_ready(self,value):
-        self.log.debug(f"Drive ready {self.bus.ready._name} {value}")
+        self.log.debug("Drive ready %s %s",self.bus.ready._name,value)
         await RisingEdge(self.clock)
         self.bus.ready.value = value
     async def drive_valid(self,value):
-        self.log.debug(f"Drive valid {self.bus.valid._name} {value}")
+        self.log.debug("Drive valid %s %s",self.bus.valid._name,value)
         await RisingEdge(self.clock)
         self.bus.valid.value = value
 
 class _ReadyValidBfm(SimpleBfm):
     Signals = SimpleBfm.make_signals("_ReadyValidBfm",["ready","valid"])
-    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns"):
+    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns", event_driven=False):
         self.payload = payload
-        super().__init__(signals=signals, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock)
+        super().__init__(signals=signals, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock, event_driven=event_driven)
     async def receive(self):
         while(True):
-            await RisingEdge(self.clock)
-            await ReadOnly()
+            await self.sample()
             if self.in_reset:
-                self.log.debug(f"recv_payload in_reset true, continue... {self.bus.ready._name}")
+                self.log.debug("recv_payload in_reset true, continue... %s",self.bus.ready._name)
                 continue
             if self.bus.ready.value and self.bus.valid.value:
                 actual_payload = {k:int(p.value) for k,p in self.payload.items()}
-                self.log.debug(f"Receiving payload {self.bus.ready._name} {actual_payload}")
+                self.log.debug("Receiving payload %s %s",self.bus.ready._name,actual_payload)
                 yield actual_payload
+            elif self.event_driven and not self.bus.valid.value:
+                await self.sleep_until_rising(self.bus.valid)
 
 class ReadyValidSourceBfm(_ReadyValidBfm):
-    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns"):
-        super().__init__(signals=signals, payload=payload, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock)
+    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns", event_driven=False):
+        super().__init__(signals=signals, payload=payload, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock, event_driven=event_driven)
         self.bus.valid.setimmediatevalue(0)
     async def send(self,**kwargs):
-        self.log.debug(f"Send payload {self.bus.ready._name} {kwargs}")
+        self.log.debug("Send payload %s %s",self.bus.ready._name,kwargs)
         await self.wait_for_signal(self.bus.ready,1)
         self.bus.valid.value = 1
         for name,payload_signal in self.payload.items():
@@ -152,10 +155,10 @@ class ReadyValidSourceBfm(_ReadyValidBfm):
         self.bus.valid.value = 0
 
 class ReadyValidSinkBfm(_ReadyValidBfm):
-    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns"):
-        super().__init__(signals=signals, payload=payload, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock)
+    def __init__(self, clock, signals, payload, reset=None, reset_n=None, period=10, period_unit="ns", event_driven=False):
+        super().__init__(signals=signals, payload=payload, period=period, period_unit=period_unit, reset=reset, reset_n=reset_n, clock=clock, event_driven=event_driven)
     async def drive_ready(self,value):
-        self.log.debug(f"Drive ready {self.bus.ready._name} {value}")
+        self.log.debug("Drive ready %s %s",self.bus.ready._name,value)
         await RisingEdge(self.clock)
         self.bus.ready.value = value
 
@@ -197,8 +200,8 @@ class CoppervBusBfm(SimpleBfm):
         "dw_data", "dw_addr", "dw_strobe",
         "dw_resp_ready", "dw_resp_valid", "dw_resp",
     ])
-    def __init__(self, clock, entity = None, signals = None, reset=None, reset_n=None, period=10, period_unit="ns", prefix=None):
-        super().__init__(clock, signals=signals, entity=entity, reset=reset, reset_n=reset_n, period=period, period_unit=period_unit, prefix=prefix)
+    def __init__(self, clock, entity = None, signals = None, reset=None, reset_n=None, period=10, period_unit="ns", prefix=None, event_driven=False):
+        super().__init__(clock, signals=signals, entity=entity, reset=reset, reset_n=reset_n, period=period, period_unit=period_unit, prefix=prefix, event_driven=event_driven)
         channels = dict(
             ir_addr=(dict(addr=self.bus.ir_addr),False),
             ir_data=(dict(data=self.bus.ir_data),True),
@@ -217,8 +220,24 @@ class CoppervBusBfm(SimpleBfm):
                 ready = getattr(self.bus,f"{ch_name}_ready"),
                 valid = getattr(self.bus,f"{ch_name}_valid"),
             )
-            bfm = ReadyValidBfm(clock,signals,payload,reset_n=reset_n,init_valid=init_valid)
+            bfm = ReadyValidBfm(clock,signals,payload,reset_n=reset_n,init_valid=init_valid,event_driven=event_driven)
             setattr(self,f"{ch_name}_bfm",bfm)
+        self.channels = {ch_name:getattr(self,f"{ch_name}_bfm") for ch_name in channels}
+    @property
+    def channel_wakeups(self):
+        return {ch_name:bfm.wakeups for ch_name,bfm in self.channels.items()}
+    def sample_events(self):
+        """Return the channels that fire on this clock edge, see ``ClockSampler``."""
+        if self.in_reset:
+            return ()
+        events = []
+        for ch_name,bfm in self.channels.items():
+            if bfm.bus.ready.value and bfm.bus.valid.value:
+                events.append((ch_name,{k:int(p.value) for k,p in bfm.payload.items()}))
+        return events
+    def clear_responses(self):
+        for bfm in [self.ir_data_bfm, self.dr_data_bfm, self.dw_resp_bfm]:
+            bfm.bus.valid.value = 0
     async def ir_send_response(self,**kwargs):
         await self.ir_data_bfm.send_payload(**kwargs)
     async def ir_drive_ready(self,value):
@@ -245,7 +264,12 @@ class CoppervBusBfm(SimpleBfm):
         return self.dw_resp_bfm.recv_payload()
 
 class BusMonitor(Monitor):
-    def __init__(self,name,transaction_type,bfm_recv_req,bfm_recv_resp=None,callback=None,event=None,bus_name=None):
+    """Bus monitor, fed by BFM receive generators or by a ``ClockSampler``.
+
+    With a ``sampler``, ``bfm_recv_req`` and ``bfm_recv_resp`` are the names of
+    the sampler events for the request and response channels.
+    """
+    def __init__(self,name,transaction_type,bfm_recv_req,bfm_recv_resp=None,callback=None,event=None,bus_name=None,sampler=None):
         self.bus_name = bus_name
         if self.bus_name is None:
             self.bus_name = name
@@ -254,40 +278,93 @@ class BusMonitor(Monitor):
         self.bfm_recv_req = bfm_recv_req
         self.bfm_recv_resp = bfm_recv_resp
         self.transaction_type = transaction_type
+        self.sampler = sampler
+        self.pending_requests = deque()
+        self.dropped_responses = 0
         super().__init__(callback=callback,event=event)
+        if self.sampler is not None:
+            self.sampler.subscribe(self.bfm_recv_req,self._sampled_request)
+            if self.bfm_recv_resp is not None:
+                self.sampler.subscribe(self.bfm_recv_resp,self._sampled_response)
     async def _monitor_recv(self):
+        if self.sampler is not None:
+            return
         req_transaction = None
         resp_transaction = None
+        recv_req = self.bfm_recv_req()
+        recv_resp = self.bfm_recv_resp() if self.bfm_recv_resp is not None else None
         while True:
-            req_transaction = await anext(self.bfm_recv_req())
-            if self.bfm_recv_resp is not None:
-                resp_transaction = await anext(self.bfm_recv_resp())
-            transaction = self.transaction_type.from_reqresp(
-                bus_name = self.bus_name,
-                request = req_transaction,
-                response = resp_transaction
-            )
-            _type = "req" if self.bfm_recv_resp is None else "full"
-            if _type == "full":
-                self.log.debug(f"Receiving transaction: %s",transaction)
-            self._recv(transaction)
+            req_transaction = await anext(recv_req)
+            if recv_resp is not None:
+                resp_transaction = await anext(recv_resp)
+            self._recv_reqresp(req_transaction,resp_transaction)
+    def _recv_reqresp(self,request,response=None):
+        transaction = self.transaction_type.from_reqresp(
+            bus_name = self.bus_name,
+            request = request,
+            response = response
+        )
+        if self.bfm_recv_resp is not None:
+            self.log.debug("Receiving transaction: %s",transaction)
+        self._recv(transaction)
+    def _sampled_request(self,request):
+        if self.bfm_recv_resp is None:
+            self._recv_reqresp(request)
+        else:
+            self.pending_requests.append(request)
+    def _sampled_response(self,response):
+        if not self.pending_requests:
+            ## Its request was not seen: dropped by a reload or sent before the monitor started
+            self.log.warning("Dropping a response without request: %s",response)
+            self.dropped_responses += 1
+            return
+        self._recv_reqresp(self.pending_requests.popleft(),response)
 
 class BusSourceDriver(Driver):
-    def __init__(self,name,transaction_type,bfm_send_resp,bfm_drive_ready):
+    """Responder of a bus channel.
+
+    Besides response transactions it accepts ``"assert_ready"`` and
+    ``"deassert_ready"`` for the request ready signal and ``("wait", cycles)``
+    to delay the next response, the latter needs ``clock``.
+    """
+    def __init__(self,name,transaction_type,bfm_send_resp,bfm_drive_ready,clock=None):
         self.name = name
         self.log = SimLog(f"cocotb.{self.name}")
         self.bfm_send_resp = bfm_send_resp
         self.bfm_drive_ready = bfm_drive_ready
         self.transaction_type = transaction_type
+        self.clock = clock
+        self.ready = False
+        self.throttled = False
+        self._backpressure_thread = None
         super().__init__()
         ## reset
         self.append('assert_ready')
+    def restart(self):
+        """Drop queued and in-flight transactions and start over from reset."""
+        self.kill()
+        self.clear()
+        self._thread = cocotb.start_soon(self._send_thread())
+        self.append('assert_ready')
+    def start_backpressure(self,period,low):
+        """Deassert the request ready signal low cycles out of every period cycles."""
+        self._backpressure_thread = cocotb.start_soon(self._backpressure(period,low))
+    async def _backpressure(self,period,low):
+        cycle = 0
+        while True:
+            self.throttled = cycle < low
+            await self.bfm_drive_ready(self.ready and not self.throttled)
+            cycle = (cycle + 1) % period
     async def _driver_send(self, transaction, sync: bool = True):
         if isinstance(transaction, self.transaction_type):
             transaction = self.transaction_type.to_reqresp(transaction)
             self.log.debug("%s responding read transaction: %s", self.name, transaction)
             await self.bfm_send_resp(**transaction['response'])
+        elif isinstance(transaction, tuple) and transaction[0] == "wait":
+            await ClockCycles(self.clock,transaction[1])
         elif transaction == "assert_ready":
-            await self.bfm_drive_ready(True)
+            self.ready = True
+            await self.bfm_drive_ready(not self.throttled)
         elif transaction == "deassert_ready":
+            self.ready = False
             await self.bfm_drive_ready(False)
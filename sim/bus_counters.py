@@ -0,0 +1,148 @@
+from collections import Counter, deque
+from pathlib import Path
+import csv
+import json
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import RisingEdge, ReadOnly
+from tabulate import tabulate
+
+class ChannelCounters:
+    """Handshake counters of a valid/ready channel.
+
+    ``wait`` is the histogram of the cycles valid was held before the
+    handshake, 0 when it fires on the first cycle.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.cycles = 0
+        self.fires = 0
+        self.valid_not_ready = 0
+        self.ready_not_valid = 0
+        self.waiting = 0
+        self.wait = Counter()
+    def sample(self, valid, ready):
+        self.cycles += 1
+        if valid:
+            if ready:
+                self.fires += 1
+                self.wait[self.waiting] += 1
+                self.waiting = 0
+                return True
+            self.valid_not_ready += 1
+            self.waiting += 1
+        elif ready:
+            self.ready_not_valid += 1
+        return False
+    def results(self):
+        return dict(
+            cycles = self.cycles,
+            fires = self.fires,
+            valid_not_ready = self.valid_not_ready,
+            ready_not_valid = self.ready_not_valid,
+            utilization = round(self.fires / self.cycles,4) if self.cycles else 0,
+            wait = dict(sorted(self.wait.items())),
+        )
+
+class LatencyCounters:
+    """Request to response latency of a pair of channels, responses come in order."""
+    def __init__(self, name):
+        self.name = name
+        self.pending = deque()
+        self.latency = Counter()
+        self.peak_outstanding = 0
+    def request(self, cycle):
+        self.pending.append(cycle)
+        self.peak_outstanding = max(self.peak_outstanding,len(self.pending))
+    def response(self, cycle):
+        if self.pending:
+            self.latency[cycle - self.pending.popleft()] += 1
+    def results(self):
+        count = sum(self.latency.values())
+        return dict(
+            responses = count,
+            mean_latency = round(sum(k*v for k,v in self.latency.items()) / count,3) if count else None,
+            max_latency = max(self.latency) if count else None,
+            peak_outstanding = self.peak_outstanding,
+            latency = dict(sorted(self.latency.items())),
+        )
+
+class BusCounters:
+    """Per cycle utilization and stall counters of a group of bus channels.
+
+    ``channels`` maps a name to its ``(valid, ready)`` signals, valid may be a
+    tuple of signals that must all be set (Wishbone ``cyc`` and ``stb``).
+    ``pairs`` maps a name to the ``(request, response)`` channels whose
+    latency and outstanding requests are tracked. Samples through the
+    ``ClockSampler`` when given one.
+    """
+    def __init__(self, clock, channels, pairs=None, in_reset=None, sampler=None):
+        self.log = SimLog(f"cocotb.{type(self).__qualname__}")
+        self.clock = clock
+        self.in_reset = in_reset
+        self.signals = [(ChannelCounters(name),valid if isinstance(valid,tuple) else (valid,),ready)
+            for name,(valid,ready) in channels.items()]
+        self.channels = {counters.name:counters for counters,_,_ in self.signals}
+        self.pairs = {name:LatencyCounters(name) for name in (pairs or {})}
+        self.requests = {}
+        self.responses = {}
+        for name,(request,response) in (pairs or {}).items():
+            self.requests[request] = self.pairs[name]
+            self.responses[response] = self.pairs[name]
+        self.cycle = 0
+        self._thread = None
+        if sampler is not None:
+            sampler.bfms.append(self)
+        else:
+            self._thread = cocotb.start_soon(self._sample())
+    @classmethod
+    def from_ready_valid(cls, clock, bfms, pairs=None, **kwargs):
+        """Counters of ``ReadyValidBfm`` like objects, ``bfms`` maps names to them."""
+        channels = {name:(bfm.bus.valid,bfm.bus.ready) for name,bfm in bfms.items()}
+        return cls(clock,channels,pairs,**kwargs)
+    async def _sample(self):
+        while True:
+            await RisingEdge(self.clock)
+            await ReadOnly()
+            self.sample_events()
+    def sample_events(self):
+        self.cycle += 1
+        if self.in_reset is not None and self.in_reset():
+            return ()
+        for counters,valid,ready in self.signals:
+            fired = counters.sample(all(v.value for v in valid),bool(ready.value))
+            if fired:
+                name = counters.name
+                if name in self.requests:
+                    self.requests[name].request(self.cycle)
+                if name in self.responses:
+                    self.responses[name].response(self.cycle)
+        return ()
+    def results(self):
+        return dict(
+            channels = {name:counters.results() for name,counters in self.channels.items()},
+            pairs = {name:counters.results() for name,counters in self.pairs.items()},
+        )
+    def report(self):
+        channels = [[name,r['fires'],r['valid_not_ready'],r['ready_not_valid'],f"{100*r['utilization']:.1f}%"]
+            for name,r in self.results()['channels'].items()]
+        pairs = [[name,r['responses'],r['mean_latency'],r['max_latency'],r['peak_outstanding']]
+            for name,r in self.results()['pairs'].items()]
+        text = tabulate(channels,headers=['channel','fires','valid not ready','ready not valid','utilization'])
+        if pairs:
+            text += '\n\n' + tabulate(pairs,headers=['requests','responses','mean latency','max latency','peak outstanding'])
+        return text
+    def write(self, prefix):
+        """Write <prefix>_bus_counters.json and a CSV with one row per channel."""
+        results = self.results()
+        Path(f"{prefix}_bus_counters.json").write_text(json.dumps(results,indent=2) + '\n')
+        fields = ['channel','cycles','fires','valid_not_ready','ready_not_valid','utilization',
+            'responses','mean_latency','max_latency','peak_outstanding']
+        with Path(f"{prefix}_bus_counters.csv").open('w',newline='') as f:
+            writer = csv.DictWriter(f,fields,extrasaction='ignore')
+            writer.writeheader()
+            for name,r in results['channels'].items():
+                writer.writerow(dict(r,channel=name))
+            for name,r in results['pairs'].items():
+                writer.writerow(dict(r,channel=name))
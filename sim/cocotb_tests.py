@@ -1,19 +1,27 @@
 import logging
 import dataclasses
+import json
 import os
 from pathlib import Path
 
 import cocotb
 from cocotb.log import SimLog
+from cocotb.result import SimTimeoutError
+from cocotb.triggers import with_timeout
+from cocotb.utils import get_sim_time
 import toml
+from tabulate import tabulate
 
 from testbench import Testbench
-from riscv_utils import compile_instructions, parse_data_memory, compile_riscv_test
+from lithium_testbench import LithiumTestbench
+from riscv_utils import compile_instructions, parse_data_memory, compile_riscv_test, compile_program
 
 import pyuvm as uvm
 
 from bus import CoppervBusReadSourceBfm, CoppervBusWriteSourceBfm
-from wishbone import WishboneBfm
+from wishbone import WishboneBfm, WishboneMemory
+from memory import PagedMemory
+from bus_counters import BusCounters
 
 if os.environ.get("VS_DEBUG",False):
     import debugpy
@@ -61,10 +69,12 @@ async def run_unit_test(dut):
         expected_regfile_read=params.expected_regfile_read,
         expected_regfile_write=params.expected_regfile_write,
         instruction_memory=instruction_memory,
-        data_memory=data_memory)
+        data_memory=data_memory,
+        elf=Path('test.elf'))
     tb.bus_bfm.start_clock()
     await tb.bus_bfm.reset()
     await tb.finish()
+    tb.report()
 
 @cocotb.test(timeout_time=100,timeout_unit="us")
 async def run_riscv_test(dut):
@@ -80,17 +90,192 @@ async def run_riscv_test(dut):
         data_memory=data_memory,
         enable_self_checking=False,
         pass_fail_address = T_ADDR,
-        pass_fail_values = {T_FAIL:False,T_PASS:True})
+        pass_fail_values = {T_FAIL:False,T_PASS:True},
+        elf = Path(asm_path.stem).with_suffix('.elf'))
 
     tb.bus_bfm.start_clock()
     await tb.bus_bfm.reset()
     await tb.end_test.wait()
+    tb.log.info("BFM wakeups: %s",tb.wakeups)
+    tb.report()
 
-from wb_adapter_uvm import WbAdapterTest
+@cocotb.test()
+async def run_riscv_batch_test(dut):
+    """ RISCV compliance tests, several programs per simulation """
+    asm_paths = [Path(p) for p in os.environ['ASM_PATHS'].split(os.pathsep)]
+    program_timeout = int(os.environ.get('PROGRAM_TIMEOUT_US',100))
+    log = SimLog("cocotb.run_riscv_batch_test")
 
-@cocotb.test(timeout_time=1,timeout_unit="us")
-async def run_wishbone_adapter_test(dut):
-    """ Wishbone adapter tests """
+    tb = None
+    results = []
+    for asm_path in asm_paths:
+        instruction_memory, data_memory = compile_riscv_test(asm_path)
+        if tb is None:
+            tb = Testbench(dut,
+                asm_path.stem,
+                instruction_memory=instruction_memory,
+                data_memory=data_memory,
+                enable_self_checking=False,
+                pass_fail_address = T_ADDR,
+                pass_fail_values = {T_FAIL:False,T_PASS:True},
+                stop_on_fail = False)
+            tb.bus_bfm.start_clock()
+        else:
+            tb.reload(instruction_memory,data_memory)
+        await tb.bus_bfm.reset()
+        start = get_sim_time(tb.bus_bfm.period_unit)
+        try:
+            await with_timeout(tb.end_test.wait(),program_timeout,"us")
+        except SimTimeoutError:
+            log.error("%s timed out after %d us",asm_path.stem,program_timeout)
+        cycles = (get_sim_time(tb.bus_bfm.period_unit) - start) // tb.bus_bfm.period
+        result = "timeout" if tb.test_passed is None else "pass" if tb.test_passed else "fail"
+        log.info("%s: %s in %d cycles",asm_path.stem,result,cycles)
+        results.append(dict(name=asm_path.stem,result=result,cycles=cycles))
+
+    tb.report()
+    Path('batch_results.json').write_text(json.dumps(results,indent=2) + '\n')
+    log.info("Batch results:\n%s",tabulate(results,headers="keys"))
+    failed = [r['name'] for r in results if r['result'] != "pass"]
+    assert len(failed) == 0, f"Failed programs: {failed}"
+
+## Dhrystones per second of the VAX 11/780, the 1 MIPS reference
+VAX_DHRYSTONES = 1757
+
+def dhrystone_result(runs, timer_reads):
+    """Dhrystone figures, None when the firmware did not read the timer twice."""
+    if len(timer_reads) < 2 or timer_reads[1] <= timer_reads[0]:
+        SimLog("cocotb.dhrystone_result").warning("Expected Start_Timer and Stop_Timer reads, got %s, check TC_ADDR",timer_reads)
+        return dict(runs=runs,cycles_per_run=None,dmips_per_mhz=None)
+    ## Start_Timer and Stop_Timer are the first two timer reads
+    loop_cycles = timer_reads[1] - timer_reads[0]
+    return dict(
+        runs = runs,
+        cycles_per_run = loop_cycles / runs,
+        dmips_per_mhz = round(runs * 1e6 / (loop_cycles * VAX_DHRYSTONES),4),
+    )
+
+@cocotb.test()
+async def run_benchmark_test(dut):
+    """ Firmware benchmarks """
+    name = os.environ['BENCHMARK']
+    cflags = os.environ.get('BENCHMARK_CFLAGS','-O2')
+    runs = int(os.environ.get('DHRYSTONE_RUNS',100))
+    timeout = int(os.environ.get('BENCHMARK_TIMEOUT_MS',200))
+    log = SimLog("cocotb.run_benchmark_test")
+
+    defines = [f"NUMBER_OF_RUNS={runs}"] if name == 'dhrystone' else []
+    instruction_memory, data_memory = compile_program(sim_dir/'tests'/name,cflags,defines)
+    ## Instructions are not seen with the HDL memory, only cycles are reported
+    hdl_memory = 'hdl_memory' in cocotb.plusargs
+    tb = Testbench(dut,
+        name,
+        instruction_memory=instruction_memory,
+        data_memory=data_memory,
+        enable_self_checking=False,
+        pass_fail_address = T_ADDR,
+        pass_fail_values = {T_FAIL:False,T_PASS:True},
+        output_address = O_ADDR,
+        timer_address = TC_ADDR,
+        cycle_accounting = not hdl_memory,
+        elf = Path(name).with_suffix('.elf'))
+    instructions = 0
+    timer_reads = []
+    def count_instruction(transaction):
+        nonlocal instructions
+        instructions += 1
+    def record_timer_read(transaction):
+        if transaction.addr == TC_ADDR:
+            timer_reads.append(transaction.data)
+    tb.bus_ir_monitor.add_callback(count_instruction)
+    tb.bus_dr_monitor.add_callback(record_timer_read)
+
+    tb.bus_bfm.start_clock()
+    await tb.bus_bfm.reset()
+    start = get_sim_time(tb.bus_bfm.period_unit)
+    await with_timeout(tb.end_test.wait(),timeout,"ms")
+    cycles = (get_sim_time(tb.bus_bfm.period_unit) - start) // tb.bus_bfm.period
+
+    result = dict(
+        name = name,
+        cflags = cflags,
+        latency = cocotb.plusargs.get('latency',''),
+        cycles = cycles,
+        instructions = instructions or None,
+        cpi = round(cycles / instructions,4) if instructions else None,
+    )
+    if name == 'dhrystone':
+        result.update(dhrystone_result(runs,timer_reads))
+    tb.report()
+    if tb.cycle_accounting is not None:
+        result['classes'] = tb.cycle_accounting.results()
+    Path('benchmark_results.json').write_text(json.dumps(result,indent=2) + '\n')
+    log.info("Benchmark results:\n%s",tabulate(result.items()))
+
+@cocotb.test(timeout_time=200,timeout_unit="us")
+async def run_soc_riscv_test(dut):
+    """ RISCV compliance tests on LithiumSoC """
+    test_name = os.environ['TEST_NAME']
+    asm_path = Path(os.environ['ASM_PATH'])
+    log = SimLog("cocotb.run_soc_riscv_test")
+
+    instruction_memory, data_memory = compile_riscv_test(asm_path)
+    tb = LithiumTestbench(dut,
+        test_name,
+        instruction_memory=instruction_memory,
+        data_memory=data_memory,
+        pass_fail_address = T_ADDR,
+        pass_fail_values = {T_FAIL:False,T_PASS:True})
+    tb.start()
+    await tb.reset()
+    start = tb.cycles
+    await tb.end_test.wait()
+    cycles = tb.cycles - start
+    log.info("%s: %d cycles, %d wait states",test_name,cycles,tb.wait_states)
+    tb.report()
+    Path('soc_results.json').write_text(json.dumps(dict(name=test_name,wait_states=tb.wait_states,cycles=cycles),indent=2) + '\n')
+
+@cocotb.test()
+async def run_soc_benchmark_test(dut):
+    """ Firmware benchmarks on LithiumSoC """
+    name = os.environ['BENCHMARK']
+    cflags = os.environ.get('BENCHMARK_CFLAGS','-O2')
+    runs = int(os.environ.get('DHRYSTONE_RUNS',100))
+    timeout = int(os.environ.get('BENCHMARK_TIMEOUT_MS',200))
+    log = SimLog("cocotb.run_soc_benchmark_test")
+
+    defines = [f"NUMBER_OF_RUNS={runs}"] if name == 'dhrystone' else []
+    instruction_memory, data_memory = compile_program(sim_dir/'tests'/name,cflags,defines)
+    tb = LithiumTestbench(dut,
+        name,
+        instruction_memory=instruction_memory,
+        data_memory=data_memory,
+        pass_fail_address = T_ADDR,
+        pass_fail_values = {T_FAIL:False,T_PASS:True},
+        output_address = O_ADDR,
+        timer_address = TC_ADDR)
+    tb.start()
+    await tb.reset()
+    start = tb.cycles
+    await with_timeout(tb.end_test.wait(),timeout,"ms")
+    cycles = tb.cycles - start
+
+    result = dict(
+        name = name,
+        cflags = cflags,
+        wait_states = tb.wait_states,
+        cycles = cycles,
+        fetches = tb.wb_i_memory.reads,
+    )
+    if name == 'dhrystone':
+        result.update(dhrystone_result(runs,tb.timer_reads))
+    tb.report()
+    Path('benchmark_results.json').write_text(json.dumps(result,indent=2) + '\n')
+    log.info("Benchmark results:\n%s",tabulate(result.items()))
+
+from wb_adapter_uvm import WbAdapterTest, WbAdapterStressTest
+
+def wishbone_adapter_bfms(dut):
     wb_bfm = WishboneBfm(
         clock=dut.clock,
         reset=dut.reset,
@@ -108,9 +293,53 @@ async def run_wishbone_adapter_test(dut):
         entity=dut,
         prefix="cpu_w_ch_"
     )
+    return wb_bfm, r_bus_bfm, w_bus_bfm
+
+@cocotb.test(timeout_time=1,timeout_unit="us")
+async def run_wishbone_adapter_test(dut):
+    """ Wishbone adapter tests """
+    wb_bfm, r_bus_bfm, w_bus_bfm = wishbone_adapter_bfms(dut)
     wb_bfm.start_clock()
     await wb_bfm.reset()
+    bus_counters = None
+    if 'bus_counters' in cocotb.plusargs:
+        channels = dict(
+            r_addr = (r_bus_bfm.bus.addr_valid,r_bus_bfm.bus.addr_ready),
+            r_data = (r_bus_bfm.bus.data_valid,r_bus_bfm.bus.data_ready),
+            w_req = (w_bus_bfm.bus.req_valid,w_bus_bfm.bus.req_ready),
+            w_resp = (w_bus_bfm.bus.resp_valid,w_bus_bfm.bus.resp_ready),
+            ## Wishbone classic cycles end on ack, their wait histogram is the slave latency
+            wb = ((wb_bfm.bus.cyc,wb_bfm.bus.stb),wb_bfm.bus.ack),
+        )
+        bus_counters = BusCounters(dut.clock,channels,
+            pairs=dict(read=("r_addr","r_data"),write=("w_req","w_resp")),
+            in_reset=lambda: wb_bfm.in_reset)
     #SimLog("bfm").setLevel(logging.DEBUG)
     uvm.ConfigDB().set(None, "*", "WB_BFM", wb_bfm)
     uvm.ConfigDB().set(None, "*", "BUS_BFM", dict(read=r_bus_bfm,write=w_bus_bfm))
-    await uvm.uvm_root().run_test(WbAdapterTest,keep_singletons=True)
\ No newline at end of file
+    await uvm.uvm_root().run_test(WbAdapterTest,keep_singletons=True)
+    if bus_counters is not None:
+        SimLog("cocotb.run_wishbone_adapter_test").info("Bus counters:\n%s",bus_counters.report())
+        bus_counters.write("wishbone_adapter")
+
+@cocotb.test()
+async def run_wishbone_adapter_stress_test(dut):
+    """ Wishbone adapter random stress, +wb_stress=<items> +wb_stress_seed=<seed> """
+    wb_bfm, r_bus_bfm, w_bus_bfm = wishbone_adapter_bfms(dut)
+    wb_bfm.start_clock()
+    await wb_bfm.reset()
+    ## Responses are always accepted, the Wishbone requests are served by a memory
+    cocotb.start_soon(r_bus_bfm.data.drive_ready(1))
+    cocotb.start_soon(w_bus_bfm.resp.drive_ready(1))
+    cocotb.start_soon(WishboneMemory(wb_bfm,PagedMemory()).run())
+    items = cocotb.plusargs.get('wb_stress',True)
+    stress = dict(
+        items = 1000000 if items is True else int(items),
+        seed = int(cocotb.plusargs.get('wb_stress_seed',0)),
+        read_ratio = float(cocotb.plusargs.get('wb_stress_read_ratio',0.5)),
+    )
+    SimLog("cocotb.run_wishbone_adapter_stress_test").info("Stress %s",stress)
+    uvm.ConfigDB().set(None, "*", "WB_BFM", wb_bfm)
+    uvm.ConfigDB().set(None, "*", "BUS_BFM", dict(read=r_bus_bfm,write=w_bus_bfm))
+    uvm.ConfigDB().set(None, "*", "STRESS", stress)
+    await uvm.uvm_root().run_test(WbAdapterStressTest,keep_singletons=True)
@@ -1,11 +1,14 @@
-from collections import namedtuple
+from collections import namedtuple, defaultdict
+from pathlib import Path
+import json
 import subprocess
 
 import cocotb
 from cocotb.decorators import RunningTask
 from cocotb.log import SimLog
-from cocotb.triggers import RisingEdge, ReadOnly, NextTimeStep, FallingEdge
+from cocotb.triggers import RisingEdge, ReadOnly, NextTimeStep, FallingEdge, First
 from cocotb.clock import Clock
+from cocotb.utils import get_sim_time, get_sim_steps, get_time_from_sim_steps
 
 import typing
 import dataclasses
@@ -42,21 +45,27 @@ class Bfm:
         return dataclasses.make_dataclass(name,fields,namespace={"__contains__":contains})
 
 class SimpleBfm(Bfm):
-    def __init__(self,clock,reset=None,reset_n=None,entity=None,signals=None,period=10,period_unit="ns",prefix=None):
+    """Clocked BFM.
+
+    With ``event_driven`` set, receive loops sleep on the enable/valid signal of
+    an idle channel instead of sampling it on every clock edge. ``wakeups``
+    counts how many times the receive loops were resumed.
+    """
+    def __init__(self,clock,reset=None,reset_n=None,entity=None,signals=None,period=10,period_unit="ns",prefix=None,event_driven=False):
         self.clock = clock
         self._reset = reset
         self._reset_n = reset_n
         self.period = period
         self.period_unit = period_unit
+        self.event_driven = event_driven
+        self.wakeups = 0
         super().__init__(entity=entity,signals=signals,prefix=prefix)
     @property
     def in_reset(self):
         """Boolean flag showing whether the bus is in reset state or not."""
         if self._reset is not None:
-            self.log.debug(f"in_reset: {self._reset._name}")
             return bool(self._reset.value.integer)
         if self._reset_n is not None:
-            self.log.debug(f"in_reset: {self._reset_n._name}")
             return not bool(self._reset_n.value.integer)
         return False
     def start_clock(self):
@@ -72,14 +81,79 @@ class SimpleBfm(Bfm):
             self._reset_n.value = 0
             await RisingEdge(self.clock)
             self._reset_n.value = 1
+    async def sample(self):
+        await RisingEdge(self.clock)
+        await ReadOnly()
+        self.wakeups += 1
+    async def sleep_until_rising(self,*signals):
+        """Sleep until one of signals rises, it is sampled on the next clock edge."""
+        if len(signals) == 1:
+            await RisingEdge(signals[0])
+        else:
+            await First(*[RisingEdge(s) for s in signals])
+        self.wakeups += 1
     async def wait_for_signal(self,signal,value):
-        self.log.debug(f"wait_for_signal: {signal._name}")
+        self.log.debug("wait_for_signal: %s",signal._name)
         await ReadOnly()
         while self.in_reset or signal.value.binstr != str(value):
             await RisingEdge(self.clock)
             await ReadOnly()
         await NextTimeStep()
 
+class ClockSampler:
+    """Samples a group of BFMs once per rising clock edge.
+
+    Every BFM must provide ``sample_events()``, returning the ``(name, payload)``
+    events decoded from a single read of its signals. Events are dispatched to
+    the callbacks subscribed to their name.
+    """
+    def __init__(self,clock,bfms):
+        self.log = SimLog(f"cocotb.{type(self).__qualname__}")
+        self.clock = clock
+        self.bfms = bfms
+        self.subscribers = defaultdict(list)
+        self.wakeups = 0
+        self._thread = cocotb.start_soon(self._sample())
+    def subscribe(self,name,callback):
+        self.subscribers[name].append(callback)
+    def kill(self):
+        if self._thread:
+            self._thread.kill()
+            self._thread = None
+    async def _sample(self):
+        edge = RisingEdge(self.clock)
+        read_only = ReadOnly()
+        while True:
+            await edge
+            await read_only
+            self.wakeups += 1
+            for bfm in self.bfms:
+                for name,payload in bfm.sample_events():
+                    for callback in self.subscribers[name]:
+                        callback(payload)
+
+waves_trigger_file = 'waves_trigger.json'
+## A failure was recorded, later events are ignored
+_waves_triggered = False
+
+def record_waves_trigger(reason,period=10,period_unit="ns",failure=True):
+    """Record the time of the first failure of this run, or else of its last end of test event.
+
+    The runner uses it to dump only the cycles before it when a failing test is
+    run again with waves. In a batch the passing programs before a failure do
+    not move the window.
+    """
+    global _waves_triggered
+    if _waves_triggered:
+        return
+    _waves_triggered = failure
+    trigger = dict(
+        reason = reason,
+        time_ns = int(get_sim_time('ns')),
+        period_ns = int(get_time_from_sim_steps(get_sim_steps(period,period_unit),'ns')),
+    )
+    Path(waves_trigger_file).write_text(json.dumps(trigger) + '\n')
+
 def anext(async_generator):
     return RunningTask(async_generator.__anext__())
 
@@ -0,0 +1,92 @@
+"""Instruction commit log in the format of ``spike --log-commits``.
+
+One line per retired instruction with its register write and memory access::
+
+    core   0: 3 0x00000010 (0x00a12223) mem 0x00000004 0x00000000
+    core   0: 3 0x00000014 (0x00412503) x10 0x00000000 mem 0x00000004
+
+An instruction is complete when the next one is fetched. Lines are buffered
+and written through a gzip stream when the path ends with ``.gz``.
+"""
+from pathlib import Path
+import gzip
+
+from riscv_model import sext
+
+def load_address(insn, rs1_data, addr):
+    """Byte address of a load from rs1 and the I immediate, ``addr`` when rs1 is unknown."""
+    if rs1_data is None:
+        return addr
+    return (rs1_data + sext(insn >> 20,12)) & 0xFFFFFFFF
+
+def store_bytes(addr, data, strobe):
+    """Byte address, size and value of a store from the word address and lane shifted data and strobe."""
+    offset = (strobe & -strobe).bit_length() - 1 if strobe else 0
+    size = bin(strobe).count('1') or 4
+    value = (data >> (8*offset)) & ((1 << (8*size)) - 1)
+    return addr + offset, size, value
+
+def format_commit(pc, insn, rd=None, load_addr=None, store=None):
+    line = f"core   0: 3 0x{pc:08x} (0x{insn:08x})"
+    if rd is not None:
+        line += f" x{rd[0]:<2d} 0x{rd[1]:08x}"
+    if load_addr is not None:
+        line += f" mem 0x{load_addr:08x}"
+    if store is not None:
+        addr, size, value = store
+        line += f" mem 0x{addr:08x} 0x{value:0{2*size}x}"
+    return line
+
+class CommitTrace:
+    def __init__(self, path, capacity=4096, compresslevel=1):
+        self.path = Path(path)
+        self.capacity = capacity
+        if self.path.suffix == '.gz':
+            self.file = gzip.open(self.path,'wb',compresslevel=compresslevel)
+        else:
+            self.file = self.path.open('wb')
+        self.lines = []
+        self.pc = None
+        self.insn = 0
+        self.rd = None
+        self.rs1_data = None
+        self.load_addr = None
+        self.store_entry = None
+        self.count = 0
+    def fetch(self, pc, insn):
+        if self.pc is not None:
+            self.commit()
+        self.pc = pc
+        self.insn = insn
+    def regfile_write(self, reg, data):
+        if reg != 0:
+            self.rd = (reg,data)
+    def regfile_read(self, reg1, data1):
+        if reg1 is not None:
+            self.rs1_data = data1
+    def load(self, addr):
+        """Record a load, the byte address is computed from rs1 when it was read."""
+        self.load_addr = load_address(self.insn,self.rs1_data,addr)
+    def store(self, addr, data, strobe):
+        """Record a store from its word address and lane shifted data and strobe."""
+        self.store_entry = store_bytes(addr,data,strobe)
+    def commit(self):
+        self.lines.append(format_commit(self.pc,self.insn,self.rd,self.load_addr,self.store_entry))
+        self.count += 1
+        self.pc = self.rd = self.rs1_data = self.load_addr = self.store_entry = None
+        if len(self.lines) == self.capacity:
+            self.flush()
+    def flush(self):
+        if self.file is None or not self.lines:
+            return
+        self.file.write(('\n'.join(self.lines) + '\n').encode())
+        self.lines = []
+    def close(self):
+        """Write the instruction in flight and close the file."""
+        if self.file is None:
+            return
+        if self.pc is not None:
+            self.commit()
+        self.flush()
+        self.file.close()
+        self.file = None
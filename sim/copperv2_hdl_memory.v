@@ -0,0 +1,169 @@
+`timescale 1ns/1ps
+`include "testbench_h.v"
+`include "copperv_h.v"
+
+// Copperv2 with the memory of the copperv1 testbench, sim_crossbar in
+// tests/Icarus_simulation/fake_memory.v. Only data accesses to the MMIO
+// window reach the mmio_ bus, see Testbench(hdl_memory=True).
+module Copperv2HdlMemory #(
+    parameter MMIO_BASE = 32'h80000000,
+    parameter MMIO_MASK = 32'hFFFFFFF0
+) (
+    input clk,
+    input rst,
+    // Pulse to load +HEX_FILE again
+    input mem_load,
+    // MMIO bus, same signals as the Copperv2 bus, ir is never used
+    input mmio_ir_data_valid,
+    input mmio_ir_addr_ready,
+    input [`BUS_WIDTH-1:0] mmio_ir_data,
+    input mmio_dr_data_valid,
+    input mmio_dr_addr_ready,
+    input mmio_dw_data_addr_ready,
+    input mmio_dw_resp_valid,
+    input [`BUS_WIDTH-1:0] mmio_dr_data,
+    input [`BUS_RESP_WIDTH-1:0] mmio_dw_resp,
+    output mmio_ir_data_ready,
+    output mmio_ir_addr_valid,
+    output [`BUS_WIDTH-1:0] mmio_ir_addr,
+    output mmio_dr_data_ready,
+    output mmio_dr_addr_valid,
+    output mmio_dw_data_addr_valid,
+    output mmio_dw_resp_ready,
+    output [`BUS_WIDTH-1:0] mmio_dr_addr,
+    output [`BUS_WIDTH-1:0] mmio_dw_data,
+    output [`BUS_WIDTH-1:0] mmio_dw_addr,
+    output [(`BUS_WIDTH/8)-1:0] mmio_dw_strobe
+);
+// core bus
+wire bus_ir_data_valid;
+wire bus_ir_addr_ready;
+wire [`BUS_WIDTH-1:0] bus_ir_data;
+wire bus_dr_data_valid;
+wire bus_dr_addr_ready;
+wire bus_dw_data_addr_ready;
+wire bus_dw_resp_valid;
+wire [`BUS_WIDTH-1:0] bus_dr_data;
+wire [`BUS_RESP_WIDTH-1:0] bus_dw_resp;
+wire bus_ir_data_ready;
+wire bus_ir_addr_valid;
+wire [`BUS_WIDTH-1:0] bus_ir_addr;
+wire bus_dr_data_ready;
+wire bus_dr_addr_valid;
+wire bus_dw_data_addr_valid;
+wire bus_dw_resp_ready;
+wire [`BUS_WIDTH-1:0] bus_dr_addr;
+wire [`BUS_WIDTH-1:0] bus_dw_data;
+wire [`BUS_WIDTH-1:0] bus_dw_addr;
+wire [(`BUS_WIDTH/8)-1:0] bus_dw_strobe;
+// memory bus
+wire mem_dr_data_valid;
+wire mem_dr_addr_ready;
+wire mem_dw_data_addr_ready;
+wire mem_dw_resp_valid;
+wire [`BUS_WIDTH-1:0] mem_dr_data;
+wire [`BUS_RESP_WIDTH-1:0] mem_dw_resp;
+wire mem_dr_data_ready;
+wire mem_dr_addr_valid;
+wire mem_dw_data_addr_valid;
+wire mem_dw_resp_ready;
+
+Copperv2 core (
+    .clk(clk),
+    .rst(rst),
+    .bus_ir_data_valid(bus_ir_data_valid),
+    .bus_ir_addr_ready(bus_ir_addr_ready),
+    .bus_ir_data(bus_ir_data),
+    .bus_dr_data_valid(bus_dr_data_valid),
+    .bus_dr_addr_ready(bus_dr_addr_ready),
+    .bus_dw_data_addr_ready(bus_dw_data_addr_ready),
+    .bus_dw_resp_valid(bus_dw_resp_valid),
+    .bus_dr_data(bus_dr_data),
+    .bus_dw_resp(bus_dw_resp),
+    .bus_ir_data_ready(bus_ir_data_ready),
+    .bus_ir_addr_valid(bus_ir_addr_valid),
+    .bus_ir_addr(bus_ir_addr),
+    .bus_dr_data_ready(bus_dr_data_ready),
+    .bus_dr_addr_valid(bus_dr_addr_valid),
+    .bus_dw_data_addr_valid(bus_dw_data_addr_valid),
+    .bus_dw_resp_ready(bus_dw_resp_ready),
+    .bus_dr_addr(bus_dr_addr),
+    .bus_dw_data(bus_dw_data),
+    .bus_dw_addr(bus_dw_addr),
+    .bus_dw_strobe(bus_dw_strobe)
+);
+
+// Address decode, the response goes back through the path of its request
+wire dr_addr_mmio = (bus_dr_addr & MMIO_MASK) == MMIO_BASE;
+wire dw_addr_mmio = (bus_dw_addr & MMIO_MASK) == MMIO_BASE;
+reg dr_mmio;
+reg dw_mmio;
+always @(posedge clk) begin
+    if(!rst) begin
+        dr_mmio <= 0;
+        dw_mmio <= 0;
+    end else begin
+        if(bus_dr_addr_valid && bus_dr_addr_ready)
+            dr_mmio <= dr_addr_mmio;
+        if(bus_dw_data_addr_valid && bus_dw_data_addr_ready)
+            dw_mmio <= dw_addr_mmio;
+    end
+end
+
+assign mmio_ir_data_ready = 0;
+assign mmio_ir_addr_valid = 0;
+assign mmio_ir_addr = 0;
+
+assign mmio_dr_addr_valid = bus_dr_addr_valid && dr_addr_mmio;
+assign mmio_dr_addr = bus_dr_addr;
+assign mem_dr_addr_valid = bus_dr_addr_valid && !dr_addr_mmio;
+assign bus_dr_addr_ready = dr_addr_mmio ? mmio_dr_addr_ready : mem_dr_addr_ready;
+assign mmio_dr_data_ready = bus_dr_data_ready && dr_mmio;
+assign mem_dr_data_ready = bus_dr_data_ready && !dr_mmio;
+assign bus_dr_data_valid = dr_mmio ? mmio_dr_data_valid : mem_dr_data_valid;
+assign bus_dr_data = dr_mmio ? mmio_dr_data : mem_dr_data;
+
+assign mmio_dw_data_addr_valid = bus_dw_data_addr_valid && dw_addr_mmio;
+assign mmio_dw_data = bus_dw_data;
+assign mmio_dw_addr = bus_dw_addr;
+assign mmio_dw_strobe = bus_dw_strobe;
+assign mem_dw_data_addr_valid = bus_dw_data_addr_valid && !dw_addr_mmio;
+assign bus_dw_data_addr_ready = dw_addr_mmio ? mmio_dw_data_addr_ready : mem_dw_data_addr_ready;
+assign mmio_dw_resp_ready = bus_dw_resp_ready && dw_mmio;
+assign mem_dw_resp_ready = bus_dw_resp_ready && !dw_mmio;
+assign bus_dw_resp_valid = dw_mmio ? mmio_dw_resp_valid : mem_dw_resp_valid;
+assign bus_dw_resp = dw_mmio ? mmio_dw_resp : mem_dw_resp;
+
+sim_crossbar u_xbar (
+    .clk(clk),
+    .rst(rst),
+    .dr_data_valid(mem_dr_data_valid),
+    .dr_addr_ready(mem_dr_addr_ready),
+    .dw_data_addr_ready(mem_dw_data_addr_ready),
+    .dw_resp_valid(mem_dw_resp_valid),
+    .dr_data(mem_dr_data),
+    .ir_data_valid(bus_ir_data_valid),
+    .ir_addr_ready(bus_ir_addr_ready),
+    .ir_data(bus_ir_data),
+    .dw_resp(mem_dw_resp),
+    .dr_data_ready(mem_dr_data_ready),
+    .dr_addr_valid(mem_dr_addr_valid),
+    .dw_data_addr_valid(mem_dw_data_addr_valid),
+    .dw_resp_ready(mem_dw_resp_ready),
+    .dr_addr(bus_dr_addr),
+    .dw_data(bus_dw_data),
+    .dw_addr(bus_dw_addr),
+    .dw_strobe(bus_dw_strobe),
+    .ir_data_ready(bus_ir_data_ready),
+    .ir_addr_valid(bus_ir_addr_valid),
+    .ir_addr(bus_ir_addr)
+);
+
+`STRING hex_file;
+initial begin
+    if (!$value$plusargs("HEX_FILE=%s", hex_file))
+        hex_file = "memory.hex";
+end
+always @(posedge mem_load)
+    $readmemh(hex_file, u_xbar.u_mem.memory);
+endmodule
@@ -0,0 +1,111 @@
+from collections import Counter
+
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import RisingEdge, ReadOnly
+from tabulate import tabulate
+
+## control.state encoding, State in src/main/scala/copperv2/util.scala
+states = ['RESET','IDLE','FETCH','DECODE','EXEC','MEM','COMMIT']
+FETCH = states.index('FETCH')
+MEM = states.index('MEM')
+
+opcode_classes = {
+    0x37: 'alu',
+    0x17: 'alu',
+    0x13: 'alu',
+    0x33: 'alu',
+    0x03: 'load',
+    0x23: 'store',
+    0x63: 'branch',
+    0x6F: 'jump',
+    0x67: 'jump',
+}
+classes = ['alu','load','store','branch','jump','other']
+
+def instruction_class(instruction):
+    return opcode_classes.get(instruction & 0x7F,'other')
+
+class CycleAccounting:
+    """Attribute every clock cycle to a state of the core FSM and an instruction class.
+
+    An instruction starts when the FSM enters FETCH and owns every cycle until
+    the next one starts, its class comes from the word fetched on ``ir``.
+    Cycles spent in FETCH and MEM beyond the first are counted as fetch and
+    memory stalls. Cycles before the first fetch are attributed to ``reset``.
+    """
+    def __init__(self, clock, state, ir_monitor, sampler=None):
+        self.log = SimLog(f"cocotb.{type(self).__qualname__}")
+        self.clock = clock
+        self.state = state
+        self.cycles = {name:[0]*len(states) for name in ['reset',*classes]}
+        self.instructions = Counter()
+        self.current = [0]*len(states)
+        self.started = False
+        self.fetched_class = None
+        self.last_state = None
+        ir_monitor.add_callback(self._fetched)
+        self._thread = None
+        if sampler is not None:
+            sampler.bfms.append(self)
+        else:
+            self._thread = cocotb.start_soon(self._sample())
+    def _fetched(self, transaction):
+        self.fetched_class = instruction_class(transaction.data)
+    async def _sample(self):
+        while True:
+            await RisingEdge(self.clock)
+            await ReadOnly()
+            self.sample_events()
+    def sample_events(self):
+        value = self.state.value
+        state = value.integer if value.is_resolvable else 0
+        if state == FETCH and self.last_state != FETCH:
+            self._retire()
+        self.current[state] += 1
+        self.last_state = state
+        return ()
+    def _retire(self):
+        name = 'reset'
+        if self.started:
+            name = self.fetched_class or 'other'
+            self.instructions[name] += 1
+        cycles = self.cycles[name]
+        for i,count in enumerate(self.current):
+            cycles[i] += count
+        self.current = [0]*len(states)
+        self.fetched_class = None
+        self.started = True
+    def finish(self):
+        """Account the instruction in flight, it is counted as retired."""
+        if any(self.current):
+            self._retire()
+        self.started = False
+    def results(self):
+        results = {}
+        for name,cycles in self.cycles.items():
+            total = sum(cycles)
+            if total == 0:
+                continue
+            instructions = self.instructions[name]
+            results[name] = dict(
+                instructions = instructions,
+                cycles = total,
+                cpi = round(total / instructions,3) if instructions else None,
+                states = {state:count for state,count in zip(states,cycles) if count},
+                fetch_stall = max(0,cycles[FETCH] - instructions),
+                mem_stall = max(0,cycles[MEM] - instructions) if name in ('load','store') else 0,
+            )
+        return results
+    def report(self):
+        results = self.results()
+        total_cycles = sum(r['cycles'] for r in results.values())
+        histogram = [[name,r['instructions'],r['cycles'],r['cpi'],*[r['states'].get(s,0) for s in states]]
+            for name,r in results.items()]
+        stalls = [[name,r['fetch_stall'],r['mem_stall'],f"{100*(r['fetch_stall']+r['mem_stall'])/total_cycles:.1f}%"]
+            for name,r in results.items() if name != 'reset']
+        return "\n".join([
+            tabulate(histogram,headers=['class','instructions','cycles','cpi',*states]),
+            "",
+            tabulate(stalls,headers=['class','fetch stall','mem stall','of all cycles']),
+        ])
@@ -0,0 +1,63 @@
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+import mmap
+import struct
+
+from memory import PagedMemory
+
+## ELF32 little endian, the only format of rv32 programs
+elf_header = struct.Struct('<16sHHIIIIIHHHHHH')
+program_header = struct.Struct('<IIIIIIII')
+PT_LOAD = 1
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+@dataclass
+class Segment:
+    """Loadable segment, ``data`` is a view of the file, zeros follow up to ``memsz``."""
+    addr: int
+    data: memoryview
+    memsz: int
+    flags: int
+
+def iter_segments(image):
+    """Yield the PT_LOAD segments of an ELF32 image, any bytes-like object.
+
+    The data of every segment is a slice of the image, nothing is copied.
+    Release the slices before closing a mapped image.
+    """
+    with memoryview(image).cast('B') as view:
+        if len(view) < elf_header.size or bytes(view[:4]) != b'\x7fELF':
+            raise ValueError("Not an ELF file")
+        if view[4] != 1 or view[5] != 1:
+            raise ValueError("Only little endian ELF32 files are supported")
+        header = elf_header.unpack_from(view)
+        phoff, phentsize, phnum = header[5], header[9], header[10]
+        for i in range(phnum):
+            p_type, offset, vaddr, _, filesz, memsz, flags, _ = program_header.unpack_from(view,phoff + i*phentsize)
+            if p_type != PT_LOAD or memsz == 0:
+                continue
+            if offset + filesz > len(view):
+                raise ValueError(f"Segment at 0x{vaddr:X} ends past the end of the file")
+            yield Segment(vaddr,view[offset:offset+filesz],memsz,flags)
+
+def load_elf(elf_path):
+    """Load the segments of an ELF, return the instruction and data memories.
+
+    Executable segments go to the instruction memory. The file is mapped and
+    every segment is copied once, straight into the memory pages.
+    """
+    instruction_memory = PagedMemory()
+    data_memory = PagedMemory()
+    with Path(elf_path).open('rb') as file, mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) as image, \
+            closing(iter_segments(image)) as segments:
+        for segment in segments:
+            memory = instruction_memory if segment.flags & PF_X else data_memory
+            with segment.data as data:
+                memory.load(segment.addr,data)
+                filesz = len(data)
+            if segment.memsz > filesz:
+                memory.zero(segment.addr + filesz,segment.memsz - filesz)
+    return instruction_memory, data_memory
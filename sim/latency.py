@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+import random
+import re
+
+channels = ['ir','dr','dw']
+rule_regex = re.compile(r'^(?P<channel>\w+)(\[(?P<start>\w+):(?P<end>\w+)\])?=(?P<kind>\w+):(?P<args>[\w/-]+)$')
+
+@dataclass
+class LatencyRule:
+    channel: str
+    kind: str
+    args: tuple
+    start: int = None
+    end: int = None
+    def matches(self, channel, addr):
+        if channel != self.channel:
+            return False
+        return self.start is None or self.start <= addr < self.end
+
+class LatencyModel:
+    """Response latency and request back-pressure of the memory, per channel.
+
+    The spec is a comma separated list of ``<channel>[<start>:<end>]=<kind>:<args>``
+    rules, the address range is optional and end exclusive:
+
+    - ``fixed:N``: respond N cycles after the request.
+    - ``random:MIN-MAX``: uniformly distributed latency, repeatable with ``seed``.
+    - ``ready:PERIOD/LOW``: deassert the request ready signal LOW cycles every
+      PERIOD cycles, it does not depend on the address.
+
+    Later rules take precedence, e.g. ``dr=fixed:2,dr[0x80000000:0x80000010]=fixed:20``.
+    """
+    def __init__(self, rules=(), seed=0):
+        self.rules = list(rules)
+        self.random = random.Random(seed)
+        self.cache = {}
+    @classmethod
+    def parse(cls, spec, seed=0):
+        rules = []
+        for text in spec.split(','):
+            text = text.strip()
+            if not text:
+                continue
+            m = rule_regex.match(text)
+            if m is None:
+                raise ValueError(f"Invalid latency rule {text!r}")
+            channel, kind, args = m.group('channel'), m.group('kind'), m.group('args')
+            if channel not in channels:
+                raise ValueError(f"Unknown channel {channel!r} in latency rule {text!r}, expected one of {channels}")
+            if kind == 'fixed':
+                args = (int(args,0),)
+            elif kind == 'random':
+                low, high = args.split('-')
+                args = (int(low,0),int(high,0))
+            elif kind == 'ready':
+                period, low = args.split('/')
+                args = (int(period,0),int(low,0))
+                if not 0 < args[1] < args[0]:
+                    raise ValueError(f"Ready low cycles must be between 0 and the period in {text!r}")
+            else:
+                raise ValueError(f"Unknown latency kind {kind!r} in {text!r}")
+            start = end = None
+            if m.group('start') is not None:
+                if kind == 'ready':
+                    raise ValueError(f"Ready back-pressure has no address range in {text!r}")
+                start, end = int(m.group('start'),0), int(m.group('end'),0)
+            rules.append(LatencyRule(channel,kind,args,start,end))
+        return cls(rules,seed)
+    def _rule(self, channel, addr):
+        key = (channel,addr)
+        if key not in self.cache:
+            rule = None
+            for candidate in self.rules:
+                if candidate.kind != 'ready' and candidate.matches(channel,addr):
+                    rule = candidate
+            self.cache[key] = rule
+        return self.cache[key]
+    def delay(self, channel, addr):
+        """Cycles to wait before responding to a request to addr."""
+        rule = self._rule(channel,addr)
+        if rule is None:
+            return 0
+        if rule.kind == 'fixed':
+            return rule.args[0]
+        return self.random.randint(*rule.args)
+    def backpressure(self, channel):
+        """Return the (period, low) ready deassertion of channel or None."""
+        for rule in reversed(self.rules):
+            if rule.kind == 'ready' and rule.channel == channel:
+                return rule.args
+        return None
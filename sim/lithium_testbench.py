@@ -0,0 +1,98 @@
+import cocotb
+from cocotb.log import SimLog
+from cocotb.triggers import Event
+from cocotb.utils import get_sim_time, get_sim_steps
+from tabulate import tabulate
+
+from cocotb_utils import record_waves_trigger
+from wishbone import WishboneBfm, WishboneMemory
+
+class LithiumTestbench():
+    """Runs programs on ``LithiumSoC``, wb_i and wb_d are served from one memory.
+
+    The data port also serves the MMIO window of the tests: pass/fail, fake
+    UART output and the cycle counter. Every ack is delayed by ``wait_states``
+    cycles, ``+wb_wait_states=<n>`` by default.
+    """
+    def __init__(self, dut,
+            test_name,
+            instruction_memory,
+            data_memory,
+            pass_fail_address = None,
+            pass_fail_values = None,
+            output_address = None,
+            timer_address = None,
+            stop_on_fail = True,
+            wait_states = None,
+        ):
+        self.log = SimLog('cocotb.'+__name__+'.'+self.__class__.__name__)
+        self.test_name = test_name
+        self.dut = dut
+        self.clock = self.dut.clock
+        if wait_states is None:
+            wait_states = int(cocotb.plusargs.get('wb_wait_states',0))
+        self.wait_states = wait_states
+        self.pass_fail_address = pass_fail_address
+        self.pass_fail_values = pass_fail_values
+        self.output_address = output_address
+        self.timer_address = timer_address
+        self.stop_on_fail = stop_on_fail
+        self.test_passed = None
+        self.fake_uart = []
+        self.timer_reads = []
+        self.end_test = Event()
+        self.memory = instruction_memory.copy()
+        self.memory.update(data_memory)
+        self.wb_i_bfm = WishboneBfm(self.clock,entity=self.dut,reset=self.dut.reset,prefix="wb_i_")
+        self.wb_d_bfm = WishboneBfm(self.clock,entity=self.dut,reset=self.dut.reset,prefix="wb_d_")
+        self.period = self.wb_i_bfm.period
+        self.period_unit = self.wb_i_bfm.period_unit
+        mmio = {}
+        if pass_fail_address is not None:
+            mmio[pass_fail_address] = self.pass_fail
+        if output_address is not None:
+            mmio[output_address] = self.output
+        if timer_address is not None:
+            mmio[timer_address] = self.timer
+        self.wb_i_memory = WishboneMemory(self.wb_i_bfm,self.memory,wait_states)
+        self.wb_d_memory = WishboneMemory(self.wb_d_bfm,self.memory,wait_states,mmio)
+    @property
+    def cycles(self):
+        return get_sim_time() // get_sim_steps(self.period,self.period_unit)
+    def start(self):
+        """Start the clock and the memory of both ports."""
+        self.wb_i_bfm.start_clock()
+        cocotb.start_soon(self.wb_i_memory.run())
+        cocotb.start_soon(self.wb_d_memory.run())
+    async def reset(self):
+        await self.wb_i_bfm.reset()
+    def pass_fail(self, request):
+        if 'data' not in request:
+            return 0
+        if len(self.fake_uart) > 0:
+            self.log.info("Fake UART output:\n%s",''.join(self.fake_uart))
+        passed = self.pass_fail_values[request['data']]
+        record_waves_trigger("pass_fail_write",self.period,self.period_unit,failure=not passed)
+        if self.stop_on_fail:
+            assert passed == True, "Received test fail from bus"
+        self.log.debug("Received test %s from bus","pass" if passed else "fail")
+        self.test_passed = passed
+        self.end_test.set()
+    def output(self, request):
+        if 'data' not in request:
+            return 0
+        recv = chr(request['data'] & 0xFF)
+        self.fake_uart.append(recv)
+        self.log.info('Fake UART received: %s',repr(recv))
+    def timer(self, request):
+        ## No per clock timer coroutine, the cycle count comes from the simulation time
+        if 'data' in request:
+            return None
+        value = self.cycles
+        self.timer_reads.append(value)
+        return value
+    def report(self):
+        """Log the accesses served by each port."""
+        ports = [[name,memory.reads,memory.writes] for name,memory in [('wb_i',self.wb_i_memory),('wb_d',self.wb_d_memory)]]
+        self.log.info("Wishbone memory, %d wait states:\n%s",self.wait_states,
+            tabulate(ports,headers=['port','reads','writes']))
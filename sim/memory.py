@@ -0,0 +1,140 @@
+import re
+import struct
+
+class PagedMemory:
+    """Sparse byte addressable memory backed by fixed size ``bytearray`` pages.
+
+    Pages are allocated on first write; reads from unallocated pages return zero.
+    Each page has a mask of the bytes written, zeros included, for ``update``.
+    """
+    page_bits = 12
+    page_size = 1 << page_bits
+    page_mask = page_size - 1
+    _word = struct.Struct('<I')
+    _written_runs = re.compile(b'\x01+')
+    def __init__(self, page_bits=None):
+        if page_bits is not None:
+            self.page_bits = page_bits
+            self.page_size = 1 << page_bits
+            self.page_mask = self.page_size - 1
+        self.pages = {}
+        self.written = {}
+        self.high_address = None
+    def __len__(self):
+        return len(self.pages) * self.page_size
+    def __contains__(self, addr):
+        return (addr >> self.page_bits) in self.pages
+    def _page(self, page_number):
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.pages[page_number] = bytearray(self.page_size)
+            self.written[page_number] = bytearray(self.page_size)
+        return page
+    def _touch(self, last_addr):
+        if self.high_address is None or last_addr > self.high_address:
+            self.high_address = last_addr
+    def read_word(self, addr):
+        offset = addr & self.page_mask
+        if offset <= self.page_size - 4:
+            page = self.pages.get(addr >> self.page_bits)
+            if page is None:
+                return 0
+            return self._word.unpack_from(page, offset)[0]
+        return int.from_bytes(self.peek(addr, 4), byteorder='little')
+    def write_word(self, addr, data, strobe=0xF):
+        """Write the bytes of ``data`` selected by the 4 bit ``strobe`` mask."""
+        offset = addr & self.page_mask
+        if strobe == 0xF and offset <= self.page_size - 4:
+            self._word.pack_into(self._page(addr >> self.page_bits), offset, data & 0xFFFFFFFF)
+            self.written[addr >> self.page_bits][offset:offset+4] = b'\x01\x01\x01\x01'
+            self._touch(addr + 3)
+            return
+        for i in range(4):
+            if (strobe >> i) & 1:
+                self.poke(addr + i, (data >> (8 * i)) & 0xFF)
+    def peek(self, addr, size=1):
+        """Return ``size`` bytes starting at ``addr``."""
+        buf = bytearray(size)
+        pos = 0
+        while pos < size:
+            offset = (addr + pos) & self.page_mask
+            chunk = min(size - pos, self.page_size - offset)
+            page = self.pages.get((addr + pos) >> self.page_bits)
+            if page is not None:
+                buf[pos:pos+chunk] = page[offset:offset+chunk]
+            pos += chunk
+        return bytes(buf)
+    def poke(self, addr, value):
+        self._page(addr >> self.page_bits)[addr & self.page_mask] = value
+        self.written[addr >> self.page_bits][addr & self.page_mask] = 1
+        self._touch(addr)
+    def load(self, addr, data):
+        """Copy a bytes-like object into memory starting at ``addr``."""
+        view = memoryview(data).cast('B')
+        size = len(view)
+        pos = 0
+        while pos < size:
+            offset = (addr + pos) & self.page_mask
+            chunk = min(size - pos, self.page_size - offset)
+            self._page((addr + pos) >> self.page_bits)[offset:offset+chunk] = view[pos:pos+chunk]
+            self.written[(addr + pos) >> self.page_bits][offset:offset+chunk] = b'\x01' * chunk
+            pos += chunk
+        if size > 0:
+            self._touch(addr + size - 1)
+    def zero(self, addr, size):
+        """Clear ``size`` bytes starting at ``addr``, allocating their pages."""
+        pos = 0
+        while pos < size:
+            offset = (addr + pos) & self.page_mask
+            chunk = min(size - pos, self.page_size - offset)
+            page = self._page((addr + pos) >> self.page_bits)
+            page[offset:offset+chunk] = bytes(chunk)
+            self.written[(addr + pos) >> self.page_bits][offset:offset+chunk] = b'\x01' * chunk
+            pos += chunk
+        if size > 0:
+            self._touch(addr + size - 1)
+    def update(self, other):
+        """Overlay another ``PagedMemory`` on this one, every byte written in ``other`` wins.
+
+        Pages only present in ``other`` are copied whole, pages present in both
+        are merged run by run of written bytes so disjoint images sharing a page
+        are kept.
+        """
+        for page_number, page in other.pages.items():
+            written = other.written[page_number]
+            if other.page_bits == self.page_bits and page_number not in self.pages:
+                self.pages[page_number] = bytearray(page)
+                self.written[page_number] = bytearray(written)
+                continue
+            base = page_number << other.page_bits
+            for run in self._written_runs.finditer(written):
+                self.load(base + run.start(), page[run.start():run.end()])
+        if other.high_address is not None:
+            self._touch(other.high_address)
+    def copy(self):
+        new = PagedMemory(self.page_bits)
+        new.update(self)
+        return new
+    def items(self):
+        """Iterate over ``(address, byte)`` pairs of every non-zero byte."""
+        for page_number in sorted(self.pages):
+            base = page_number << self.page_bits
+            page = self.pages[page_number]
+            for offset, value in enumerate(page):
+                if value:
+                    yield base + offset, value
+    def write_verilog_hex(self, path, columns=16):
+        """Write the allocated pages as a ``$readmemh`` byte image.
+
+        Whole pages are written, loading the image over a previous program
+        also clears the bytes it left in those pages.
+        """
+        with open(path, 'w') as f:
+            last_page = None
+            for page_number in sorted(self.pages):
+                if last_page is None or page_number != last_page + 1:
+                    f.write(f'@{page_number << self.page_bits:X}\n')
+                page = self.pages[page_number]
+                for offset in range(0, self.page_size, columns):
+                    f.write(page[offset:offset+columns].hex(' ') + '\n')
+                last_page = page_number
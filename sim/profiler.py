@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from collections import Counter
+from pathlib import Path
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.constants import SH_FLAGS
+from tabulate import tabulate
+
+unknown_symbol = '??'
+
+class SymbolTable:
+    """Map addresses to the code symbols of an ELF.
+
+    ``symbols`` are ``(addr, size, name)`` tuples, a symbol without size
+    extends up to the next one.
+    """
+    def __init__(self, symbols):
+        self.symbols = sorted(symbols)
+        self.starts = [addr for addr,_,_ in self.symbols]
+        self.cache = {}
+    @classmethod
+    def from_elf(cls, elf_path):
+        symbols = {}
+        with Path(elf_path).open('rb') as file:
+            elffile = ELFFile(file)
+            symtab = elffile.get_section_by_name('.symtab')
+            if symtab is None:
+                return cls([])
+            code_sections = {i for i,section in enumerate(elffile.iter_sections())
+                if section['sh_flags'] & SH_FLAGS.SHF_EXECINSTR}
+            for symbol in symtab.iter_symbols():
+                kind = symbol['st_info']['type']
+                if kind not in ('STT_FUNC','STT_NOTYPE') or not symbol.name or symbol.name.startswith(('.L','$')):
+                    continue
+                if symbol['st_shndx'] not in code_sections:
+                    continue
+                addr = symbol['st_value']
+                ## Functions win over plain labels at the same address
+                if addr not in symbols or kind == 'STT_FUNC':
+                    symbols[addr] = (addr,symbol['st_size'],symbol.name)
+        return cls(symbols.values())
+    def lookup(self, addr):
+        name = self.cache.get(addr)
+        if name is None:
+            name = unknown_symbol
+            i = bisect_right(self.starts,addr) - 1
+            if i >= 0:
+                start, size, symbol = self.symbols[i]
+                if size == 0 or addr < start + size:
+                    name = symbol
+            self.cache[addr] = name
+        return name
+
+class Profiler:
+    """Cycle profile of the fetched instructions by function and call stack.
+
+    Each fetch owns the cycles up to the next fetch. A shadow call stack is
+    kept from the ``jal``/``jalr`` instructions that link ``ra`` or ``t0``
+    (calls) and ``jalr x0, 0(ra)`` (returns). Cycles are accumulated per
+    stack, flat and inclusive counts are derived from them.
+    """
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.stacks = Counter()
+        self.stack = ()
+        self.return_addresses = []
+        self.last_cycle = None
+        self.last_kind = None
+        self.last_pc = None
+    def fetch(self, pc, instruction, cycle):
+        if self.last_cycle is not None:
+            self.stacks[self.stack] += cycle - self.last_cycle
+        self.last_cycle = cycle
+        function = self.symbols.lookup(pc)
+        if self.last_kind == 'call':
+            self.stack = self.stack + (function,)
+            self.return_addresses.append(self.last_pc + 4)
+        elif self.last_kind == 'return' and pc in self.return_addresses:
+            depth = len(self.return_addresses) - self.return_addresses[::-1].index(pc) - 1
+            del self.return_addresses[depth:]
+            self.stack = self.stack[:depth + 1]
+        if not self.stack:
+            self.stack = (function,)
+        elif self.stack[-1] != function:
+            ## Tail call, jump or fall through into another symbol
+            self.stack = self.stack[:-1] + (function,)
+        self.last_kind = self.classify(instruction)
+        self.last_pc = pc
+    @staticmethod
+    def classify(instruction):
+        opcode = instruction & 0x7F
+        rd = (instruction >> 7) & 0x1F
+        if opcode == 0x6F or opcode == 0x67:
+            if rd in (1,5):
+                return 'call'
+            rs1 = (instruction >> 15) & 0x1F
+            if opcode == 0x67 and rd == 0 and rs1 in (1,5):
+                return 'return'
+        return None
+    def flat(self):
+        flat = Counter()
+        for stack,cycles in self.stacks.items():
+            flat[stack[-1]] += cycles
+        return flat
+    def inclusive(self):
+        inclusive = Counter()
+        for stack,cycles in self.stacks.items():
+            for function in set(stack):
+                inclusive[function] += cycles
+        return inclusive
+    def folded(self):
+        """Folded stacks, the input format of flamegraph.pl and speedscope."""
+        return ''.join(f"{';'.join(stack)} {cycles}\n" for stack,cycles in sorted(self.stacks.items()) if cycles)
+    def report(self, top=20):
+        total = sum(self.stacks.values()) or 1
+        inclusive = self.inclusive()
+        rows = [[function,cycles,f"{100*cycles/total:.1f}%",inclusive[function],f"{100*inclusive[function]/total:.1f}%"]
+            for function,cycles in self.flat().most_common(top)]
+        return tabulate(rows,headers=['function','self','self %','inclusive','inclusive %'])
+    def results(self):
+        return dict(flat=dict(self.flat()),inclusive=dict(self.inclusive()))
@@ -71,28 +71,58 @@ class RegFileBfm(SimpleBfm):
         "rs2_addr",
         "rs2_data",
     ])
-    def __init__(self, clock, entity=None,signals=None, reset=None, reset_n=None, period=10, period_unit="ns"):
-        super().__init__(clock, entity=entity, signals=signals, reset=reset, reset_n=reset_n, period=period, period_unit=period_unit)
+    def __init__(self, clock, entity=None,signals=None, reset=None, reset_n=None, period=10, period_unit="ns", event_driven=False):
+        super().__init__(clock, entity=entity, signals=signals, reset=reset, reset_n=reset_n, period=period, period_unit=period_unit, event_driven=event_driven)
+        self._rs_pending = None
+    def sample_events(self):
+        """Return the register file accesses seen on this clock edge, see ``ClockSampler``.
+
+        Like ``recv_rs``, read data is sampled one clock edge after the enables.
+        """
+        events = []
+        if self.bus.rd_en.value:
+            events.append(('rd',dict(
+                addr = int(self.bus.rd_addr.value),
+                data = int(self.bus.rd_data.value)
+            )))
+        if self._rs_pending is not None:
+            en1, en2 = self._rs_pending
+            self._rs_pending = None
+            buf = {}
+            if en1:
+                buf['addr'] = int(self.bus.rs1_addr.value)
+                buf['data'] = int(self.bus.rs1_data.value)
+            if en2:
+                buf['addr2'] = int(self.bus.rs2_addr.value)
+                buf['data2'] = int(self.bus.rs2_data.value)
+            events.append(('rs',buf))
+        else:
+            en1 = bool(self.bus.rs1_en.value)
+            en2 = bool(self.bus.rs2_en.value)
+            if en1 or en2:
+                self._rs_pending = (en1,en2)
+        return events
     async def recv_rd(self):
         while(True):
-            await RisingEdge(self.clock)
-            await ReadOnly()
+            await self.sample()
             if self.bus.rd_en.value:
                 yield dict(
                     addr = int(self.bus.rd_addr.value),
                     data = int(self.bus.rd_data.value)
                 )
+            elif self.event_driven:
+                await self.sleep_until_rising(self.bus.rd_en)
     async def recv_rs(self):
         while(True):
             buf = {}
-            await RisingEdge(self.clock)
-            await ReadOnly()
+            await self.sample()
             en1 = self.bus.rs1_en.value
             en2 = self.bus.rs2_en.value
             if (not en1) and (not en2):
+                if self.event_driven:
+                    await self.sleep_until_rising(self.bus.rs1_en,self.bus.rs2_en)
                 continue
-            await RisingEdge(self.clock)
-            await ReadOnly()
+            await self.sample()
             if en1:
                 buf['addr'] = int(self.bus.rs1_addr.value)
                 buf['data'] = int(self.bus.rs1_data.value)
@@ -102,47 +132,61 @@ class RegFileBfm(SimpleBfm):
             yield buf
 
 class RegFileWriteMonitor(Monitor):
-    def __init__(self,name,bfm,callback=None,event=None):
+    def __init__(self,name,bfm,callback=None,event=None,sampler=None):
         self.name = name
         self.log = SimLog(f"cocotb.{self.name}")
         self.bfm = bfm
+        self.sampler = sampler
         super().__init__(callback=callback,event=event)
+        if self.sampler is not None:
+            self.sampler.subscribe('rd',self._recv_rd)
     async def _monitor_recv(self):
+        if self.sampler is not None:
+            return
+        recv_rd = self.bfm.recv_rd()
         while True:
-            received = await anext(self.bfm.recv_rd())
-            transaction = RegFileWriteTransaction(
-                reg = received['addr'],
-                data = received['data'],
-            )
-            self.log.debug("Regfile write: %s", transaction)
-            self._recv(transaction)
+            self._recv_rd(await anext(recv_rd))
+    def _recv_rd(self,received):
+        transaction = RegFileWriteTransaction(
+            reg = received['addr'],
+            data = received['data'],
+        )
+        self.log.debug("Regfile write: %s", transaction)
+        self._recv(transaction)
 
 class RegFileReadMonitor(Monitor):
-    def __init__(self,name,bfm,callback=None,event=None):
+    def __init__(self,name,bfm,callback=None,event=None,sampler=None):
         self.name = name
         self.log = SimLog(f"cocotb.{self.name}")
         self.bfm = bfm
+        self.sampler = sampler
         super().__init__(callback=callback,event=event)
+        if self.sampler is not None:
+            self.sampler.subscribe('rs',self._recv_rs)
     async def _monitor_recv(self):
+        if self.sampler is not None:
+            return
+        recv_rs = self.bfm.recv_rs()
         while True:
-            transaction = None
-            received = await anext(self.bfm.recv_rs())
-            if len(received) == 4:
-                transaction = RegFileReadTransaction(
-                    reg1 = int(received['addr']),
-                    data1 = int(received['data']),
-                    reg2 = int(received['addr2']),
-                    data2 = int(received['data2']),
-                )
-            elif 'addr' in received:
-                transaction = RegFileReadTransaction(
-                    reg1 = int(received['addr']),
-                    data1 = int(received['data']),
-                )
-            elif 'addr2' in received:
-                transaction = RegFileReadTransaction(
-                    reg1 = int(received['addr2']),
-                    data1 = int(received['data2']),
-                )
-            self.log.debug('Regfile read: %s',transaction)
-            self._recv(transaction)
+            self._recv_rs(await anext(recv_rs))
+    def _recv_rs(self,received):
+        transaction = None
+        if len(received) == 4:
+            transaction = RegFileReadTransaction(
+                reg1 = int(received['addr']),
+                data1 = int(received['data']),
+                reg2 = int(received['addr2']),
+                data2 = int(received['data2']),
+            )
+        elif 'addr' in received:
+            transaction = RegFileReadTransaction(
+                reg1 = int(received['addr']),
+                data1 = int(received['data']),
+            )
+        elif 'addr2' in received:
+            transaction = RegFileReadTransaction(
+                reg1 = int(received['addr2']),
+                data1 = int(received['data2']),
+            )
+        self.log.debug('Regfile read: %s',transaction)
+        self._recv(transaction)
@@ -0,0 +1,231 @@
+from collections import deque
+
+from riscv_constants import reg_abi_map
+
+MASK = 0xFFFFFFFF
+
+def sext(value, bits):
+    sign = 1 << (bits - 1)
+    return ((value & (sign - 1)) - (value & sign)) & MASK
+
+def signed(value):
+    return value - (1 << 32) if value & 0x80000000 else value
+
+class IllegalInstruction(ValueError):
+    pass
+
+_alu_ops = {
+    0: lambda a, b: (a + b) & MASK,
+    1: lambda a, b: (a << (b & 0x1F)) & MASK,
+    2: lambda a, b: int(signed(a) < signed(b)),
+    3: lambda a, b: int(a < b),
+    4: lambda a, b: a ^ b,
+    5: lambda a, b: a >> (b & 0x1F),
+    6: lambda a, b: a | b,
+    7: lambda a, b: a & b,
+}
+_sub = lambda a, b: (a - b) & MASK
+_sra = lambda a, b: (signed(a) >> (b & 0x1F)) & MASK
+
+_branch_ops = {
+    0: lambda a, b: a == b,
+    1: lambda a, b: a != b,
+    4: lambda a, b: signed(a) < signed(b),
+    5: lambda a, b: signed(a) >= signed(b),
+    6: lambda a, b: a < b,
+    7: lambda a, b: a >= b,
+}
+
+class Rv32iModel:
+    """RV32I instruction set model.
+
+    Instructions are decoded once into closures cached by address, a store to
+    a cached address drops its entry. Every step leaves its architectural
+    effect in ``rd_write`` (``(reg, value)``, never for x0) or ``store``
+    (``(addr, data, strobe)`` with the word aligned address and lane shifted
+    data driven on the bus). Loads from ``mmio`` addresses call
+    ``mmio_read(addr)`` instead of reading memory and stores to them only
+    produce the effect.
+    """
+    def __init__(self, memory, pc=0, mmio=(), mmio_read=None):
+        self.memory = memory
+        self.pc = pc
+        self.regs = [0] * 32
+        self.mmio = set(mmio)
+        self.mmio_read = mmio_read
+        self.cache = {}
+        self.retired = 0
+        self.rd_write = None
+        self.store = None
+    def step(self):
+        pc = self.pc
+        op = self.cache.get(pc)
+        if op is None:
+            op = self.cache[pc] = self.decode(self.memory.read_word(pc), pc)
+        self.rd_write = None
+        self.store = None
+        self.pc = op(pc)
+        self.retired += 1
+    def load_word(self, addr):
+        if addr in self.mmio:
+            return self.mmio_read(addr)
+        return self.memory.read_word(addr)
+    def store_word(self, addr, data, strobe):
+        self.store = (addr, data, strobe)
+        if addr in self.mmio:
+            return
+        self.memory.write_word(addr, data, strobe)
+        self.cache.pop(addr, None)
+    def decode(self, insn, pc=0):
+        regs = self.regs
+        opcode = insn & 0x7F
+        rd = (insn >> 7) & 0x1F
+        funct3 = (insn >> 12) & 0x7
+        rs1 = (insn >> 15) & 0x1F
+        rs2 = (insn >> 20) & 0x1F
+        funct7 = insn >> 25
+        imm_i = sext(insn >> 20, 12)
+        def write(value):
+            if rd != 0:
+                regs[rd] = value
+                self.rd_write = (rd, value)
+        if opcode == 0x37:
+            imm = insn & 0xFFFFF000
+            def lui(pc):
+                write(imm)
+                return pc + 4
+            return lui
+        if opcode == 0x17:
+            imm = insn & 0xFFFFF000
+            def auipc(pc):
+                write((pc + imm) & MASK)
+                return pc + 4
+            return auipc
+        if opcode == 0x6F:
+            imm = sext(((insn >> 31) << 20) | (((insn >> 12) & 0xFF) << 12)
+                | (((insn >> 20) & 1) << 11) | (((insn >> 21) & 0x3FF) << 1), 21)
+            def jal(pc):
+                write((pc + 4) & MASK)
+                return (pc + imm) & MASK
+            return jal
+        if opcode == 0x67 and funct3 == 0:
+            def jalr(pc):
+                target = (regs[rs1] + imm_i) & MASK & ~1
+                write((pc + 4) & MASK)
+                return target
+            return jalr
+        if opcode == 0x63 and funct3 in _branch_ops:
+            imm = sext(((insn >> 31) << 12) | (((insn >> 7) & 1) << 11)
+                | (((insn >> 25) & 0x3F) << 5) | (((insn >> 8) & 0xF) << 1), 13)
+            cond = _branch_ops[funct3]
+            def branch(pc):
+                if cond(regs[rs1], regs[rs2]):
+                    return (pc + imm) & MASK
+                return pc + 4
+            return branch
+        if opcode == 0x03 and funct3 in (0, 1, 2, 4, 5):
+            size = 8 << (funct3 & 3)
+            is_signed = funct3 < 4
+            load_word = self.load_word
+            def load(pc):
+                addr = (regs[rs1] + imm_i) & MASK
+                value = (load_word(addr & ~3) >> ((addr & 3) * 8))
+                if size < 32:
+                    value &= (1 << size) - 1
+                    if is_signed:
+                        value = sext(value, size)
+                write(value)
+                return pc + 4
+            return load
+        if opcode == 0x23 and funct3 in (0, 1, 2):
+            imm = sext(((insn >> 25) << 5) | ((insn >> 7) & 0x1F), 12)
+            mask = (0x1, 0x3, 0xF)[funct3]
+            data_mask = (0xFF, 0xFFFF, MASK)[funct3]
+            store_word = self.store_word
+            def store(pc):
+                addr = (regs[rs1] + imm) & MASK
+                offset = addr & 3
+                store_word(addr & ~3, ((regs[rs2] & data_mask) << (offset * 8)) & MASK, (mask << offset) & 0xF)
+                return pc + 4
+            return store
+        if opcode == 0x13:
+            if funct3 == 1:
+                alu = _alu_ops[1]
+                imm = rs2
+            elif funct3 == 5:
+                alu = _sra if funct7 & 0x20 else _alu_ops[5]
+                imm = rs2
+            else:
+                alu = _alu_ops[funct3]
+                imm = imm_i
+            def alu_imm(pc):
+                write(alu(regs[rs1], imm))
+                return pc + 4
+            return alu_imm
+        if opcode == 0x33 and funct7 in (0, 0x20):
+            alu = _alu_ops[funct3]
+            if funct7 == 0x20 and funct3 == 0:
+                alu = _sub
+            elif funct7 == 0x20 and funct3 == 5:
+                alu = _sra
+            def alu_reg(pc):
+                write(alu(regs[rs1], regs[rs2]))
+                return pc + 4
+            return alu_reg
+        if opcode in (0x0F, 0x73):
+            ## fence and system instructions have no effect on this core
+            return lambda pc: pc + 4
+        raise IllegalInstruction(f"Illegal instruction 0x{insn:08X} at 0x{pc:08X}")
+
+class LockstepChecker:
+    """Compare the regfile writes and bus stores of the RTL with ``Rv32iModel``.
+
+    The model only advances when the RTL reports an effect, running until its
+    own next effect. Reads from the MMIO addresses are taken from the values
+    the RTL observed on the data read bus, in order.
+    """
+    def __init__(self, memory, pc=0, mmio=(), max_steps=1000000):
+        self.mmio_reads = deque()
+        self.model = Rv32iModel(memory, pc=pc, mmio=mmio, mmio_read=self._mmio_read)
+        self.max_steps = max_steps
+        self.checked = 0
+    def _mmio_read(self, addr):
+        if not self.mmio_reads:
+            raise AssertionError(f"Model read MMIO address 0x{addr:X} before the RTL did")
+        read_addr, data = self.mmio_reads.popleft()
+        if read_addr != addr:
+            raise AssertionError(f"Model read MMIO address 0x{addr:X}, RTL read 0x{read_addr:X}")
+        return data
+    def observe_read(self, addr, data):
+        if addr in self.model.mmio:
+            self.mmio_reads.append((addr, data))
+    def next_effect(self):
+        model = self.model
+        for _ in range(self.max_steps):
+            pc = model.pc
+            model.step()
+            if model.rd_write is not None:
+                return pc, 'rd', model.rd_write
+            if model.store is not None:
+                return pc, 'store', model.store
+        raise AssertionError(f"Model retired {self.max_steps} instructions without a regfile write or store")
+    def check_regfile_write(self, reg, data):
+        """Return a description of the mismatch or None."""
+        if reg == 0:
+            return None
+        return self._check('rd', (reg, data))
+    def check_store(self, addr, data, strobe):
+        return self._check('store', (addr, data, strobe))
+    def _check(self, kind, got):
+        pc, model_kind, expected = self.next_effect()
+        self.checked += 1
+        if model_kind == kind and expected == got:
+            return None
+        return f"pc 0x{pc:08X}: RTL {self.format(kind, got)}, model {self.format(model_kind, expected)}"
+    @staticmethod
+    def format(kind, effect):
+        if kind == 'rd':
+            reg, value = effect
+            return f"{reg_abi_map[reg]} <- 0x{value:08X}"
+        addr, data, strobe = effect
+        return f"store 0x{addr:08X} <- 0x{data:08X} strobe 0b{strobe:04b}"
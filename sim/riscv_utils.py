@@ -1,41 +1,89 @@
 from pathlib import Path
+import functools
+import hashlib
+import pickle
+import re
+import shutil
+import tempfile
 
-from cocotb_bus.monitors import Monitor
 from cocotb.log import SimLog
-from elftools.elf.elffile import ELFFile
 
-from regfile import RegFileWriteTransaction
 from bus import BusWriteTransaction, BusReadTransaction
-from cocotb_utils import run, to_bytes
+from cocotb_utils import run
+from memory import PagedMemory
+from elf_loader import load_elf
 
 sim_dir = Path(__file__).resolve().parent
 linker_script = sim_dir/'tests/common/linker.ld'
+compile_cache_dir = sim_dir.parent/'work/sim/compile_cache'
+## Bump when the cached memory images change
+image_version = 2
+include_regex = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]',re.MULTILINE)
 
-def read_elf(test_elf,sections=['.text']):
-    log = SimLog(__name__+'.read_elf')
-    with test_elf.open('rb') as file:
-        elffile = ELFFile(file)
-        elf = {}
-        for spec in sections:
-            section = elffile.get_section_by_name(spec)
-            log.debug('read_elf %s spec: %s',test_elf,spec)
-            if section is not None:
-                elf[spec] = dict(
-                    addr = section['sh_addr'],
-                    data = section.data(),
-                )
-    #log.debug(f"elf: {elf}")
-    return elf
+@functools.lru_cache(maxsize=None)
+def toolchain_version(command="riscv64-unknown-elf-gcc --version"):
+    return run(command).stdout
 
-def elf_to_memory(elf):
-    instruction_memory = {}
-    for elf_section in elf.values():
-        section_start = elf_section['addr']
-        section_data = elf_section['data']
-        section_size = len(section_data)
-        for addr in range(section_size):
-            instruction_memory[section_start+addr] = section_data[addr]
-    return instruction_memory
+def find_headers(sources,include_dirs=()):
+    """Resolve the headers included by sources, recursively."""
+    headers = set()
+    pending = list(sources)
+    while pending:
+        source = pending.pop()
+        for name in include_regex.findall(source.read_text(errors='replace')):
+            for directory in [source.parent,*include_dirs]:
+                header = (Path(directory)/name).resolve()
+                if header.is_file():
+                    if header not in headers:
+                        headers.add(header)
+                        pending.append(header)
+                    break
+    return headers
+
+class CompileCache:
+    """On-disk cache of compiled programs and their memory images.
+
+    Entries are keyed by a hash of the toolchain version, the compiler
+    command lines and the content of every source, header and linker script.
+    The toolchain version is the output of ``version_command``.
+    """
+    def __init__(self,cache_dir=compile_cache_dir,version_command="riscv64-unknown-elf-gcc --version"):
+        self.log = SimLog(__name__+'.'+self.__class__.__name__)
+        self.cache_dir = Path(cache_dir)
+        self.version_command = version_command
+    def key(self,commands,sources,include_dirs=()):
+        sources = [Path(s) for s in sources]
+        digest = hashlib.sha256(toolchain_version(self.version_command).encode())
+        digest.update(f"image_version={image_version}".encode())
+        for cmd in commands:
+            digest.update(cmd.encode())
+        for path in sorted(set(sources) | find_headers(sources,include_dirs)):
+            digest.update(str(path).encode())
+            digest.update(path.read_bytes())
+        return digest.hexdigest()
+    def get(self,key):
+        entry = self.cache_dir/key
+        try:
+            with (entry/'memory.pickle').open('rb') as f:
+                images = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        self.log.debug('Compile cache hit: %s',key)
+        return entry/'program.elf', images
+    def put(self,key,elf,images):
+        self.cache_dir.mkdir(parents=True,exist_ok=True)
+        temp = Path(tempfile.mkdtemp(prefix=key+'.',dir=self.cache_dir))
+        shutil.copyfile(elf,temp/'program.elf')
+        with (temp/'memory.pickle').open('wb') as f:
+            pickle.dump(images,f,protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            temp.rename(self.cache_dir/key)
+        except OSError:
+            ## Another worker stored the same entry first
+            shutil.rmtree(temp,ignore_errors=True)
+        return self.get(key)
+
+compile_cache = CompileCache()
 
 def compile_test(instructions):
     log = SimLog(__name__+".compile_test")
@@ -43,9 +91,16 @@ def compile_test(instructions):
     test_elf = Path('test').with_suffix('.elf')
     test_s.write_text('\n'.join(crt0 + instructions) + '\n')
     cmd = f"riscv64-unknown-elf-gcc -march=rv32i -mabi=ilp32 -Wl,-T,{linker_script},-Bstatic -nostartfiles -ffreestanding -g {test_s} -o {test_elf}"
-    run(cmd)
-    elf = read_elf(test_elf)
-    return elf
+    key = compile_cache.key([cmd],[test_s,linker_script])
+    cached = compile_cache.get(key)
+    if cached is None:
+        run(cmd)
+        instruction_memory, _ = load_elf(test_elf)
+        cached = compile_cache.put(key,test_elf,instruction_memory)
+    else:
+        shutil.copyfile(cached[0],test_elf)
+    _, instruction_memory = cached
+    return instruction_memory
 
 def compile_riscv_test(asm_path):
     log = SimLog(__name__+".compile_riscv_test")
@@ -59,20 +114,44 @@ def compile_riscv_test(asm_path):
     cmd_crt0 = f"riscv64-unknown-elf-gcc -march=rv32i -mabi=ilp32 -I{common_dir} -I{macros_dir} -g -DENTRY_POINT={test_s.stem} -c {crt0_s} -o {crt0_obj}"
     cmd_test = f"riscv64-unknown-elf-gcc -march=rv32i -mabi=ilp32 -I{common_dir} -I{macros_dir} -g -DTEST_NAME={test_s.stem} -c {test_s} -o {test_obj}"
     cmd_link = f"riscv64-unknown-elf-gcc -march=rv32i -mabi=ilp32 -I{common_dir} -I{macros_dir} -Wl,-T,{linker_script},-Bstatic -nostartfiles -ffreestanding -g {crt0_obj} {test_obj} -o {test_elf}" 
-    run(cmd_crt0)
-    run(cmd_test)
-    run(cmd_link)
-    return process_elf(test_elf)
+    commands = [cmd_crt0,cmd_test,cmd_link]
+    key = compile_cache.key(commands,[crt0_s,test_s,linker_script],[common_dir,macros_dir])
+    cached = compile_cache.get(key)
+    if cached is None:
+        for cmd in commands:
+            run(cmd)
+        cached = compile_cache.put(key,test_elf,process_elf(test_elf))
+    else:
+        shutil.copyfile(cached[0],test_elf)
+    _, (instruction_memory, data_memory) = cached
+    return instruction_memory, data_memory
 
 def process_elf(test_elf):
-    log = SimLog(__name__+".process_elf")
-    i_elf = read_elf(test_elf,
-        sections=['.init','.text'])
-    d_elf = read_elf(test_elf,
-        sections=['.data','.rodata'])
-    instruction_memory = elf_to_memory(i_elf)
-    data_memory = elf_to_memory(d_elf)
-    return instruction_memory,data_memory
+    """Instruction and data memory of every loadable segment, .bss included."""
+    return load_elf(test_elf)
+
+def compile_program(program_dir,cflags="-O2",defines=()):
+    """Compile the C sources of a program in sim/tests with crt0, see tests/common/Makefile."""
+    log = SimLog(__name__+".compile_program")
+    program_dir = Path(program_dir)
+    common_dir = sim_dir/'tests/common'
+    crt0_s = common_dir/'crt0.S'
+    sources = [crt0_s,*sorted(program_dir.glob('*.c'))]
+    objects = [Path(f"{program_dir.name}_{source.stem}.o") for source in sources]
+    program_elf = Path(program_dir.name).with_suffix('.elf')
+    flags = ' '.join([f"-march=rv32i -mabi=ilp32 -I{common_dir} -g {cflags} -DENTRY_POINT=main",*[f"-D{d}" for d in defines]])
+    commands = [f"riscv64-unknown-elf-gcc {flags} -c {source} -o {obj}" for source,obj in zip(sources,objects)]
+    commands.append(f"riscv64-unknown-elf-gcc -march=rv32i -mabi=ilp32 -Wl,-T,{linker_script},-Bstatic -nostartfiles -ffreestanding {' '.join(map(str,objects))} -o {program_elf}")
+    key = compile_cache.key(commands,[*sources,linker_script],[common_dir,program_dir])
+    cached = compile_cache.get(key)
+    if cached is None:
+        for cmd in commands:
+            run(cmd)
+        cached = compile_cache.put(key,program_elf,process_elf(program_elf))
+    else:
+        shutil.copyfile(cached[0],program_elf)
+    _, (instruction_memory, data_memory) = cached
+    return instruction_memory, data_memory
 
 crt0 = [
     ".global _start",
@@ -80,49 +159,11 @@ crt0 = [
 ]
 
 def compile_instructions(instructions):
-    elf = compile_test(instructions)
-    instruction_memory = elf_to_memory(elf)
-    return instruction_memory
+    return compile_test(instructions)
 
 def parse_data_memory(params_data_memory):
-    data_memory = {}
+    data_memory = PagedMemory()
     for t in params_data_memory:
         t = BusReadTransaction.from_string(t)
-        for i in range(4):
-            data_memory[t.addr+i] = to_bytes(t.data)[i]
+        data_memory.write_word(t.addr,t.data)
     return data_memory
-
-class StackMonitor:
-    def __init__(self,regfile_write_monitor: Monitor):
-        self.log = SimLog('cocotb.'+__name__+'.'+self.__class__.__name__)
-        regfile_write_monitor.add_callback(self.regfile_callback)
-        self.stack_pointer = None
-        self.skip = 2
-        self.stack = []
-        self.direction = 'in'
-        self.return_address = 0
-    def stack_push(self,new):
-        if len(self.stack) == 0 or new != self.stack[-1]:
-            self.log.debug('Stack: [%s] <- 0x%X',self.stack_string(),new)
-            self.stack.append(new)
-    def stack_pop(self):
-        old = self.stack.pop()
-        self.log.debug('Stack: [%s] -> 0x%X',self.stack_string(),old)
-    def stack_string(self):
-        return ', '.join([f'0x{i:X}' for i in self.stack])
-    def regfile_callback(self,transaction: RegFileWriteTransaction):
-        if transaction.reg_name == 'sp':
-            if self.skip > 0:
-                self.skip -= 1
-            else:
-                if self.stack_pointer is not None:
-                    self.direction = 'in' if self.stack_pointer > transaction.data else 'out' 
-                #self.log.debug('stackmonitor regfile %s %s',transaction,self.direction)
-                self.stack_pointer = transaction.data
-                if self.direction == 'out':
-                    self.stack_pop()
-                elif self.direction == 'in':
-                    self.stack_push(self.return_address)
-        if transaction.reg_name == 'ra':
-            self.return_address = transaction.data
-            #self.log.debug('stackmonitor regfile %s',transaction)
@@ -0,0 +1,205 @@
+from pathlib import Path
+from textwrap import dedent
+import fcntl
+import hashlib
+import json
+import os
+
+from cocotb_test.simulator import run, Verilator
+
+from cocotb_utils import waves_trigger_file
+
+root_dir = Path(__file__).resolve().parent.parent
+build_dir = root_dir/'work/sim/build'
+
+class CachedVerilator(Verilator):
+    """Verilator flow that skips verilate and make when the model is up to date."""
+    def build_command(self):
+        cmd = super().build_command()
+        model = os.path.join(self.sim_dir,self.toplevel)
+        if self.outdated(model,self.verilog_sources) or self.force_compile:
+            return cmd
+        self.logger.warning("Skipping compilation:" + model)
+        return cmd[2:]
+
+def simulator():
+    return os.getenv("SIM","icarus")
+
+def simulator_run(**run_opts):
+    """Same as ``cocotb_test.simulator.run`` with cached Verilator builds."""
+    ## cocotb-test appends to some of the lists it is given
+    run_opts = {k:list(v) if isinstance(v,list) else v for k,v in run_opts.items()}
+    if simulator() == "verilator":
+        return CachedVerilator(**run_opts).run()
+    return run(**run_opts)
+
+def verilator_compile_args():
+    """Verilator options, VERILATOR_THREADS > 1 builds a multithreaded model."""
+    args = ["-Wno-fatal","-O3","-CFLAGS","-O3"]
+    threads = int(os.getenv("VERILATOR_THREADS",1))
+    if threads > 1:
+        args += ["--threads",str(threads)]
+    return args
+
+def simulator_run_opts(**run_opts):
+    """Add the simulator specific options to run_opts.
+
+    TRACE=1 makes the testbench record a binary transaction trace, COSIM=1
+    checks the core against the RV32I model, CYCLE_ACCOUNTING=1 reports
+    where the cycles of each test go, PROFILE=1 profiles the firmware and
+    BUS_COUNTERS=1 counts the handshake stalls of every bus channel and
+    COMMIT_TRACE=1 writes a Spike style commit log.
+    LATENCY and LATENCY_SEED configure the memory latency model, see latency.py.
+    WB_WAIT_STATES sets the wait states of the Wishbone memory of LithiumSoC,
+    WB_STRESS and WB_STRESS_SEED the items and seed of the Wishbone adapter stress.
+    Runs on the Copperv2HdlMemory toplevel, HDL_MEMORY=1, tell the testbench
+    that the memory is in HDL, other toplevels keep the Python memory.
+    """
+    run_opts = dict(run_opts)
+    if simulator() == "verilator":
+        run_opts['compile_args'] = [*run_opts.get('compile_args',[]),*verilator_compile_args()]
+    for env, plus_arg in [("TRACE","+trace"),("COSIM","+cosim"),("CYCLE_ACCOUNTING","+cycle_accounting"),("PROFILE","+profile"),("BUS_COUNTERS","+bus_counters"),("COMMIT_TRACE","+commit_trace")]:
+        if os.getenv(env):
+            run_opts['plus_args'] = [*run_opts.get('plus_args',[]),plus_arg]
+    for env, plus_arg in [("LATENCY","+latency"),("LATENCY_SEED","+latency_seed"),("WB_WAIT_STATES","+wb_wait_states"),
+            ("WB_STRESS","+wb_stress"),("WB_STRESS_SEED","+wb_stress_seed")]:
+        if os.getenv(env):
+            run_opts['plus_args'] = [*run_opts.get('plus_args',[]),f"{plus_arg}={os.getenv(env)}"]
+    if run_opts.get('toplevel') == "Copperv2HdlMemory":
+        ## fake_memory.v finishes the simulation without a hex file
+        run_opts['plus_args'] = [*run_opts.get('plus_args',[]),"+hdl_memory","+HEX_FILE=memory.hex"]
+    return run_opts
+
+build_options = ['toplevel','toplevel_lang','includes','defines','parameters','compile_args','extra_args','waves']
+
+def build_key(**run_opts):
+    """Hash of everything that changes the compiled simulator."""
+    digest = hashlib.sha256(simulator().encode())
+    for option in build_options:
+        digest.update(f"{option}={run_opts.get(option)!r}".encode())
+    sources = [Path(s) for s in run_opts.get('verilog_sources',[])]
+    for include in run_opts.get('includes',[]):
+        sources.extend(sorted(p for p in Path(include).rglob('*') if p.is_file()))
+    for source in sources:
+        digest.update(str(source).encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()[:16]
+
+def shared_build(**run_opts):
+    """Compile the simulator once per RTL version and return its build directory.
+
+    Concurrent callers (pytest-xdist workers) serialize on a lock file, the
+    first one compiles and the others find the build up to date.
+    """
+    sim_build = build_dir/f"{run_opts['toplevel']}_{build_key(**run_opts)}"
+    sim_build.mkdir(parents=True,exist_ok=True)
+    with sim_build.with_suffix('.lock').open('w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        simulator_run(**run_opts,sim_build=sim_build,compile_only=True)
+    return sim_build
+
+waves_policies = ["off","fst","window","rerun"]
+
+def waves_policy():
+    """Waveform policy, from the WAVES_POLICY environment variable.
+
+    - off: no waveforms.
+    - fst: full FST dump of every test.
+    - window: dump only a time window, WAVES_WINDOW=<start_ns>:<end_ns> or else
+      WAVES_WINDOW_CYCLES before the trigger recorded by the previous run.
+    - rerun: no waveforms, failing tests are run again with a window dump.
+    """
+    policy = os.getenv("WAVES_POLICY","rerun")
+    if policy not in waves_policies:
+        raise ValueError(f"Unsupported WAVES_POLICY {policy}, expected one of {waves_policies}")
+    return policy
+
+def waves_window_module(toplevel):
+    """Icarus dump module that limits the dump to the +waves_start/+waves_end window."""
+    path = build_dir/f"waves_window_{toplevel}.v"
+    text = dedent(f"""
+    `timescale 1ns/1ps
+    module waves_window();
+    reg [63:0] waves_start;
+    reg [63:0] waves_end;
+    initial begin
+        $dumpfile("{toplevel}.fst");
+        $dumpvars(0, {toplevel});
+        if ($value$plusargs("waves_start=%d", waves_start)) begin
+            $dumpoff;
+            #(waves_start) $dumpon;
+        end
+    end
+    initial begin
+        if ($value$plusargs("waves_end=%d", waves_end)) begin
+            #(waves_end) $dumpoff;
+        end
+    end
+    endmodule
+    """).lstrip()
+    build_dir.mkdir(parents=True,exist_ok=True)
+    if not path.exists() or path.read_text() != text:
+        ## Concurrent workers may be compiling with it, replace it atomically
+        temp = path.with_name(f"{path.name}.{os.getpid()}")
+        temp.write_text(text)
+        temp.replace(path)
+    return path
+
+def waves_window(work_dir):
+    """Return the (start, end) dump window in ns, None to dump everything."""
+    window = os.getenv("WAVES_WINDOW")
+    if window:
+        start, end = window.split(':')
+        return int(start), int(end)
+    trigger_path = Path(work_dir)/waves_trigger_file
+    if not trigger_path.exists():
+        return None
+    trigger = json.loads(trigger_path.read_text())
+    cycles = int(os.getenv("WAVES_WINDOW_CYCLES",1000))
+    start = max(0,trigger['time_ns'] - cycles*trigger['period_ns'])
+    end = trigger['time_ns'] + 10*trigger['period_ns']
+    return start, end
+
+def waves_run_opts(policy,work_dir,**run_opts):
+    run_opts = dict(run_opts,waves=policy == "fst")
+    if policy == "window" and simulator() != "icarus":
+        ## Only Icarus has a windowed dump, dump everything elsewhere
+        run_opts['waves'] = True
+    elif policy == "window":
+        plus_args = ["-fst"]
+        window = waves_window(work_dir)
+        if window is not None:
+            plus_args += [f"+waves_start={window[0]}",f"+waves_end={window[1]}"]
+        run_opts['verilog_sources'] = [*run_opts['verilog_sources'],waves_window_module(run_opts['toplevel'])]
+        run_opts['compile_args'] = [*run_opts.get('compile_args',[]),"-s","waves_window"]
+        run_opts['plus_args'] = [*run_opts.get('plus_args',[]),*plus_args]
+    return run_opts
+
+def _run_test(work_dir,**run_opts):
+    sim_build = shared_build(**run_opts)
+    return simulator_run(**run_opts,sim_build=sim_build,work_dir=work_dir)
+
+def run_test(work_dir,**run_opts):
+    """Run a test in its own work directory on top of a shared build.
+
+    The simulator is selected with the SIM environment variable like in
+    cocotb-test, icarus and verilator are supported. Waveforms follow
+    ``waves_policy``.
+    """
+    run_opts = simulator_run_opts(**run_opts)
+    run_opts.pop('waves',None)
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True,exist_ok=True)
+    policy = waves_policy()
+    if policy != "rerun":
+        return _run_test(work_dir,**waves_run_opts(policy,work_dir,**run_opts))
+    (work_dir/waves_trigger_file).unlink(missing_ok=True)
+    try:
+        return _run_test(work_dir,**waves_run_opts("off",work_dir,**run_opts))
+    except AssertionError:
+        ## Run the failing test again with waves around the failure
+        try:
+            _run_test(work_dir,**waves_run_opts("window",work_dir,**run_opts))
+        except AssertionError:
+            pass
+        raise
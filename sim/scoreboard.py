@@ -0,0 +1,84 @@
+from collections import deque
+import dataclasses
+import logging
+
+from cocotb.triggers import Event
+from cocotb_bus.scoreboard import Scoreboard
+
+from cocotb_utils import record_waves_trigger
+
+def _format_value(value):
+    if isinstance(value,int) and not isinstance(value,bool):
+        return f"0x{value:X}"
+    return repr(value)
+
+def compact_diff(got, exp):
+    """One line description of how ``got`` differs from ``exp``."""
+    if exp is None:
+        return f"unexpected {got}"
+    if type(got) == type(exp) and dataclasses.is_dataclass(exp):
+        fields = []
+        for field in dataclasses.fields(exp):
+            got_value = getattr(got,field.name)
+            exp_value = getattr(exp,field.name)
+            ## Fields left unset in the expected transaction are not compared
+            if exp_value is not None and got_value != exp_value:
+                fields.append(f"{field.name} {_format_value(got_value)} != {_format_value(exp_value)}")
+        if fields:
+            return ", ".join(fields)
+    return f"got {got} expected {exp}"
+
+class CompletionScoreboard(Scoreboard):
+    """In order scoreboard that signals when all expected transactions arrived.
+
+    Every interface keeps its expected transactions in a deque, so the
+    outstanding count is a ``len`` and ``drained`` is set as soon as the last one
+    is received instead of polling the queues every cycle. A mismatch is
+    logged as a one line diff, marks the waves trigger and, with ``fail_fast``,
+    fails the test from the monitor callback. Otherwise ``check`` fails it at
+    the end of the test.
+    """
+    def __init__(self, dut, fail_fast=True, period=10, period_unit="ns"):
+        super().__init__(dut,fail_immediately=False)
+        self.fail_fast = fail_fast
+        self.period = period
+        self.period_unit = period_unit
+        self.total_outstanding = 0
+        self.drained = Event()
+        self.drained.set()
+    @property
+    def outstanding(self):
+        return {monitor.name:len(expected) for monitor,expected in self.expected.items()}
+    def add_interface(self, monitor, expected_output, strict_type=True):
+        expected_output = deque(expected_output)
+        self.expected[monitor] = expected_output
+        self.total_outstanding += len(expected_output)
+        if self.total_outstanding > 0:
+            self.drained.clear()
+        log = logging.getLogger(f"{self.log.name}.{monitor.name}")
+        def check_received_transaction(transaction):
+            if not expected_output:
+                self.mismatch(log,transaction,None)
+                return
+            exp = expected_output.popleft()
+            self.compare(transaction,exp,log,strict_type=strict_type)
+            self.total_outstanding -= 1
+            if self.total_outstanding == 0:
+                self.drained.set()
+        monitor.add_callback(check_received_transaction)
+    def compare(self, got, exp, log, strict_type=True):
+        if strict_type and type(got) != type(exp):
+            self.mismatch(log,got,exp)
+        elif (got if strict_type else str(got)) != (exp if strict_type else str(exp)):
+            self.mismatch(log,got,exp)
+    def mismatch(self, log, got, exp):
+        self.errors += 1
+        diff = compact_diff(got,exp)
+        log.error("Mismatch: %s (received %s)",diff,got)
+        record_waves_trigger("scoreboard_mismatch",self.period,self.period_unit)
+        if self.fail_fast:
+            raise AssertionError(f"{log.name.rsplit('.',1)[-1]} mismatch: {diff}")
+    def check(self):
+        """Fail the test when any transaction mismatched."""
+        if self.errors:
+            raise AssertionError(f"Scoreboard found {self.errors} mismatches")
@@ -0,0 +1,34 @@
+"""Paths and simulator options shared by the pytest test modules."""
+from pathlib import Path
+import os
+
+root_dir = Path(__file__).resolve().parent.parent
+sim_dir = root_dir/'sim'
+chisel_dir = root_dir/'work/rtl'
+rtl_v1_dir = root_dir/'src/main/resources/rtl_v1'
+results_dir = root_dir/'work/sim/benchmarks'
+
+rv_asm_paths = sorted(sim_dir.glob('tests/isa/rv32ui/*.S'))
+
+common_run_opts = dict(
+    verilog_sources=[
+        chisel_dir/"copperv2.v",
+        rtl_v1_dir/"idecoder.v",
+    ],
+    includes=[rtl_v1_dir/'include'],
+    toplevel="Copperv2",
+    module="cocotb_tests",
+)
+
+## HDL_MEMORY=1 serves instructions and data from the HDL memory of the copperv1
+## testbench, Python only handles the MMIO window. Unit tests need the Python memory.
+hdl_memory = bool(os.environ.get('HDL_MEMORY'))
+hdl_memory_run_opts = dict(common_run_opts,
+    verilog_sources=[
+        *common_run_opts['verilog_sources'],
+        sim_dir/"copperv2_hdl_memory.v",
+        sim_dir/"tests/Icarus_simulation/fake_memory.v",
+    ],
+    includes=[*common_run_opts['includes'],sim_dir/'tests/Icarus_simulation'],
+    toplevel="Copperv2HdlMemory",
+)
@@ -0,0 +1,78 @@
+from pathlib import Path
+import json
+import os
+
+import pytest
+
+from cocotb_tests import dhrystone_result
+from runner import run_test
+from sim_config import common_run_opts, hdl_memory, hdl_memory_run_opts, root_dir, results_dir
+
+benchmarks = ["dhrystone","timer_test"]
+
+## Memory settings of the latency sweep, see latency.py
+latency_settings = [
+    "",
+    "ir=fixed:2,dr=fixed:2,dw=fixed:2",
+    "ir=fixed:8,dr=fixed:8,dw=fixed:8",
+    "ir=random:0-4,dr=random:0-16,dw=random:0-16",
+    "ir=ready:4/1,dr=ready:4/1,dw=ready:4/1",
+]
+
+def compare_with_baseline(result,baseline):
+    """Fail when a benchmark takes more cycles than its baseline, BENCHMARK_TOLERANCE is relative."""
+    tolerance = float(os.environ.get('BENCHMARK_TOLERANCE',0))
+    for key in ['cflags','runs','latency']:
+        if result.get(key) != baseline.get(key):
+            pytest.skip(f"Baseline {key} {baseline.get(key)} differs from {result.get(key)}")
+    for key in ['cycles','instructions','cpi','dmips_per_mhz']:
+        if key in result:
+            print(f"{result['name']} {key}: {baseline[key]} -> {result[key]}")
+    assert result['cycles'] <= baseline['cycles'] * (1 + tolerance), \
+        f"{result['name']} regressed from {baseline['cycles']} to {result['cycles']} cycles"
+
+def test_dhrystone_result():
+    assert dhrystone_result(10,[100,1100,1200]) == dict(runs=10,cycles_per_run=100.0,dmips_per_mhz=5.6915)
+    ## A wrong TC_ADDR or an early fail leaves fewer than two timer reads
+    for timer_reads in [[],[100]]:
+        assert dhrystone_result(10,timer_reads) == dict(runs=10,cycles_per_run=None,dmips_per_mhz=None)
+
+@pytest.mark.skipif(not os.environ.get('BENCHMARKS'),reason="Set BENCHMARKS=1 to run the benchmarks")
+@pytest.mark.parametrize("name",benchmarks)
+def test_benchmark(name):
+    work_dir = root_dir/f"work/sim/benchmark_{name}"
+    run_test(
+        **(hdl_memory_run_opts if hdl_memory else common_run_opts),
+        extra_env={"BENCHMARK":name},
+        work_dir=work_dir,
+        testcase = "run_benchmark_test",
+    )
+    result = json.loads((work_dir/'benchmark_results.json').read_text())
+    results_dir.mkdir(parents=True,exist_ok=True)
+    (results_dir/f"{name}.json").write_text(json.dumps(result,indent=2) + '\n')
+    print(json.dumps(result,indent=2))
+    baseline_dir = os.environ.get('BENCHMARK_BASELINE')
+    if baseline_dir is not None:
+        baseline_path = Path(baseline_dir)/f"{name}.json"
+        if not baseline_path.exists():
+            pytest.skip(f"No baseline {baseline_path}")
+        compare_with_baseline(result,json.loads(baseline_path.read_text()))
+
+@pytest.mark.skipif(not os.environ.get('BENCHMARKS'),reason="Set BENCHMARKS=1 to run the benchmarks")
+@pytest.mark.parametrize("latency",[pytest.param(s,id=s or "ideal") for s in latency_settings])
+def test_latency_sweep(latency):
+    """CPI of a benchmark, LATENCY_BENCHMARK, for each memory latency setting."""
+    name = os.environ.get('LATENCY_BENCHMARK','dhrystone')
+    index = latency_settings.index(latency)
+    work_dir = root_dir/f"work/sim/latency_{name}_{index}"
+    run_test(
+        **(hdl_memory_run_opts if hdl_memory else common_run_opts),
+        extra_env={"BENCHMARK":name},
+        plus_args=[f"+latency={latency}"] if latency else [],
+        work_dir=work_dir,
+        testcase = "run_benchmark_test",
+    )
+    result = json.loads((work_dir/'benchmark_results.json').read_text())
+    results_dir.mkdir(parents=True,exist_ok=True)
+    (results_dir/f"latency_{name}_{index}.json").write_text(json.dumps(result,indent=2) + '\n')
+    print(f"{name} latency {latency or 'ideal'}: CPI {result['cpi']}")
@@ -0,0 +1,24 @@
+from bus_counters import ChannelCounters, LatencyCounters
+
+def test_channel_counters():
+    counters = ChannelCounters("dr_addr")
+    for valid,ready in [(0,0),(0,1),(1,0),(1,0),(1,1),(1,1),(0,0)]:
+        counters.sample(valid,ready)
+    r = counters.results()
+    assert (r['cycles'],r['fires'],r['valid_not_ready'],r['ready_not_valid']) == (7,2,2,1)
+    assert r['wait'] == {0:1,2:1}
+
+def test_latency_counters():
+    counters = LatencyCounters("dr")
+    counters.request(1)
+    counters.request(2)
+    counters.response(4)
+    counters.request(5)
+    counters.response(6)
+    counters.response(9)
+    counters.response(10)
+    r = counters.results()
+    assert r['peak_outstanding'] == 2
+    assert r['latency'] == {3:1,4:2}
+    assert r['responses'] == 3
+    assert r['max_latency'] == 4
@@ -0,0 +1,29 @@
+import gzip
+
+from commit_trace import CommitTrace
+
+def test_commit_trace(tmp_path):
+    path = tmp_path/'test.commit.gz'
+    trace = CommitTrace(path,capacity=2)
+    ## addi a0,zero,5
+    trace.fetch(0x0,0x00500513)
+    trace.regfile_write(10,5)
+    ## sb a0,6(zero), lane shifted to byte 2
+    trace.fetch(0x4,0x00a00323)
+    trace.store(0x4,0x00050000,0b0100)
+    ## lw a1,-4(a0)
+    trace.fetch(0x8,0xffc52583)
+    trace.regfile_read(10,5)
+    trace.load(0x0)
+    trace.regfile_write(11,0x12345678)
+    ## addi zero,zero,0
+    trace.fetch(0xc,0x00000013)
+    trace.regfile_write(0,0)
+    trace.close()
+    assert gzip.decompress(path.read_bytes()).decode().splitlines() == [
+        "core   0: 3 0x00000000 (0x00500513) x10 0x00000005",
+        "core   0: 3 0x00000004 (0x00a00323) mem 0x00000006 0x05",
+        "core   0: 3 0x00000008 (0xffc52583) x11 0x12345678 mem 0x00000001",
+        "core   0: 3 0x0000000c (0x00000013)",
+    ]
+    assert trace.count == 4
@@ -0,0 +1,53 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from riscv_utils import CompileCache
+
+def make_program(tmp_path):
+    (tmp_path/'include').mkdir()
+    (tmp_path/'include/macros.h').write_text('#define VALUE 1\n')
+    source = tmp_path/'test.S'
+    source.write_text('#include "macros.h"\nli a0, VALUE\n')
+    elf = tmp_path/'test.elf'
+    elf.write_bytes(b'\x7fELF program')
+    return source, elf
+
+def test_hit_miss(tmp_path):
+    cache = CompileCache(tmp_path/'cache',version_command="echo stub-gcc 1.0")
+    source, elf = make_program(tmp_path)
+    key = cache.key(["gcc -O2 test.S"],[source],[tmp_path/'include'])
+    assert cache.get(key) is None
+    images = dict(instruction={0x0:0x00100513},data={})
+    cached_elf, cached_images = cache.put(key,elf,images)
+    assert cached_images == images
+    assert cached_elf.read_bytes() == elf.read_bytes()
+    cached_elf, cached_images = cache.get(key)
+    assert cached_images == images
+    ## The key does not depend on the cache instance
+    assert CompileCache(tmp_path/'cache',version_command="echo stub-gcc 1.0").get(key) is not None
+
+def test_invalidation(tmp_path):
+    cache = CompileCache(tmp_path/'cache',version_command="echo stub-gcc 1.0")
+    source, _ = make_program(tmp_path)
+    include_dirs = [tmp_path/'include']
+    key = cache.key(["gcc -O2 test.S"],[source],include_dirs)
+    assert cache.key(["gcc -O2 test.S"],[source],include_dirs) == key
+    assert cache.key(["gcc -O0 test.S"],[source],include_dirs) != key
+    assert CompileCache(tmp_path/'cache',version_command="echo stub-gcc 2.0").key(["gcc -O2 test.S"],[source],include_dirs) != key
+    (tmp_path/'include/macros.h').write_text('#define VALUE 2\n')
+    assert cache.key(["gcc -O2 test.S"],[source],include_dirs) != key
+
+def put(cache_dir, key, elf, images):
+    _, cached_images = CompileCache(cache_dir,version_command="echo stub-gcc 1.0").put(key,elf,images)
+    return cached_images
+
+def test_concurrent_put(tmp_path):
+    cache = CompileCache(tmp_path/'cache',version_command="echo stub-gcc 1.0")
+    source, elf = make_program(tmp_path)
+    key = cache.key(["gcc -O2 test.S"],[source],[tmp_path/'include'])
+    images = dict(instruction={0x0:0x00100513},data={})
+    with ProcessPoolExecutor(4) as pool:
+        results = list(pool.map(put,*zip(*[(tmp_path/'cache',key,elf,images)]*8)))
+    assert results == [images]*8
+    ## The losers remove their temporary directory
+    assert [p.name for p in (tmp_path/'cache').iterdir()] == [key]
+    assert cache.get(key)[1] == images
@@ -1,38 +1,33 @@
 from pathlib import Path
+import fcntl
+import json
+import os
 
 import toml
 import pytest
-from cocotb_test.simulator import run
 
-root_dir = Path(__file__).resolve().parent.parent
-sim_dir = root_dir/'sim'
-chisel_dir = root_dir/'work/rtl'
-rtl_v1_dir = root_dir/'src/main/resources/rtl_v1'
+from runner import run_test
+
+from sim_config import root_dir, sim_dir, common_run_opts, hdl_memory, hdl_memory_run_opts, rv_asm_paths
 
 toml_path = sim_dir/"tests/unit_tests.toml"
 unit_tests = toml.loads(toml_path.read_text())
 
-rv_asm_paths = list(sim_dir.glob('tests/isa/rv32ui/*.S'))
-
-common_run_opts = dict(
-    verilog_sources=[
-        chisel_dir/"copperv2.v",
-        rtl_v1_dir/"idecoder.v",
-    ],
-    includes=[rtl_v1_dir/'include'],
-    toplevel="Copperv2",
-    module="cocotb_tests",
-    waves = True,
-)
+## BATCH_SIZE > 0 runs the compliance tests several programs per simulation
+batch_size = int(os.environ.get('BATCH_SIZE',0))
+rv_batches = []
+if batch_size > 0:
+    rv_batches = [sorted(rv_asm_paths)[i:i+batch_size] for i in range(0,len(rv_asm_paths),batch_size)]
+    rv_asm_paths = []
 
 @pytest.mark.parametrize(
     "parameters", [pytest.param({"TEST_NAME":name},id=name) for name in unit_tests]
 )
 def test_unit(parameters):
-    run(
+    run_test(
         **common_run_opts,
         extra_env=parameters,
-        sim_build=f"work/sim/test_unit_{parameters['TEST_NAME']}",
+        work_dir=root_dir/f"work/sim/test_unit_{parameters['TEST_NAME']}",
         testcase = "run_unit_test",
     )
 
@@ -41,9 +36,52 @@ def test_unit(parameters):
         for path in rv_asm_paths]
 )
 def test_riscv(parameters):
-    run(
-        **common_run_opts,
+    run_test(
+        **(hdl_memory_run_opts if hdl_memory else common_run_opts),
         extra_env=parameters,
-        sim_build=f"work/sim/test_riscv_{parameters['TEST_NAME']}",
+        work_dir=root_dir/f"work/sim/test_riscv_{parameters['TEST_NAME']}",
         testcase = "run_riscv_test",
     )
+
+def run_riscv_batch(paths):
+    """Simulate a batch once per pytest session, return its results by program name.
+
+    Every program of a batch is a test of its own. The first one to run
+    simulates the batch, under a lock shared by the pytest-xdist workers, the
+    others read the results it left.
+    """
+    work_dir = root_dir/f"work/sim/test_riscv_batch_{paths[0].stem}"
+    work_dir.mkdir(parents=True,exist_ok=True)
+    results = work_dir/'batch_results.json'
+    session_file = work_dir/'batch_session'
+    error_file = work_dir/'batch_error.txt'
+    session = os.environ.get('PYTEST_XDIST_TESTRUNUID',str(os.getpid()))
+    with (work_dir/'batch.lock').open('w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        if not session_file.exists() or session_file.read_text() != session:
+            results.unlink(missing_ok=True)
+            error = ""
+            try:
+                run_test(
+                    **(hdl_memory_run_opts if hdl_memory else common_run_opts),
+                    extra_env={"ASM_PATHS":os.pathsep.join(str(p.resolve()) for p in paths)},
+                    work_dir=work_dir,
+                    testcase = "run_riscv_batch_test",
+                )
+            except Exception as e:
+                ## A failed program fails the simulation, each test checks its own result
+                error = str(e)
+            error_file.write_text(error)
+            session_file.write_text(session)
+    if not results.exists():
+        pytest.fail(f"Batch simulation failed: {error_file.read_text()}")
+    return {result['name']:result for result in json.loads(results.read_text())}
+
+@pytest.mark.parametrize(
+    "paths,path", [pytest.param(paths,path,id=path.stem) for paths in rv_batches for path in paths]
+)
+def test_riscv_batch(paths, path):
+    result = run_riscv_batch(paths).get(path.stem)
+    assert result is not None, f"{path.stem} did not run in its batch"
+    print(f"{result['name']}: {result['result']} ({result['cycles']} cycles)")
+    assert result['result'] == "pass", f"{result['name']}: {result['result']} after {result['cycles']} cycles"
@@ -0,0 +1,42 @@
+import pytest
+
+from elf_loader import elf_header, program_header, iter_segments, load_elf, PF_X, PF_R, PF_W, PT_LOAD
+
+def make_elf(segments):
+    """ELF32 image with (type, addr, data, memsz, flags) program headers."""
+    phoff = elf_header.size
+    offset = phoff + len(segments)*program_header.size
+    headers = b''
+    payload = b''
+    for p_type,addr,data,memsz,flags in segments:
+        headers += program_header.pack(p_type,offset + len(payload),addr,addr,len(data),memsz,flags,4)
+        payload += data
+    ident = b'\x7fELF\x01\x01\x01' + bytes(9)
+    header = elf_header.pack(ident,2,0xF3,1,0,phoff,0,0,elf_header.size,program_header.size,len(segments),0,0,0)
+    return header + headers + payload
+
+def test_iter_segments():
+    image = make_elf([
+        (PT_LOAD,0x0,b'\x13\x00\x00\x00',4,PF_R|PF_X),
+        (6,0x100,b'',0,PF_R),
+        (PT_LOAD,0x1000,b'\x01\x02',8,PF_R|PF_W),
+    ])
+    segments = list(iter_segments(image))
+    assert [(s.addr,bytes(s.data),s.memsz) for s in segments] == [(0x0,b'\x13\x00\x00\x00',4),(0x1000,b'\x01\x02',8)]
+
+def test_load_elf(tmp_path):
+    elf = tmp_path/'program.elf'
+    elf.write_bytes(make_elf([
+        (PT_LOAD,0x0,b'\x13\x00\x00\x00\x6f\x00\x00\x00',8,PF_R|PF_X),
+        (PT_LOAD,0x2000,b'\x44\x33\x22\x11',0x1010,PF_R|PF_W),
+    ]))
+    instruction_memory, data_memory = load_elf(elf)
+    assert instruction_memory.read_word(4) == 0x6F
+    assert instruction_memory.high_address == 7
+    assert data_memory.read_word(0x2000) == 0x11223344
+    assert data_memory.high_address == 0x300F
+    assert 0x3008 in data_memory
+
+def test_not_elf():
+    with pytest.raises(ValueError):
+        list(iter_segments(b'\x00'*64))
@@ -0,0 +1,30 @@
+import pytest
+
+from latency import LatencyModel
+
+def test_fixed_and_ranges():
+    model = LatencyModel.parse("ir=fixed:1, dr=fixed:2, dr[0x80000000:0x80000010]=fixed:20")
+    assert model.delay('ir',0x100) == 1
+    assert model.delay('dr',0x100) == 2
+    assert model.delay('dr',0x80000008) == 20
+    assert model.delay('dr',0x80000010) == 2
+    assert model.delay('dw',0x100) == 0
+    assert model.backpressure('ir') is None
+
+def test_random_is_repeatable():
+    delays = [LatencyModel.parse("dr=random:1-8",seed=3).delay('dr',0) for _ in range(2)]
+    model = LatencyModel.parse("dr=random:1-8",seed=3)
+    sequence = [model.delay('dr',0) for _ in range(50)]
+    assert delays[0] == delays[1] == sequence[0]
+    assert all(1 <= d <= 8 for d in sequence)
+    assert len(set(sequence)) > 1
+
+def test_backpressure():
+    model = LatencyModel.parse("dw=ready:8/2")
+    assert model.backpressure('dw') == (8,2)
+    assert model.delay('dw',0) == 0
+
+@pytest.mark.parametrize("spec",["xx=fixed:1","ir=slow:1","ir=ready:2/2","ir[0:4]=ready:4/1","ir=fixed"])
+def test_invalid(spec):
+    with pytest.raises(ValueError):
+        LatencyModel.parse(spec)
@@ -1,10 +1,11 @@
 from pathlib import Path
-from cocotb_test.simulator import run
+import json
+import os
 
-root_dir = Path(__file__).resolve().parent.parent
-sim_dir = root_dir/'sim'
-chisel_dir = root_dir/'work/rtl'
-rtl_v1_dir = root_dir/'src/main/resources/rtl_v1'
+import pytest
+
+from runner import run_test
+from sim_config import root_dir, chisel_dir, common_run_opts, rv_asm_paths, results_dir
 
 def timescale_fix(verilog):
     verilog = Path(verilog)
@@ -15,11 +16,74 @@ def timescale_fix(verilog):
 
 def test_wishbone_adapter():
     wb_adapter_rtl = timescale_fix(chisel_dir/"wb_adapter.v")
-    run(
+    run_test(
         toplevel = "WishboneAdapter",
         verilog_sources=[wb_adapter_rtl],        
-        sim_build=f"work/sim/test_wishbone_adapter",
+        work_dir=root_dir/"work/sim/test_wishbone_adapter",
         testcase = "run_wishbone_adapter_test",
         module = "cocotb_tests",
-        waves = True,
-    )
\ No newline at end of file
+    )
+
+## The WishboneAdapter of src/main/scala/lithiumSoC/wishbone.scala is a stub that
+## never starts a cycle, programs can not run on the SoC and the stress can not
+## match any request until it is implemented
+wishbone_adapter_stub = not os.environ.get('LITHIUM_SOC')
+
+@pytest.mark.skipif(wishbone_adapter_stub,reason="WishboneAdapter not implemented, set LITHIUM_SOC=1 to run the stress")
+@pytest.mark.skipif(not os.environ.get('WB_STRESS'),reason="Set WB_STRESS=<items> to run the stress")
+def test_wishbone_adapter_stress():
+    wb_adapter_rtl = timescale_fix(chisel_dir/"wb_adapter.v")
+    work_dir = root_dir/"work/sim/test_wishbone_adapter_stress"
+    run_test(
+        toplevel = "WishboneAdapter",
+        verilog_sources=[wb_adapter_rtl],
+        work_dir=work_dir,
+        testcase = "run_wishbone_adapter_stress_test",
+        module = "cocotb_tests",
+    )
+    print((work_dir/'wishbone_stress.json').read_text())
+
+soc_run_opts = dict(common_run_opts,
+    verilog_sources=[
+        chisel_dir/"lithium_top.v",
+        *common_run_opts['verilog_sources'][1:],
+    ],
+    toplevel="LithiumSoC",
+)
+soc_programs = pytest.mark.skipif(wishbone_adapter_stub,
+    reason="WishboneAdapter not implemented, set LITHIUM_SOC=1 to run programs on LithiumSoC")
+
+@pytest.mark.parametrize(
+    "parameters", [pytest.param({"TEST_NAME":path.stem,"ASM_PATH":str(path.resolve())},id=path.stem)
+        for path in rv_asm_paths]
+)
+@soc_programs
+def test_soc_riscv(parameters):
+    run_test(
+        **soc_run_opts,
+        extra_env=parameters,
+        work_dir=root_dir/f"work/sim/test_soc_riscv_{parameters['TEST_NAME']}",
+        testcase = "run_soc_riscv_test",
+    )
+
+@soc_programs
+@pytest.mark.skipif(not os.environ.get('BENCHMARKS'),reason="Set BENCHMARKS=1 to run the benchmarks")
+def test_soc_dhrystone():
+    """Dhrystone on LithiumSoC, compared with the bare core results of test_benchmarks.py when present."""
+    name = "dhrystone"
+    work_dir = root_dir/f"work/sim/soc_benchmark_{name}"
+    run_test(
+        **soc_run_opts,
+        extra_env={"BENCHMARK":name},
+        work_dir=work_dir,
+        testcase = "run_soc_benchmark_test",
+    )
+    result = json.loads((work_dir/'benchmark_results.json').read_text())
+    results_dir.mkdir(parents=True,exist_ok=True)
+    (results_dir/f"soc_{name}.json").write_text(json.dumps(result,indent=2) + '\n')
+    print(json.dumps(result,indent=2))
+    core_path = results_dir/f"{name}.json"
+    if core_path.exists():
+        core = json.loads(core_path.read_text())
+        print(f"{name} cycles: Copperv2 bus {core['cycles']}, LithiumSoC {result['cycles']} "
+            f"({result['cycles'] / core['cycles']:.3f}x, {result['wait_states']} wait states)")
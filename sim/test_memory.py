@@ -0,0 +1,72 @@
+import pytest
+
+from memory import PagedMemory
+
+@pytest.fixture
+def memory():
+    return PagedMemory()
+
+def test_unallocated_reads_zero(memory):
+    assert memory.read_word(0x1000) == 0
+    assert memory.peek(0xFFFFFF00,8) == bytes(8)
+    assert len(memory.pages) == 0
+
+def test_word_read_write(memory):
+    memory.write_word(0x20,0x12345678)
+    assert memory.read_word(0x20) == 0x12345678
+    assert memory.peek(0x20,4) == bytes([0x78,0x56,0x34,0x12])
+    assert memory.high_address == 0x23
+
+def test_masked_write(memory):
+    memory.write_word(0x40,0xAABBCCDD)
+    memory.write_word(0x40,0x11223344,strobe=0b0101)
+    assert memory.read_word(0x40) == 0xAA22CC44
+
+def test_page_crossing(memory):
+    addr = memory.page_size - 2
+    memory.write_word(addr,0xCAFEBABE)
+    assert len(memory.pages) == 2
+    assert memory.read_word(addr) == 0xCAFEBABE
+
+def test_load_and_update(memory):
+    memory.load(0x100,bytes(range(1,9)))
+    other = PagedMemory()
+    other.load(0x200,b'\x01\x02')
+    merged = memory.copy()
+    merged.update(other)
+    assert merged.read_word(0x104) == 0x08070605
+    assert merged.read_word(0x200) == 0x0201
+    assert merged.high_address == 0x201
+    assert memory.read_word(0x200) == 0
+    assert list(merged.items())[:2] == [(0x100,1),(0x101,2)]
+
+def test_write_verilog_hex(memory, tmp_path):
+    memory.write_word(0x4,0x12345678)
+    memory.write_word(0x1004,0xAABBCCDD)
+    memory.write_word(0x3000,0x1)
+    path = tmp_path/'memory.hex'
+    memory.write_verilog_hex(path,columns=8)
+    lines = path.read_text().splitlines()
+    assert lines[0] == '@0'
+    assert lines[1] == '00 00 00 00 78 56 34 12'
+    assert lines[memory.page_size//8 + 1] == '00 00 00 00 dd cc bb aa'
+    assert lines.count('@3000') == 1
+    assert len(lines) == 3*memory.page_size//8 + 2
+
+def test_update_written_zeros(memory):
+    memory.write_word(0x10,0x11223344)
+    memory.write_word(0x20,0xAABBCCDD)
+    other = PagedMemory()
+    other.write_word(0x10,0)
+    other.write_word(0x20,0x00000011,strobe=0b0001)
+    other.zero(0x30,4)
+    memory.update(other)
+    ## Data memory wins, explicit zeros included
+    assert memory.read_word(0x10) == 0
+    assert memory.read_word(0x20) == 0xAABBCC11
+    assert memory.read_word(0x30) == 0
+    ## A copy keeps which bytes were written
+    overlay = PagedMemory()
+    overlay.write_word(0x20,0xFFFFFFFF)
+    overlay.update(memory.copy())
+    assert overlay.read_word(0x20) == 0xAABBCC11
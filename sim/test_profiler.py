@@ -0,0 +1,30 @@
+from profiler import SymbolTable, Profiler
+
+JAL_RA = 0x000000EF   # jal ra, 0
+RET = 0x00008067      # jalr x0, 0(ra)
+NOP = 0x00000013
+
+def test_symbol_lookup():
+    symbols = SymbolTable([(0x100,0x10,'main'),(0x0,0,'_start'),(0x200,0x8,'foo')])
+    assert symbols.lookup(0x4) == '_start'
+    assert symbols.lookup(0x10C) == 'main'
+    assert symbols.lookup(0x110) == '??'
+    assert symbols.lookup(0x204) == 'foo'
+
+def test_call_stack():
+    profiler = Profiler(SymbolTable([(0x0,0x100,'main'),(0x100,0x100,'foo'),(0x200,0x100,'bar')]))
+    trace = [
+        (0x0,NOP),
+        (0x4,JAL_RA),    # call foo
+        (0x100,JAL_RA),  # call bar
+        (0x200,NOP),
+        (0x204,RET),
+        (0x104,RET),
+        (0x8,NOP),
+    ]
+    for cycle,(pc,instruction) in enumerate(trace):
+        profiler.fetch(pc,instruction,cycle * 5)
+    profiler.fetch(0xC,NOP,35)
+    assert profiler.flat() == {'main':15,'foo':10,'bar':10}
+    assert profiler.inclusive() == {'main':35,'foo':20,'bar':10}
+    assert profiler.folded().splitlines() == ['main 15','main;foo 10','main;foo;bar 10']
@@ -0,0 +1,117 @@
+import pytest
+
+from memory import PagedMemory
+from riscv_model import Rv32iModel, LockstepChecker, IllegalInstruction
+
+def i_type(opcode, rd, funct3, rs1, imm):
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def r_type(funct7, rs2, rs1, funct3, rd):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | 0x33
+
+def s_type(funct3, rs1, rs2, imm):
+    return (((imm >> 5) & 0x7F) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | 0x23
+
+def b_type(funct3, rs1, rs2, imm):
+    return (((imm >> 12) & 1) << 31) | (((imm >> 5) & 0x3F) << 25) | (rs2 << 20) | (rs1 << 15) \
+        | (funct3 << 12) | (((imm >> 1) & 0xF) << 8) | (((imm >> 11) & 1) << 7) | 0x63
+
+def jal(rd, imm):
+    return (((imm >> 20) & 1) << 31) | (((imm >> 1) & 0x3FF) << 21) | (((imm >> 11) & 1) << 20) \
+        | (((imm >> 12) & 0xFF) << 12) | (rd << 7) | 0x6F
+
+def addi(rd, rs1, imm):
+    return i_type(0x13, rd, 0, rs1, imm)
+
+def lui(rd, imm):
+    return (imm & 0xFFFFF000) | (rd << 7) | 0x37
+
+def program(*instructions):
+    memory = PagedMemory()
+    for i, insn in enumerate(instructions):
+        memory.write_word(4 * i, insn)
+    return memory
+
+def run(model, steps):
+    for _ in range(steps):
+        model.step()
+    return model
+
+def test_alu():
+    model = run(Rv32iModel(program(
+        addi(1, 0, -5),
+        addi(2, 0, 3),
+        r_type(0x00, 2, 1, 0, 3),  # add x3, x1, x2
+        r_type(0x20, 2, 1, 0, 4),  # sub x4, x1, x2
+        r_type(0x20, 2, 1, 5, 5),  # sra x5, x1, x2
+        r_type(0x00, 2, 1, 5, 6),  # srl x6, x1, x2
+        r_type(0x00, 2, 1, 2, 7),  # slt x7, x1, x2
+        r_type(0x00, 2, 1, 3, 8),  # sltu x8, x1, x2
+        addi(0, 0, 1),
+    )), 9)
+    assert model.regs[3] == 0xFFFFFFFE
+    assert model.regs[4] == 0xFFFFFFF8
+    assert model.regs[5] == 0xFFFFFFFF
+    assert model.regs[6] == 0x1FFFFFFF
+    assert model.regs[7] == 1
+    assert model.regs[8] == 0
+    assert model.regs[0] == 0
+    assert model.rd_write is None
+    assert model.retired == 9
+
+def test_load_store():
+    model = Rv32iModel(program(
+        lui(1, 0x1000),
+        addi(2, 0, -128),
+        s_type(0, 1, 2, 1),         # sb x2, 1(x1)
+        i_type(0x03, 3, 0, 1, 1),   # lb x3, 1(x1)
+        i_type(0x03, 4, 4, 1, 1),   # lbu x4, 1(x1)
+        i_type(0x03, 5, 2, 1, 0),   # lw x5, 0(x1)
+    ))
+    run(model, 3)
+    assert model.store == (0x1000, 0x8000, 0b0010)
+    run(model, 3)
+    assert model.regs[3:6] == [0xFFFFFF80, 0x80, 0x8000]
+    assert model.rd_write == (5, 0x8000)
+
+def test_control_flow():
+    model = Rv32iModel(program(
+        addi(1, 0, 2),
+        addi(1, 1, -1),             # loop
+        b_type(1, 1, 0, -4),        # bne x1, x0, loop
+        jal(2, 8),
+        addi(3, 0, 1),              # skipped
+        i_type(0x67, 4, 0, 0, 32),  # jalr x4, 32(x0)
+    ))
+    run(model, 7)
+    assert model.regs[1] == 0
+    assert model.regs[2] == 16
+    assert model.regs[3] == 0
+    assert model.regs[4] == 24
+    assert model.pc == 32
+
+def test_self_modifying_code():
+    memory = program(addi(1, 0, 1), jal(0, -4))
+    model = Rv32iModel(memory)
+    run(model, 2)
+    model.store_word(0, addi(1, 0, 7), 0xF)
+    run(model, 1)
+    assert model.regs[1] == 7
+
+def test_illegal_instruction():
+    with pytest.raises(IllegalInstruction):
+        Rv32iModel(program(0xFFFFFFFF)).step()
+
+def test_lockstep():
+    mmio = 0x80000008
+    checker = LockstepChecker(program(
+        lui(1, 0x80000000),
+        i_type(0x03, 2, 2, 1, 8),   # lw x2, 8(x1)
+        s_type(2, 1, 2, 4),         # sw x2, 4(x1)
+    ), mmio=[mmio, 0x80000004])
+    assert checker.check_regfile_write(1, 0x80000000) is None
+    checker.observe_read(mmio, 1234)
+    assert checker.check_regfile_write(2, 1234) is None
+    mismatch = checker.check_store(0x80000004, 1235, 0xF)
+    assert "store 0x80000004 <- 0x000004D2" in mismatch
+    assert checker.checked == 3
@@ -0,0 +1,34 @@
+import cocotb_utils
+import runner
+from runner import simulator_run_opts, waves_window, waves_window_module
+from sim_config import common_run_opts, hdl_memory_run_opts
+
+def test_hdl_memory_plus_args(monkeypatch):
+    monkeypatch.setenv("HDL_MEMORY","1")
+    ## Unit tests run on Copperv2 with the Python memory
+    assert "+hdl_memory" not in simulator_run_opts(**common_run_opts).get('plus_args',[])
+    plus_args = simulator_run_opts(**hdl_memory_run_opts,plus_args=["+latency=2"])['plus_args']
+    assert plus_args[0] == "+latency=2"
+    assert plus_args[-2:] == ["+hdl_memory","+HEX_FILE=memory.hex"]
+
+def test_waves_trigger(tmp_path, monkeypatch):
+    now = [0]
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("WAVES_WINDOW",raising=False)
+    monkeypatch.setenv("WAVES_WINDOW_CYCLES","10")
+    monkeypatch.setattr(cocotb_utils,'_waves_triggered',False)
+    monkeypatch.setattr(cocotb_utils,'get_sim_time',lambda unit: now[0])
+    monkeypatch.setattr(cocotb_utils,'get_sim_steps',lambda period,unit: period)
+    monkeypatch.setattr(cocotb_utils,'get_time_from_sim_steps',lambda steps,unit: steps)
+    ## Batch of programs, the second one fails
+    for time,failure in [(1000,False),(2000,True),(3000,False)]:
+        now[0] = time
+        cocotb_utils.record_waves_trigger("pass_fail_write",failure=failure)
+    assert waves_window(tmp_path) == (1900,2100)
+
+def test_waves_window_module(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner,'build_dir',tmp_path)
+    path = waves_window_module("Copperv2")
+    assert waves_window_module("Copperv2") == path
+    assert "$dumpvars(0, Copperv2);" in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
@@ -0,0 +1,40 @@
+import pytest
+
+import cocotb_utils
+from scoreboard import CompletionScoreboard
+
+class FakeDut:
+    _name = "dut"
+
+class FakeMonitor:
+    def __init__(self, name):
+        self.name = name
+        self.callbacks = []
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+    def receive(self, transaction):
+        for callback in self.callbacks:
+            callback(transaction)
+
+@pytest.fixture(autouse=True)
+def no_waves_trigger(monkeypatch):
+    ## The waves trigger needs the simulation time
+    monkeypatch.setattr(cocotb_utils,'_waves_triggered',True)
+
+def test_mismatch_without_fail_fast():
+    scoreboard = CompletionScoreboard(FakeDut(),fail_fast=False)
+    monitor = FakeMonitor("bus_dr")
+    scoreboard.add_interface(monitor,[1,2])
+    monitor.receive(1)
+    scoreboard.check()
+    monitor.receive(3)
+    assert scoreboard.drained.is_set()
+    with pytest.raises(AssertionError,match="1 mismatches"):
+        scoreboard.check()
+
+def test_mismatch_fail_fast():
+    scoreboard = CompletionScoreboard(FakeDut())
+    monitor = FakeMonitor("bus_dr")
+    scoreboard.add_interface(monitor,[1])
+    with pytest.raises(AssertionError,match="bus_dr mismatch"):
+        monitor.receive(2)
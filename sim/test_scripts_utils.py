@@ -0,0 +1,131 @@
+from pathlib import Path
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0,str(Path(__file__).resolve().parent.parent/'scripts'))
+import utils
+
+def test_hex_round_trip(tmp_path):
+    path = tmp_path/'test.hex'
+    runs = [(0x0,bytes(range(20))),(0x100,b'\xde\xad\xbe\xef')]
+    utils.write_verilog_hex(path,runs)
+    lines = path.read_text().splitlines()
+    assert lines[0] == '@0'
+    assert lines[1] == '00 01 02 03 04 05 06 07 08 09 0A 0B 0C 0D 0E 0F'
+    assert lines[3] == '@100'
+    assert [(addr,bytes(data)) for addr,data in utils.iter_verilog_hex(path)] == runs
+
+def test_hex_chunks(tmp_path):
+    path = tmp_path/'test.hex'
+    utils.write_verilog_hex(path,[(0x10,bytes(range(64)))])
+    chunks = list(utils.iter_verilog_hex(path,chunk_size=16))
+    assert [(addr,len(data)) for addr,data in chunks] == [(0x10,16),(0x20,16),(0x30,16),(0x40,16)]
+    assert b''.join(data for _,data in chunks) == bytes(range(64))
+
+def test_hex_address_lines(tmp_path):
+    path = tmp_path/'test.hex'
+    path.write_text('@10 01 02\n03\n@20 4 05\n')
+    assert [(addr,bytes(data)) for addr,data in utils.iter_verilog_hex(path)] == [(0x10,b'\x01\x02\x03'),(0x20,b'\x04\x05')]
+
+@pytest.mark.parametrize("text",['DEADBEEF\n','@0 DEADBEEF\n'])
+def test_hex_wide_token(tmp_path, text):
+    path = tmp_path/'test.hex'
+    path.write_text(text)
+    with pytest.raises(ValueError,match="one byte per address"):
+        list(utils.iter_verilog_hex(path))
+
+def test_zero_runs():
+    assert list(utils.zero_runs([(0x100,5),(0x0,3)],chunk_size=4)) == [(0x0,bytes(3)),(0x100,bytes(4)),(0x104,bytes(1))]
+
+def test_memory_zeros(tmp_path):
+    mem = utils.Memory()
+    mem.insert(0x0,b'\x01\x02')
+    mem.insert(0x2,b'\x03')
+    mem.insert_zeros(0x8,4)
+    mem.insert(0x10,b'\x04')
+    assert [(addr,bytes(data)) for addr,data in mem.runs()] == [(0x0,b'\x01\x02\x03'),(0x8,bytes(4)),(0x10,b'\x04')]
+    path = tmp_path/'test.hex'
+    mem.write_verilog_hex(path)
+    assert path.read_text().splitlines() == ['@0','01 02 03','@8','00 00 00 00','@10','04']
+    assert [(addr,bytes(data)) for addr,data in utils.parse_verilog_hex(path).runs()] == \
+        [(0x0,b'\x01\x02\x03'),(0x8,bytes(4)),(0x10,b'\x04')]
+
+@pytest.mark.parametrize("insn,expected",[
+    (0x0000006f,'jal\tzero,100 <_start>'),
+    (0x008000ef,'jal\tra,108'),
+    (0xfe000ee3,'beq\tzero,zero,fc'),
+    (0x00b51463,'bne\ta0,a1,108'),
+    (0x00251513,'slli\ta0,a0,0x2'),
+    (0x0105d593,'srli\ta1,a1,0x10'),
+    (0x41f55513,'srai\ta0,a0,0x1f'),
+    (0xb0002573,'csrrs\ta0,0xb00,zero'),
+    (0x30551073,'csrrw\tzero,0x305,a0'),
+    (0x30045073,'csrrwi\tzero,0x300,8'),
+    (0x12345537,'lui\ta0,0x12345'),
+    (0xffffffff,'.word\t0xffffffff'),
+])
+def test_disassemble(insn, expected):
+    assert utils.disassemble(insn,0x100,{0x100:'_start'}.get) == expected
+
+elf_header = struct.Struct('<16sHHIIIIIHHHHHH')
+program_header = struct.Struct('<8I')
+section_header = struct.Struct('<10I')
+
+def make_elf(path):
+    """ELF32 with .text at 0x0 and .data and .bss linked at 0x1000 but loaded at 0x100."""
+    text = bytes.fromhex('130000006f000000')
+    data = bytes.fromhex('44332211')
+    names = b'\0.text\0.data\0.bss\0.shstrtab\0'
+    phoff = elf_header.size
+    text_offset = phoff + 2*program_header.size
+    data_offset = text_offset + len(text)
+    names_offset = data_offset + len(data)
+    shoff = names_offset + len(names)
+    segments = [
+        (1,text_offset,0x0,0x0,len(text),len(text),5,4),
+        (1,data_offset,0x1000,0x100,len(data),0x18,6,4),
+    ]
+    sections = [
+        (0,)*10,
+        (names.index(b'.text'),1,6,0x0,text_offset,len(text),0,0,4,0),
+        (names.index(b'.data'),1,3,0x1000,data_offset,len(data),0,0,4,0),
+        (names.index(b'.bss'),8,3,0x1010,names_offset,8,0,0,4,0),
+        (names.index(b'.shstrtab'),3,0,0,names_offset,len(names),0,0,1,0),
+    ]
+    ident = b'\x7fELF\x01\x01\x01' + bytes(9)
+    header = elf_header.pack(ident,2,0xF3,1,0,phoff,shoff,0,elf_header.size,program_header.size,len(segments),
+        section_header.size,len(sections),len(sections) - 1)
+    path.write_bytes(header + b''.join(program_header.pack(*s) for s in segments) + text + data + names
+        + b''.join(section_header.pack(*s) for s in sections))
+    return path
+
+def test_elf_hex(tmp_path):
+    elf = make_elf(tmp_path/'test.elf')
+    with elf.open('rb') as f:
+        elffile = utils.ELFFile(f)
+        utils.write_elf_hex(elffile,tmp_path/'test.hex')
+        utils.write_elf_hex(elffile,tmp_path/'test.debug_hex',zeros=False)
+    assert (tmp_path/'test.hex').read_text().splitlines() == ['@0','13 00 00 00 6F 00 00 00','@100','44 33 22 11','@110','00 00 00 00 00 00 00 00']
+    assert (tmp_path/'test.debug_hex').read_text().splitlines() == ['@0','13 00 00 00 6F 00 00 00','@100','44 33 22 11']
+
+def test_cached_artifact(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils,'cache_dir',tmp_path/'cache')
+    elf = make_elf(tmp_path/'test.elf')
+    def fail(elffile, path):
+        path.write_text('partial')
+        raise RuntimeError("generate failed")
+    with pytest.raises(RuntimeError):
+        utils.cached_artifact(elf,'.hex',fail)
+    assert list((tmp_path/'cache').iterdir()) == []
+    path = utils.cached_artifact(elf,'.hex',utils.write_elf_hex)
+    assert path.read_text().startswith('@0')
+    assert utils.cached_artifact(elf,'.hex',fail) == path
+    ## Only the most recently used entries are kept
+    monkeypatch.setattr(utils,'cache_entries',2)
+    os.utime(path,(0,0))
+    utils.cached_artifact(elf,'.debug_hex',lambda elffile, path: utils.write_elf_hex(elffile,path,zeros=False))
+    utils.cached_artifact(elf,'.diss',lambda elffile, path: path.write_text(utils.disassembly(elffile)))
+    assert sorted(p.suffix for p in (tmp_path/'cache').iterdir()) == ['.debug_hex','.diss']
@@ -5,13 +5,16 @@ from textwrap import dedent
 from cocotb.log import SimLog
 
 import pytest
-from cocotb_test.simulator import run
 
-from cocotb_utils import Bfm
+from runner import run_test
+
+from cocotb_utils import Bfm, ClockSampler
 
 import cocotb
-from cocotb.triggers import Join, RisingEdge
-from bus import ReadyValidBfm
+from cocotb.triggers import Join, RisingEdge, ClockCycles
+from cocotb.utils import get_sim_time
+from cocotb.clock import Clock
+from bus import ReadyValidBfm, BusMonitor, BusReadTransaction
 from cocotb_utils import anext
 from wishbone import WishboneBfm
 
@@ -66,6 +69,30 @@ def wishbone_rtl():
     print("Generated",rtl)
     return rtl
 
+@pytest.fixture
+def wishbone_pipelined_rtl():
+    rtl = work_dir/"wishbone_pipelined.v"
+    rtl.write_text(dedent("""
+    `timescale 1ns/1ps
+    module top(
+        output clock,
+        output reset,
+        output [7:0] adr,
+        output [7:0] datwr,
+        output [7:0] datrd,
+        output we,
+        output cyc,
+        output stb,
+        output ack,
+        output stall,
+        output sel
+    );
+    initial #1000;
+    endmodule
+    """))
+    print("Generated",rtl)
+    return rtl
+
 @pytest.fixture
 def fake_signals():
     return Bfm.make_signals("FakeSignals",["a","b"],optional=["c"])
@@ -88,15 +115,41 @@ async def run_ready_valid_bfm_test(dut):
     await RisingEdge(dut.clock)
 
 def test_ready_valid(ready_valid_rtl):
-    run(
+    run_test(
         verilog_sources=[ready_valid_rtl],
         toplevel="top",
         module="test_testbench",
-        waves = True,
-        sim_build=work_dir/'test_ready_valid',
+        work_dir=work_dir/'test_ready_valid',
         testcase = "run_ready_valid_bfm_test",
     )
 
+@cocotb.test(timeout_time=10,timeout_unit="us")
+async def run_ready_valid_bfm_event_driven_test(dut):
+    """ ready/valid BFM event driven receive test """
+    reference = 45
+    idle_cycles = 100
+    signals = ReadyValidBfm.Signals(ready = dut.ready, valid = dut.valid)
+    payload = dict(data = dut.data)
+    bfm = ReadyValidBfm(dut.clock,signals,payload,reset=dut.reset,init_valid=True,event_driven=True)
+    bfm.start_clock()
+    await bfm.reset()
+    await bfm.drive_ready(1)
+    recv_task = cocotb.start_soon(anext(bfm.recv_payload()))
+    await ClockCycles(dut.clock,idle_cycles)
+    await bfm.send_payload(data=reference)
+    received = await Join(recv_task)
+    assert received['data'] == reference
+    assert bfm.wakeups < 10, f"Too many wakeups while idle: {bfm.wakeups}"
+
+def test_ready_valid_event_driven(ready_valid_rtl):
+    run_test(
+        verilog_sources=[ready_valid_rtl],
+        toplevel="top",
+        module="test_testbench",
+        work_dir=work_dir/'test_ready_valid_event_driven',
+        testcase = "run_ready_valid_bfm_event_driven_test",
+    )
+
 def test_signals_dataclass_required(fake_signals):
     foo = fake_signals(a=1,b=2)
     assert foo.a == 1
@@ -166,22 +219,87 @@ async def run_wishbone_bfm_write_test(dut):
     await Join(reply_task)
     await RisingEdge(dut.clock)
 
+@cocotb.test(timeout_time=10,timeout_unit="us")
+async def run_wishbone_bfm_pipelined_test(dut):
+    """ Wishbone BFM pipelined burst test """
+    bfm = WishboneBfm(dut.clock,entity=dut,reset=dut.reset,pipelined=True)
+    bfm.start_clock()
+    bfm.sink_init()
+    bfm.source_init()
+    await bfm.reset()
+    memory = {}
+    def handler(request):
+        if 'data' in request:
+            memory[request['addr']] = request['data']
+            return None
+        return memory.get(request['addr'],0)
+    ## Wait states and stalls
+    sink_task = cocotb.start_soon(bfm.sink_serve(handler,latency=3,stall=lambda cycle: cycle % 5 == 0))
+    await bfm.source_write_burst(0x10,range(1,9),stride=1)
+    assert await bfm.source_read_burst(0x10,8,stride=1) == list(range(1,9))
+    assert await bfm.source_burst([dict(addr=0x10,data=42),dict(addr=0x10),dict(addr=0x11)]) == [None,42,2]
+    sink_task.kill()
+    ## Back to back, one transfer per cycle
+    cocotb.start_soon(bfm.sink_serve(handler,latency=1))
+    start = get_sim_time('ns')
+    assert await bfm.source_read_burst(0x10,8,stride=1) == [42,*range(2,9)]
+    cycles = (get_sim_time('ns') - start) // bfm.period
+    assert cycles <= 8 + 3
+
+class ScriptedEvents:
+    """Sampler BFM returning a list of events per clock edge."""
+    def __init__(self, edges):
+        self.edges = iter(edges)
+    def sample_events(self):
+        return next(self.edges,[])
+
+@cocotb.test(timeout_time=10,timeout_unit="us")
+async def run_bus_monitor_orphan_response_test(dut):
+    """ A response without request is dropped, the sampler keeps running """
+    cocotb.start_soon(Clock(dut.clock,10,"ns").start())
+    sampler = ClockSampler(dut.clock,[ScriptedEvents([
+        [("dr_data",dict(data=1))],
+        [("dr_addr",dict(addr=4))],
+        [("dr_data",dict(data=2))],
+    ])])
+    received = []
+    monitor = BusMonitor("bus_dr",BusReadTransaction,"dr_addr","dr_data",callback=received.append,sampler=sampler)
+    await ClockCycles(dut.clock,5)
+    assert monitor.dropped_responses == 1
+    assert [(t.addr,t.data) for t in received] == [(4,2)]
+
 def test_wishbone_read(wishbone_rtl):
-    run(
+    run_test(
         verilog_sources=[wishbone_rtl],
         toplevel="top",
         module="test_testbench",
-        waves = True,
-        sim_build=work_dir/'test_wishbone_read',
+        work_dir=work_dir/'test_wishbone_read',
         testcase = "run_wishbone_bfm_read_test",
     )
 
 def test_wishbone_write(wishbone_rtl):
-    run(
+    run_test(
         verilog_sources=[wishbone_rtl],
         toplevel="top",
         module="test_testbench",
-        waves = True,
-        sim_build=work_dir/'test_wishbone_write',
+        work_dir=work_dir/'test_wishbone_write',
         testcase = "run_wishbone_bfm_write_test",
     )
+
+def test_wishbone_pipelined(wishbone_pipelined_rtl):
+    run_test(
+        verilog_sources=[wishbone_pipelined_rtl],
+        toplevel="top",
+        module="test_testbench",
+        work_dir=work_dir/'test_wishbone_pipelined',
+        testcase = "run_wishbone_bfm_pipelined_test",
+    )
+
+def test_bus_monitor_orphan_response(ready_valid_rtl):
+    run_test(
+        verilog_sources=[ready_valid_rtl],
+        toplevel="top",
+        module="test_testbench",
+        work_dir=work_dir/'test_bus_monitor_orphan_response',
+        testcase = "run_bus_monitor_orphan_response_test",
+    )
@@ -0,0 +1,51 @@
+import io
+
+from commit_trace import CommitTrace
+from transaction_trace import TraceRecorder, channel_ids
+from trace_diff import parse_commit, read_commits, diff
+
+def test_parse_commit():
+    commit = parse_commit("core   0: 3 0x80000010 (0x00a12223) x0  0x00000001 c768_mstatus 0x00000000 mem 0x80000006 0x1234")
+    assert (commit.pc,commit.insn) == (0x80000010,0x00a12223)
+    assert commit.regfile_write is None
+    assert (commit.bus_write.addr,commit.bus_write.data,commit.bus_write.strobe) == (0x80000004,0x12340000,0b1100)
+    ## Disassembly lines of spike -l are not commits
+    assert parse_commit("core   0: 0x80000010 (0x00a12223) sw a0, 4(sp)") is None
+
+def test_transaction_trace(tmp_path):
+    path = tmp_path/'test.trace'
+    recorder = TraceRecorder(path)
+    recorder.append(0,channel_ids['bus_ir'],addr=0x0,data=0x00500513)
+    recorder.append(3,channel_ids['regfile_write'],rd=10,data=5)
+    recorder.append(4,channel_ids['bus_ir'],addr=0x4,data=0x00a00323)
+    recorder.append(6,channel_ids['bus_dw'],addr=0x4,data=0x00050000,strobe=0b0100)
+    recorder.close()
+    commits = list(read_commits(path))
+    assert [c.line for c in commits] == [
+        "core   0: 3 0x00000000 (0x00500513) x10 0x00000005",
+        "core   0: 3 0x00000004 (0x00a00323) mem 0x00000006 0x05",
+    ]
+    assert commits[1] == parse_commit(commits[1].line)
+
+def write_log(path, values):
+    trace = CommitTrace(path)
+    for i,value in enumerate(values):
+        trace.fetch(4*i,0x00000513)
+        trace.regfile_write(10,value)
+    trace.close()
+
+def test_diff(tmp_path):
+    write_log(tmp_path/'a.commit.gz',range(20))
+    write_log(tmp_path/'b.commit',[*range(10),99,*range(11,15)])
+    out = io.StringIO()
+    assert diff(read_commits(tmp_path/'a.commit.gz'),read_commits(tmp_path/'b.commit'),context=2,out=out) == 10
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "Traces diverge at instruction 10"
+    assert lines[1].split()[0] == '8' and lines[2].split()[0] == '9'
+    assert lines[3].startswith("  a         10") and lines[4].startswith("  b         10")
+    assert "regfile_write" in lines[5]
+    assert len(lines) == 10
+    assert diff(read_commits(tmp_path/'a.commit.gz',skip=2),read_commits(tmp_path/'b.commit',start_pc=0x8),limit=8,out=io.StringIO()) is None
+    ## The shorter trace ends first
+    assert diff(read_commits(tmp_path/'a.commit.gz'),read_commits(tmp_path/'b.commit'),limit=10,out=io.StringIO()) is None
+    assert diff(read_commits(tmp_path/'a.commit.gz',skip=11),read_commits(tmp_path/'b.commit',skip=11),out=io.StringIO()) == 4
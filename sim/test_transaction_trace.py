@@ -0,0 +1,14 @@
+from transaction_trace import TraceRecorder, read_trace, channel_ids
+
+def test_round_trip(tmp_path):
+    path = tmp_path/'test.trace'
+    recorder = TraceRecorder(path,capacity=4)
+    for cycle in range(10):
+        recorder.append(cycle,channel_ids['bus_dw'],addr=0x80000000+cycle,data=cycle*3,strobe=0xF)
+    recorder.append(10,channel_ids['regfile_read'],data=1,data2=2,rs1=3,rs2=4)
+    recorder.close()
+    records = list(read_trace(path))
+    assert len(records) == 11
+    assert records[5] == dict(cycle=5,channel='bus_dw',addr=0x80000005,data=15,data2=0,strobe=0xF,rd=0,rs1=0,rs2=0)
+    assert records[-1]['channel'] == 'regfile_read'
+    assert (records[-1]['rs1'],records[-1]['rs2'],records[-1]['data2']) == (3,4,2)
@@ -0,0 +1,51 @@
+from wishbone import accepted_transfer
+from wb_adapter_uvm import InFlightScoreboard
+
+def make_scoreboard(name):
+    scoreboard = InFlightScoreboard(name, None)
+    scoreboard.build_phase()
+    scoreboard.now = 0
+    scoreboard.cycle = lambda: scoreboard.now
+    return scoreboard
+
+def test_accepted_transfer():
+    assert accepted_transfer(1,1,1)
+    assert not accepted_transfer(1,1,0)
+    assert not accepted_transfer(0,1,1)
+    assert accepted_transfer(1,1,0,stall=False,pipelined=True)
+    assert not accepted_transfer(1,1,0,stall=True,pipelined=True)
+
+def test_classic_transfer():
+    """A write with two wait states, stb stays high until its ack, then a read."""
+    scoreboard = make_scoreboard("classic_scoreboard")
+    write = dict(addr=0x10,data=0xCAFE,strobe=0b0011)
+    read = dict(addr=0x20)
+    scoreboard.bus_export.write(write)
+    scoreboard.bus_export.write(read)
+    wb_write = dict(addr=0x10,data=0xCAFE,sel=0b0011)
+    wb_read = dict(addr=0x20)
+    ## cyc, stb, ack and the request on the bus on every edge
+    edges = [
+        (1,1,0,wb_write),
+        (1,1,0,wb_write),
+        (1,1,1,wb_write),
+        (0,0,1,None),
+        (1,1,0,wb_read),
+        (1,1,1,wb_read),
+        (0,0,0,None),
+    ]
+    for cycle,(cyc,stb,ack,request) in enumerate(edges,1):
+        scoreboard.now = cycle
+        if accepted_transfer(cyc,stb,ack):
+            scoreboard.wb_export.write(request)
+    result = scoreboard.results()
+    assert (result['matched'],result['mismatched'],result['in_flight']) == (2,0,0)
+    assert result['latency']['histogram'] == {'3':1,'6':1}
+
+def test_mismatch():
+    scoreboard = make_scoreboard("mismatch_scoreboard")
+    scoreboard.bus_export.write(dict(addr=0x10))
+    scoreboard.wb_export.write(dict(addr=0x14))
+    scoreboard.wb_export.write(dict(addr=0x10))
+    result = scoreboard.results()
+    assert (result['matched'],result['mismatched']) == (0,2)
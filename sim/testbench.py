@@ -1,16 +1,33 @@
 import cocotb
 from cocotb.log import SimLog
-from cocotb_bus.scoreboard import Scoreboard
-from cocotb.triggers import RisingEdge, ClockCycles, Event
+from cocotb.triggers import RisingEdge, ClockCycles, Event, NextTimeStep
+from cocotb.utils import get_sim_time, get_sim_steps
 from pathlib import Path
 from tabulate import tabulate
+import atexit
+import json
 
 from bus import BusReadTransaction, BusWriteTransaction, CoppervBusBfm, BusMonitor, BusSourceDriver
 from regfile import RegFileReadMonitor, RegFileWriteMonitor, RegFileReadTransaction, RegFileWriteTransaction, RegFileBfm
-from cocotb_utils import from_array, to_bytes
-from riscv_utils import StackMonitor
+from cocotb_utils import ClockSampler, record_waves_trigger
+from scoreboard import CompletionScoreboard
+from transaction_trace import TraceRecorder, channel_ids
+from commit_trace import CommitTrace
+from riscv_model import LockstepChecker
+from cycle_accounting import CycleAccounting
+from profiler import SymbolTable, Profiler
+from latency import LatencyModel
+from bus_counters import BusCounters
 
 class Testbench():
+    """Copperv2 testbench, the bus is served from a Python memory.
+
+    With ``sampled``, the default, every monitor is fed by one ``ClockSampler``.
+    With ``sampled=False`` each channel has its own receive loop, they sleep
+    while the channel is idle with ``event_driven``. The HDL memory always uses
+    the event driven receive loops. ``wakeups`` counts the resumes of the
+    sampler or of the receive loops, whichever feed the monitors.
+    """
     def __init__(self, dut,
             test_name,
             expected_regfile_read = None,
@@ -24,6 +41,16 @@ class Testbench():
             pass_fail_values = None,
             output_address = None,
             timer_address = None,
+            stop_on_fail = True,
+            event_driven = False,
+            sampled = True,
+            cosim = None,
+            cycle_accounting = None,
+            elf = None,
+            latency = None,
+            latency_seed = None,
+            bus_counters = None,
+            hdl_memory = None,
         ):
         self.log = SimLog('cocotb.'+__name__+'.'+self.__class__.__name__)
         self.test_name = test_name
@@ -31,26 +58,45 @@ class Testbench():
         self.clock = self.dut.clk
         self.reset_n = self.dut.rst
         core = self.dut
+        ## Instruction and data memory in HDL, +hdl_memory, see copperv2_hdl_memory.v.
+        ## Only the accesses to the MMIO window reach Python.
+        if hdl_memory is None:
+            hdl_memory = 'hdl_memory' in cocotb.plusargs
+        self.hdl_memory = hdl_memory
+        if hdl_memory:
+            unsupported = [name for name in ['trace','commit_trace','cosim','profile'] if name in cocotb.plusargs]
+            if enable_self_checking or cosim or unsupported:
+                raise ValueError("Self checking, traces, cosim and profile need every bus transaction, "
+                    "they are not supported with hdl_memory")
+            core = self.dut.core
+            sampled = False
+            event_driven = True
         self.reset_n.setimmediatevalue(0)
         self.pass_fail_address = pass_fail_address
         self.pass_fail_values = pass_fail_values
+        self.stop_on_fail = stop_on_fail
+        self.test_passed = None
         self.output_address = output_address
         self.fake_uart = []
         self.timer_counter = 0
         self.timer_address = timer_address
-        if self.timer_address is not None:
+        if self.timer_address is not None and not hdl_memory:
             cocotb.fork(self.timer())
         self.end_test = Event()
         ## Process parameters
-        self.memory = {**instruction_memory,**data_memory}
+        self.memory = instruction_memory.copy()
+        self.memory.update(data_memory)
         if 'debug_test' in cocotb.plusargs:
             csv_path = Path(test_name+'_memory.csv')
             self.log.debug(f"Dumping initial memory content to {csv_path.resolve()}")
             memory = [(f'0x{k:X}',f'0x{v:X}') for k,v in self.memory.items()]
             csv_path.write_text(tabulate(memory, ['address','value'], tablefmt="plain"))
+        if hdl_memory:
+            self.hex_file = Path(cocotb.plusargs.get('HEX_FILE','memory.hex'))
+            self.load_hdl_memory()
         self.end_i_address = None
         if enable_self_checking:
-            self.end_i_address = max(instruction_memory.keys())
+            self.end_i_address = instruction_memory.high_address
             self.expected_regfile_read = [RegFileReadTransaction.from_string(t) for t in expected_regfile_read]
             self.expected_regfile_write = [RegFileWriteTransaction.from_string(t) for t in expected_regfile_write]
             self.expected_data_read = [BusReadTransaction.from_string(t) for t in expected_data_read]
@@ -60,18 +106,22 @@ class Testbench():
         #self.log.debug(f"Memory: {self.memory}")
         ## Bus functional models
         prefix = None
-        if not cocotb.plusargs.get('dut_copperv1',False):
+        if hdl_memory:
+            prefix = "mmio_"
+        elif not cocotb.plusargs.get('dut_copperv1',False):
             prefix = "bus_"
         self.bus_bfm = CoppervBusBfm(
             clock = self.clock,
             reset_n = self.reset_n,
             entity = self.dut,
-            prefix = prefix
+            prefix = prefix,
+            event_driven = event_driven,
         )
-        regfile_bfm = RegFileBfm(
+        self.regfile_bfm = regfile_bfm = RegFileBfm(
             clock = self.clock,
             reset_n = self.reset_n,
             entity = core.regfile,
+            event_driven = event_driven,
             signals = RegFileBfm.Signals(
                 rd_en = "rd_en",
                 rd_addr = "rd",
@@ -84,47 +134,259 @@ class Testbench():
                 rs2_data = "rs2_dout",
             )
         )
+        ## Memory latency and back-pressure, +latency=<spec> +latency_seed=<seed>, see latency.py
+        if latency is None:
+            latency = cocotb.plusargs.get('latency')
+        if latency_seed is None:
+            latency_seed = int(cocotb.plusargs.get('latency_seed',0))
+        self.latency = None
+        if latency:
+            self.latency = LatencyModel.parse(latency,latency_seed)
+            self.latency_spec = latency
+            self.latency_seed = latency_seed
+            self.latency_stats = dict(first=None,last=None,fetches=0)
+        ## Monitors are fed by a single sampler or by one receive loop per channel
+        self.sampler = None
+        if sampled:
+            self.sampler = ClockSampler(self.clock,[self.bus_bfm,regfile_bfm])
+            bus_channels = dict(
+                ir = ("ir_addr","ir_data"),
+                dr = ("dr_addr","dr_data"),
+                dw = ("dw_data_addr","dw_resp"),
+            )
+        else:
+            bus_channels = dict(
+                ir = (self.bus_bfm.ir_get_request,self.bus_bfm.ir_get_response),
+                dr = (self.bus_bfm.dr_get_request,self.bus_bfm.dr_get_response),
+                dw = (self.bus_bfm.dw_get_request,self.bus_bfm.dw_get_response),
+            )
         ## Instruction read
-        self.bus_ir_driver = BusSourceDriver("bus_ir",BusReadTransaction,self.bus_bfm.ir_send_response,self.bus_bfm.ir_drive_ready)
-        self.bus_ir_monitor = BusMonitor("bus_ir",BusReadTransaction,self.bus_bfm.ir_get_request,self.bus_bfm.ir_get_response)
-        self.bus_ir_req_monitor = BusMonitor("bus_ir_req",BusReadTransaction,self.bus_bfm.ir_get_request,
-            callback=self.memory_callback,bus_name="bus_ir")
+        self.bus_ir_driver = BusSourceDriver("bus_ir",BusReadTransaction,self.bus_bfm.ir_send_response,self.bus_bfm.ir_drive_ready,clock=self.clock)
+        self.bus_ir_monitor = BusMonitor("bus_ir",BusReadTransaction,*bus_channels['ir'],sampler=self.sampler)
+        self.bus_ir_req_monitor = BusMonitor("bus_ir_req",BusReadTransaction,bus_channels['ir'][0],
+            callback=self.memory_callback,bus_name="bus_ir",sampler=self.sampler)
         ## Data read
-        self.bus_dr_driver = BusSourceDriver("bus_dr",BusReadTransaction,self.bus_bfm.dr_send_response,self.bus_bfm.dr_drive_ready)
-        self.bus_dr_monitor = BusMonitor("bus_dr",BusReadTransaction,self.bus_bfm.dr_get_request,self.bus_bfm.dr_get_response)
-        self.bus_dr_req_monitor = BusMonitor("bus_dr_req",BusReadTransaction,self.bus_bfm.dr_get_request,
-            callback=self.memory_callback,bus_name="bus_dr")
+        self.bus_dr_driver = BusSourceDriver("bus_dr",BusReadTransaction,self.bus_bfm.dr_send_response,self.bus_bfm.dr_drive_ready,clock=self.clock)
+        self.bus_dr_monitor = BusMonitor("bus_dr",BusReadTransaction,*bus_channels['dr'],sampler=self.sampler)
+        self.bus_dr_req_monitor = BusMonitor("bus_dr_req",BusReadTransaction,bus_channels['dr'][0],
+            callback=self.memory_callback,bus_name="bus_dr",sampler=self.sampler)
         ## Data write
-        self.bus_dw_driver = BusSourceDriver("bus_dw",BusWriteTransaction,self.bus_bfm.dw_send_response,self.bus_bfm.dw_drive_ready)
-        self.bus_dw_monitor = BusMonitor("bus_dw",BusWriteTransaction,self.bus_bfm.dw_get_request,self.bus_bfm.dw_get_response)
-        self.bus_dw_req_monitor = BusMonitor("bus_dw_req",BusWriteTransaction,self.bus_bfm.dw_get_request,
-            callback=self.memory_callback,bus_name="bus_dw")
-        ## Regfile
-        self.regfile_write_monitor = RegFileWriteMonitor("regfile_write",regfile_bfm)
-        self.regfile_read_monitor = RegFileReadMonitor("regfile_read",regfile_bfm)
-        ## Stack Monitor
-        #StackMonitor(self.regfile_write_monitor)
+        self.bus_dw_driver = BusSourceDriver("bus_dw",BusWriteTransaction,self.bus_bfm.dw_send_response,self.bus_bfm.dw_drive_ready,clock=self.clock)
+        self.bus_dw_monitor = BusMonitor("bus_dw",BusWriteTransaction,*bus_channels['dw'],sampler=self.sampler)
+        self.bus_dw_req_monitor = BusMonitor("bus_dw_req",BusWriteTransaction,bus_channels['dw'][0],
+            callback=self.memory_callback,bus_name="bus_dw",sampler=self.sampler)
+        if self.latency is not None:
+            self.start_latency_model()
+        ## Regfile, not monitored with the HDL memory
+        self.regfile_write_monitor = self.regfile_read_monitor = None
+        if not hdl_memory:
+            self.regfile_write_monitor = RegFileWriteMonitor("regfile_write",regfile_bfm,sampler=self.sampler)
+            self.regfile_read_monitor = RegFileReadMonitor("regfile_read",regfile_bfm,sampler=self.sampler)
+        ## Transaction trace, +trace or +trace=<path>
+        self.trace = None
+        if 'trace' in cocotb.plusargs:
+            trace_path = cocotb.plusargs['trace']
+            if trace_path is True:
+                trace_path = test_name + '.trace'
+            self.attach_trace(trace_path)
+        ## Spike style commit log, +commit_trace or +commit_trace=<path>
+        self.commit_trace = None
+        if 'commit_trace' in cocotb.plusargs:
+            commit_trace_path = cocotb.plusargs['commit_trace']
+            if commit_trace_path is True:
+                commit_trace_path = test_name + '.commit.gz'
+            self.attach_commit_trace(commit_trace_path)
+        ## Lockstep co-simulation with the RV32I model, +cosim
+        self.cosim = None
+        if cosim is None:
+            cosim = 'cosim' in cocotb.plusargs
+        if cosim:
+            self.bus_dr_monitor.add_callback(self.cosim_read)
+            self.regfile_write_monitor.add_callback(self.cosim_regfile_write)
+            self.bus_dw_monitor.add_callback(self.cosim_store)
+            self.start_cosim()
+        ## Cycle accounting by FSM state and instruction class, +cycle_accounting
+        self.cycle_accounting = None
+        if cycle_accounting is None:
+            cycle_accounting = 'cycle_accounting' in cocotb.plusargs
+        if cycle_accounting:
+            self.cycle_accounting = CycleAccounting(self.clock,core.control.state,self.bus_ir_monitor,sampler=self.sampler)
+        ## Handshake stall and latency counters of the bus channels, +bus_counters
+        self.bus_counters = None
+        if bus_counters is None:
+            bus_counters = 'bus_counters' in cocotb.plusargs
+        if bus_counters:
+            self.bus_counters = BusCounters.from_ready_valid(self.clock,self.bus_bfm.channels,
+                pairs=dict(ir=("ir_addr","ir_data"),dr=("dr_addr","dr_data"),dw=("dw_data_addr","dw_resp")),
+                in_reset=lambda: self.bus_bfm.in_reset,sampler=self.sampler)
+        ## Firmware profile by function, +profile, needs the ELF of the program
+        self.profiler = None
+        if elf is not None and 'profile' in cocotb.plusargs:
+            self.attach_profiler(elf)
         if enable_self_checking:
             ## Self checking
-            self.scoreboard = Scoreboard(dut)
+            self.scoreboard = CompletionScoreboard(dut,fail_fast=stop_on_fail,
+                period=self.bus_bfm.period,period_unit=self.bus_bfm.period_unit)
             self.scoreboard.add_interface(self.regfile_write_monitor, self.expected_regfile_write)
             self.scoreboard.add_interface(self.regfile_read_monitor, self.expected_regfile_read)
             self.scoreboard.add_interface(self.bus_dr_monitor, self.expected_data_read)
             self.scoreboard.add_interface(self.bus_dw_monitor, self.expected_data_write)
+    def reload(self, instruction_memory, data_memory):
+        """Load a new program, the core must be reset before running it."""
+        self.memory = instruction_memory.copy()
+        self.memory.update(data_memory)
+        if self.end_i_address is not None:
+            self.end_i_address = instruction_memory.high_address
+        self.fake_uart = []
+        self.timer_counter = 0
+        self.test_passed = None
+        self.end_test.clear()
+        self.bus_bfm.clear_responses()
+        for driver in [self.bus_ir_driver, self.bus_dr_driver, self.bus_dw_driver]:
+            driver.restart()
+        for monitor in [self.bus_ir_monitor, self.bus_dr_monitor, self.bus_dw_monitor]:
+            monitor.pending_requests.clear()
+        if self.cosim is not None:
+            self.start_cosim()
+        if self.hdl_memory:
+            self.load_hdl_memory()
+    def load_hdl_memory(self):
+        """Write the memory image to the hex file of the HDL memory and load it."""
+        self.memory.write_verilog_hex(self.hex_file)
+        self.dut.mem_load.value = 1
+        cocotb.start_soon(self._release_mem_load())
+    async def _release_mem_load(self):
+        await NextTimeStep()
+        self.dut.mem_load.value = 0
+    def start_latency_model(self):
+        drivers = dict(ir=self.bus_ir_driver,dr=self.bus_dr_driver,dw=self.bus_dw_driver)
+        for channel,driver in drivers.items():
+            backpressure = self.latency.backpressure(channel)
+            if backpressure is not None:
+                driver.start_backpressure(*backpressure)
+        ## Achieved CPI, from the first to the last fetch
+        period_steps = get_sim_steps(self.bus_bfm.period,self.bus_bfm.period_unit)
+        stats = self.latency_stats
+        def count_fetch(transaction):
+            cycle = get_sim_time() // period_steps
+            if stats['first'] is None:
+                stats['first'] = cycle
+            stats['last'] = cycle
+            stats['fetches'] += 1
+        self.bus_ir_monitor.add_callback(count_fetch)
+    def respond(self, driver, channel, transaction):
+        """Queue the response to a request, after the latency of its address."""
+        if self.latency is not None:
+            delay = self.latency.delay(channel,transaction.addr)
+            if delay > 0:
+                driver.append(("wait",delay))
+        driver.append(transaction)
+    def attach_profiler(self, elf):
+        """Attribute the cycles of every fetched instruction to the functions of elf."""
+        self.profiler = profiler = Profiler(SymbolTable.from_elf(elf))
+        period_steps = get_sim_steps(self.bus_bfm.period,self.bus_bfm.period_unit)
+        def profile_fetch(transaction):
+            profiler.fetch(transaction.addr,transaction.data,get_sim_time() // period_steps)
+        self.bus_ir_monitor.add_callback(profile_fetch)
+    def report(self):
+        """Log the end of test reports, they are also written as JSON.
+
+        The profile is written as folded stacks, flamegraph.pl turns it into a
+        flame graph, the bus counters also as CSV.
+        """
+        if self.cycle_accounting is not None:
+            self.cycle_accounting.finish()
+            self.log.info("Cycle accounting:\n%s",self.cycle_accounting.report())
+            json_path = Path(self.test_name+'_cycle_accounting.json')
+            json_path.write_text(json.dumps(self.cycle_accounting.results(),indent=2) + '\n')
+        if self.latency is not None and self.latency_stats['fetches'] > 1:
+            stats = self.latency_stats
+            cycles = stats['last'] - stats['first']
+            result = dict(latency=self.latency_spec,seed=self.latency_seed,instructions=stats['fetches'] - 1,
+                cycles=cycles,cpi=round(cycles / (stats['fetches'] - 1),4))
+            self.log.info("Latency model %s: CPI %s",self.latency_spec,result['cpi'])
+            Path(self.test_name+'_latency.json').write_text(json.dumps(result,indent=2) + '\n')
+        if self.bus_counters is not None:
+            self.log.info("Bus counters:\n%s",self.bus_counters.report())
+            self.bus_counters.write(self.test_name)
+        if self.profiler is not None:
+            self.log.info("Profile:\n%s",self.profiler.report())
+            Path(self.test_name+'.folded').write_text(self.profiler.folded())
+            json_path = Path(self.test_name+'_profile.json')
+            json_path.write_text(json.dumps(self.profiler.results(),indent=2) + '\n')
+    def start_cosim(self):
+        mmio = [a for a in [self.pass_fail_address,self.output_address,self.timer_address] if a is not None]
+        self.cosim = LockstepChecker(self.memory.copy(),mmio=mmio)
+    def cosim_read(self, transaction):
+        self.cosim.observe_read(transaction.addr,transaction.data)
+    def cosim_regfile_write(self, transaction):
+        self.cosim_check(self.cosim.check_regfile_write(transaction.reg,transaction.data))
+    def cosim_store(self, transaction):
+        self.cosim_check(self.cosim.check_store(transaction.addr,transaction.data,transaction.strobe))
+    def cosim_check(self, mismatch):
+        if mismatch is None:
+            return
+        self.log.error("Co-simulation mismatch after %d checks: %s",self.cosim.checked,mismatch)
+        record_waves_trigger("cosim_mismatch",self.bus_bfm.period,self.bus_bfm.period_unit)
+        if self.stop_on_fail:
+            assert False, f"Co-simulation mismatch: {mismatch}"
+        self.test_passed = False
+        self.end_test.set()
+    def attach_trace(self, path):
+        """Record every monitored transaction to a binary trace file, see ``transaction_trace.py``."""
+        self.trace = trace = TraceRecorder(path)
+        atexit.register(trace.close)
+        self.log.info("Recording transaction trace to %s",Path(path).resolve())
+        period_steps = get_sim_steps(self.bus_bfm.period,self.bus_bfm.period_unit)
+        append = trace.append
+        def cycle():
+            return get_sim_time() // period_steps
+        def bus_callback(channel):
+            def record(transaction):
+                append(cycle(),channel,transaction.addr or 0,transaction.data or 0,
+                    strobe=getattr(transaction,'strobe',None) or 0)
+            return record
+        def regfile_write(transaction):
+            append(cycle(),channel_ids['regfile_write'],data=transaction.data or 0,rd=transaction.reg or 0)
+        def regfile_read(transaction):
+            append(cycle(),channel_ids['regfile_read'],data=transaction.data1 or 0,data2=transaction.data2 or 0,
+                rs1=transaction.reg1 or 0,rs2=transaction.reg2 or 0)
+        self.bus_ir_monitor.add_callback(bus_callback(channel_ids['bus_ir']))
+        self.bus_dr_monitor.add_callback(bus_callback(channel_ids['bus_dr']))
+        self.bus_dw_monitor.add_callback(bus_callback(channel_ids['bus_dw']))
+        self.regfile_write_monitor.add_callback(regfile_write)
+        self.regfile_read_monitor.add_callback(regfile_read)
+    def attach_commit_trace(self, path):
+        """Write one line per retired instruction, see ``commit_trace.py``."""
+        self.commit_trace = commit_trace = CommitTrace(path)
+        atexit.register(commit_trace.close)
+        self.log.info("Recording commit trace to %s",Path(path).resolve())
+        self.bus_ir_monitor.add_callback(lambda t: commit_trace.fetch(t.addr,t.data))
+        self.regfile_write_monitor.add_callback(lambda t: commit_trace.regfile_write(t.reg,t.data))
+        self.regfile_read_monitor.add_callback(lambda t: commit_trace.regfile_read(t.reg1,t.data1))
+        self.bus_dr_monitor.add_callback(lambda t: commit_trace.load(t.addr))
+        self.bus_dw_monitor.add_callback(lambda t: commit_trace.store(t.addr,t.data,t.strobe))
+    @property
+    def wakeups(self):
+        if self.sampler is not None:
+            return {'sampler':self.sampler.wakeups}
+        return {**self.bus_bfm.channel_wakeups,'regfile':self.regfile_bfm.wakeups}
     async def timer(self):
         while True:
             await RisingEdge(self.clock)
             self.timer_counter += 1
     def memory_callback(self, transaction):
-        self.log.debug(f"Memory callback {transaction}")
+        self.log.debug("Memory callback %s",transaction)
         if isinstance(transaction,BusReadTransaction) and transaction.bus_name == 'bus_ir':
             driver_transaction = "deassert_ready"
             if self.end_i_address is None or (self.end_i_address is not None and transaction.addr < self.end_i_address):
                 driver_transaction = BusReadTransaction(
                     bus_name = transaction.bus_name,
-                    data = from_array(self.memory,transaction.addr),
+                    data = self.memory.read_word(transaction.addr),
                     addr = transaction.addr)
-            self.bus_ir_driver.append(driver_transaction)
+                self.respond(self.bus_ir_driver,'ir',driver_transaction)
+            else:
+                self.bus_ir_driver.append(driver_transaction)
             #self.log.debug('instruction_read_callback transaction: %s driver_transaction %s',
             #    transaction,driver_transaction)
         elif isinstance(transaction,BusReadTransaction) and transaction.bus_name == 'bus_dr':
@@ -133,7 +395,7 @@ class Testbench():
                 data = self.handle_data_read(transaction),
                 addr = transaction.addr,
             )
-            self.bus_dr_driver.append(driver_transaction)
+            self.respond(self.bus_dr_driver,'dr',driver_transaction)
             #self.log.debug('data_read_callback transaction: %s driver_transaction %s',
             #    transaction,driver_transaction)
         elif isinstance(transaction,BusWriteTransaction):
@@ -145,7 +407,7 @@ class Testbench():
                 strobe = transaction.strobe,
                 response = 1,
             )
-            self.bus_dw_driver.append(driver_transaction)
+            self.respond(self.bus_dw_driver,'dw',driver_transaction)
             #self.log.debug('data_write_callback transaction: %s driver_transaction %s',
             #    transaction,driver_transaction)
         else:
@@ -154,37 +416,33 @@ class Testbench():
         if self.pass_fail_address is not None and self.pass_fail_address == transaction.addr:
             if len(self.fake_uart) > 0:
                 self.log.info("Fake UART output:\n%s",''.join(self.fake_uart))
-            assert self.pass_fail_values[transaction.data] == True, "Received test fail from bus"
-            self.log.debug("Received test pass from bus")
+            passed = self.pass_fail_values[transaction.data]
+            record_waves_trigger("pass_fail_write",self.bus_bfm.period,self.bus_bfm.period_unit,failure=not passed)
+            if self.stop_on_fail:
+                assert passed == True, "Received test fail from bus"
+            self.log.debug("Received test %s from bus","pass" if passed else "fail")
+            self.test_passed = passed
             self.end_test.set()
         elif self.output_address is not None and self.output_address == transaction.addr:
             recv = chr(transaction.data)
             self.fake_uart.append(recv)
             self.log.info('Fake UART received: %s',repr(recv))
         else:
-            mask = f"{transaction.strobe:04b}"
-            #self.log.debug('write start: %X mask: %s',from_array(self.memory,transaction.addr),mask)
-            for i in range(4):
-                if int(mask[3-i]):
-                    #self.log.debug('writing %X -> %X',transaction.addr+i,to_bytes(transaction.data)[i])
-                    self.memory[transaction.addr+i] = to_bytes(transaction.data)[i]
-            #self.log.debug('write finished: %X',from_array(self.memory,transaction.addr))
+            self.memory.write_word(transaction.addr,transaction.data,transaction.strobe)
     def handle_data_read(self,transaction):
         value = None
         if self.timer_address is not None and self.timer_address == transaction.addr:
             value = self.timer_counter
+            if self.hdl_memory:
+                ## No per clock timer coroutine, the cycle count comes from the simulation time
+                value = get_sim_time() // get_sim_steps(self.bus_bfm.period,self.bus_bfm.period_unit)
         else:
-            value = from_array(self.memory,transaction.addr)
+            value = self.memory.read_word(transaction.addr)
         return value
-    @cocotb.coroutine
     async def finish(self):
-        last_pending = ""
-        while True:
-            if all([len(expected) == 0 for expected in self.scoreboard.expected.values()]):
-                break
-            pending = repr({k.name:[str(i) for i in v] for k,v in self.scoreboard.expected.items()})
-            if last_pending != pending:
-                self.log.debug(f"Pending transactions: {pending}")
-            last_pending = pending
-            await RisingEdge(self.clock)
+        """Wait until the scoreboard received every expected transaction, fail on mismatches."""
+        self.log.debug("Outstanding transactions: %s",self.scoreboard.outstanding)
+        await self.scoreboard.drained.wait()
         await ClockCycles(self.clock,2)
+        self.log.info("BFM wakeups: %s",self.wakeups)
+        self.scoreboard.check()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Find the first divergence between two instruction traces.
+
+Both traces are read one instruction at a time, only the last ``context``
+instructions are kept. A trace is either a commit log, ``commit_trace.py`` or
+``spike --log-commits`` (plain or gzip), or a binary transaction trace from
+``transaction_trace.py``. Typical uses::
+
+    spike --isa=rv32i --log-commits prog.elf 2> spike.log
+    python sim/trace_diff.py work/sim/<test>.commit.gz spike.log -start_pc 0x0
+    python sim/trace_diff.py copperv2/<test>.commit.gz copperv1/<test>.commit.gz
+
+The copperv1 trace comes from the same test run with ``+dut_copperv1``.
+Instructions match when pc, instruction, register write and data bus write
+are equal, the writes compared as ``RegFileWriteTransaction`` and
+``BusWriteTransaction``: writes to x0 are dropped and stores are compared by
+word address, lane shifted data and strobe. Load addresses are only shown.
+"""
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice, zip_longest
+from pathlib import Path
+import argparse
+import gzip
+import re
+import sys
+
+from bus import BusWriteTransaction
+from regfile import RegFileWriteTransaction
+from commit_trace import load_address, store_bytes, format_commit
+import transaction_trace
+
+_commit_line = re.compile(r'core\s+\d+:\s+\d\s+0x([0-9a-fA-F]+)\s+\(0x([0-9a-fA-F]+)\)(.*)')
+_commit_write = re.compile(r'\bx(\d+)\s+0x([0-9a-fA-F]+)|\bmem\s+0x([0-9a-fA-F]+)(?:\s+0x([0-9a-fA-F]+))?')
+
+def _same(mine, theirs):
+    ## The transactions equality does not handle None
+    if mine is None or theirs is None:
+        return mine is theirs
+    return mine == theirs
+
+@dataclass
+class Commit:
+    pc: int
+    insn: int
+    regfile_write: RegFileWriteTransaction = None
+    bus_write: BusWriteTransaction = None
+    line: str = None
+    def differences(self, other):
+        found = []
+        for name in ['pc','insn']:
+            if getattr(self,name) != getattr(other,name):
+                found.append(f"{name} 0x{getattr(self,name):08x} != 0x{getattr(other,name):08x}")
+        for name in ['regfile_write','bus_write']:
+            mine, theirs = getattr(self,name), getattr(other,name)
+            if not _same(mine,theirs):
+                found.append(f"{name} {mine} != {theirs}")
+        return found
+    def __eq__(self, other):
+        return not self.differences(other)
+
+def bus_write(addr, size, value):
+    """Data bus write of a ``size`` bytes store at a byte address."""
+    offset = addr & 3
+    return BusWriteTransaction(
+        bus_name = 'bus_dw',
+        addr = addr & ~3,
+        data = (value << (8*offset)) & 0xFFFFFFFF,
+        strobe = ((1 << size) - 1) << offset)
+
+def parse_commit(line):
+    """Commit of a ``--log-commits`` line, None for any other line."""
+    match = _commit_line.match(line.strip())
+    if match is None:
+        return None
+    commit = Commit(int(match[1],16),int(match[2],16),line=line.strip())
+    for write in _commit_write.finditer(match[3]):
+        reg, data, addr, value = write.groups()
+        if reg is not None:
+            if int(reg) != 0:
+                commit.regfile_write = RegFileWriteTransaction(int(reg),int(data,16))
+        elif value is not None:
+            commit.bus_write = bus_write(int(addr,16),len(value)//2,int(value,16))
+    return commit
+
+def log_commits(path):
+    with Path(path).open('rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    with (gzip.open(path,'rt') if compressed else Path(path).open()) as f:
+        for line in f:
+            commit = parse_commit(line)
+            if commit is not None:
+                yield commit
+
+def transaction_commits(path):
+    """Commits of a transaction trace, an instruction is complete when the next one is fetched."""
+    commit = None
+    rd = load_addr = store = rs1_data = None
+    def complete():
+        commit.line = format_commit(commit.pc,commit.insn,rd,load_addr,store)
+        return commit
+    for record in transaction_trace.read_trace(path):
+        channel = record['channel']
+        if channel == 'bus_ir':
+            if commit is not None:
+                yield complete()
+            commit = Commit(record['addr'],record['data'])
+            rd = load_addr = store = rs1_data = None
+        elif commit is None:
+            continue
+        elif channel == 'regfile_write' and record['rd'] != 0:
+            rd = (record['rd'],record['data'])
+            commit.regfile_write = RegFileWriteTransaction(*rd)
+        elif channel == 'regfile_read':
+            rs1_data = record['data']
+        elif channel == 'bus_dr':
+            load_addr = load_address(commit.insn,rs1_data,record['addr'])
+        elif channel == 'bus_dw':
+            store = store_bytes(record['addr'],record['data'],record['strobe'])
+            commit.bus_write = bus_write(*store)
+    if commit is not None:
+        yield complete()
+
+def read_commits(path, skip=0, start_pc=None):
+    """Iterate over the commits of a commit log or transaction trace.
+
+    The first ``skip`` commits are dropped, then every commit before ``start_pc``.
+    """
+    with Path(path).open('rb') as f:
+        is_trace = f.read(len(transaction_trace.magic)) == transaction_trace.magic
+    commits = transaction_commits(path) if is_trace else log_commits(path)
+    commits = islice(commits,skip,None)
+    if start_pc is not None:
+        for commit in commits:
+            if commit.pc == start_pc:
+                yield commit
+                break
+    yield from commits
+
+def diff(a, b, context=5, limit=None, out=sys.stdout):
+    """Print the first divergence of two commit iterables with ``context`` instructions around it.
+
+    Return the index of the divergent instruction or None when the traces match.
+    """
+    history = deque(maxlen=context)
+    count = 0
+    pairs = zip_longest(a,b)
+    if limit is not None:
+        pairs = islice(pairs,limit)
+    for index, (commit_a, commit_b) in enumerate(pairs):
+        if commit_a is not None and commit_b is not None and commit_a == commit_b:
+            history.append(commit_a)
+            count += 1
+            continue
+        print(f"Traces diverge at instruction {index}",file=out)
+        for i,commit in enumerate(history):
+            print(f"    {index - len(history) + i:>10} {commit.line}",file=out)
+        for name,commit in [('a',commit_a),('b',commit_b)]:
+            if commit is None:
+                print(f"  {name} {index:>10} <end of trace>",file=out)
+                continue
+            print(f"  {name} {index:>10} {commit.line}",file=out)
+        if commit_a is not None and commit_b is not None:
+            for difference in commit_a.differences(commit_b):
+                print(f"    {difference}",file=out)
+        for name,rest in [('a',a),('b',b)]:
+            for i,commit in enumerate(islice(rest,context)):
+                print(f"  {name} {index + 1 + i:>10} {commit.line}",file=out)
+        return index
+    print(f"Traces match, {count} instructions",file=out)
+    return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the first divergence between two instruction traces')
+    parser.add_argument('a',type=Path,help='Commit log or transaction trace')
+    parser.add_argument('b',type=Path,help='Commit log or transaction trace')
+    parser.add_argument('-context',type=int,default=5,help='Instructions shown around the divergence')
+    parser.add_argument('-limit',type=int,help='Compare at most this many instructions')
+    parser.add_argument('-skip_a',type=int,default=0,help='Instructions dropped from the start of a')
+    parser.add_argument('-skip_b',type=int,default=0,help='Instructions dropped from the start of b')
+    parser.add_argument('-start_pc',type=lambda x: int(x,0),help='Compare from the first instruction at this pc in both traces')
+    args = parser.parse_args()
+    a = read_commits(args.a,args.skip_a,args.start_pc)
+    b = read_commits(args.b,args.skip_b,args.start_pc)
+    if diff(a,b,args.context,args.limit) is not None:
+        sys.exit(1)
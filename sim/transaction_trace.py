@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Binary transaction trace.
+
+Records are kept in preallocated column arrays and appended to the trace file
+one chunk at a time. File layout: ``magic`` then chunks of
+``<u32 record count>`` followed by every column in ``columns`` order.
+"""
+from array import array
+from pathlib import Path
+import argparse
+import struct
+import sys
+
+magic = b'CPVTRC01'
+columns = [
+    ('cycle','Q'),
+    ('channel','B'),
+    ('addr','I'),
+    ('data','I'),
+    ('data2','I'),
+    ('strobe','B'),
+    ('rd','B'),
+    ('rs1','B'),
+    ('rs2','B'),
+]
+channels = ['bus_ir','bus_dr','bus_dw','regfile_write','regfile_read']
+channel_ids = {name:i for i,name in enumerate(channels)}
+_count = struct.Struct('<I')
+
+class TraceRecorder:
+    def __init__(self, path, capacity=1 << 16):
+        self.path = Path(path)
+        self.capacity = capacity
+        self.columns = [array(typecode,bytes(capacity*array(typecode).itemsize)) for _,typecode in columns]
+        self.size = 0
+        self.file = self.path.open('wb')
+        self.file.write(magic)
+    def append(self, cycle, channel, addr=0, data=0, data2=0, strobe=0, rd=0, rs1=0, rs2=0):
+        i = self.size
+        cols = self.columns
+        cols[0][i] = cycle
+        cols[1][i] = channel
+        cols[2][i] = addr
+        cols[3][i] = data
+        cols[4][i] = data2
+        cols[5][i] = strobe
+        cols[6][i] = rd
+        cols[7][i] = rs1
+        cols[8][i] = rs2
+        self.size = i + 1
+        if self.size == self.capacity:
+            self.flush()
+    def flush(self):
+        if self.file is None or self.size == 0:
+            return
+        self.file.write(_count.pack(self.size))
+        for column in self.columns:
+            self.file.write(memoryview(column)[:self.size].cast('B'))
+        self.size = 0
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+def read_trace(path):
+    """Iterate over the records of a trace file as dicts."""
+    names = [name for name,_ in columns]
+    with Path(path).open('rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"Not a trace file: {path}")
+        while True:
+            header = f.read(_count.size)
+            if len(header) < _count.size:
+                return
+            count, = _count.unpack(header)
+            chunk = []
+            for _,typecode in columns:
+                column = array(typecode)
+                column.frombytes(f.read(count*column.itemsize))
+                chunk.append(column)
+            for values in zip(*chunk):
+                record = dict(zip(names,values))
+                record['channel'] = channels[record['channel']]
+                yield record
+
+def format_record(record):
+    channel = record['channel']
+    prefix = f"{record['cycle']:>10} {channel:<14}"
+    if channel == 'regfile_write':
+        return f"{prefix} x{record['rd']} <- 0x{record['data']:08X}"
+    if channel == 'regfile_read':
+        return f"{prefix} x{record['rs1']} = 0x{record['data']:08X} x{record['rs2']} = 0x{record['data2']:08X}"
+    if channel == 'bus_dw':
+        return f"{prefix} addr 0x{record['addr']:08X} data 0x{record['data']:08X} strobe 0b{record['strobe']:04b}"
+    return f"{prefix} addr 0x{record['addr']:08X} data 0x{record['data']:08X}"
+
+def query(trace, channel=None, addr=None, reg=None, start=None, end=None, limit=None):
+    found = 0
+    for record in read_trace(trace):
+        if start is not None and record['cycle'] < start:
+            continue
+        if end is not None and record['cycle'] > end:
+            break
+        if channel is not None and record['channel'] not in channel:
+            continue
+        if addr is not None and (not record['channel'].startswith('bus') or record['addr'] != addr):
+            continue
+        if reg is not None and reg not in (record['rd'],record['rs1'],record['rs2']):
+            continue
+        print(format_record(record))
+        found += 1
+        if limit is not None and found >= limit:
+            break
+
+def stats(trace):
+    counts = {}
+    last_cycle = 0
+    for record in read_trace(trace):
+        counts[record['channel']] = counts.get(record['channel'],0) + 1
+        last_cycle = record['cycle']
+    for channel,count in counts.items():
+        print(f"{channel:<14} {count}")
+    print(f"{'last cycle':<14} {last_cycle}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query binary transaction traces')
+    subparsers = parser.add_subparsers()
+    parser_query = subparsers.add_parser('query')
+    parser_query.add_argument('trace',type=Path)
+    parser_query.add_argument('-channel',choices=channels,action='append')
+    parser_query.add_argument('-addr',type=lambda x: int(x,0))
+    parser_query.add_argument('-reg',type=int)
+    parser_query.add_argument('-start',type=int,help='First cycle')
+    parser_query.add_argument('-end',type=int,help='Last cycle')
+    parser_query.add_argument('-limit',type=int)
+    parser_query.set_defaults(func=query)
+    parser_stats = subparsers.add_parser('stats')
+    parser_stats.add_argument('trace',type=Path)
+    parser_stats.set_defaults(func=stats)
+    args = parser.parse_args()
+    if len(vars(args)) == 0:
+        parser.print_usage()
+        sys.exit(1)
+    args_dict = dict(vars(args))
+    args_dict.pop('func')
+    args.func(**args_dict)
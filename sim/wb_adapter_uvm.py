@@ -1,10 +1,15 @@
+from collections import Counter, deque
+from pathlib import Path
+import json
 import logging
 from typing import Awaitable
 import cocotb
 from cocotb.decorators import RunningTask
-from cocotb.triggers import First, PythonTrigger
+from cocotb.triggers import ClockCycles, First, PythonTrigger, RisingEdge
+from cocotb.utils import get_sim_time
 import pyuvm as uvm
 import random
+from tabulate import tabulate
 
 from cocotb_utils import anext
 
@@ -31,11 +36,15 @@ class BusSeqItem(uvm.uvm_sequence_item):
         if self.strobe is not None:
             res += f'strobe: 0b{self.strobe:0{self.strobe_width}b}'
         return res
-    def randomize(self):
-        self.addr = random.randint(0, (2**self.addr_width)-1)
-        if random.choice([False,True]):
-            self.data = random.randint(0, (2**self.data_width)-1)
-            self.strobe = random.randint(0, (2**self.strobe_width)-1)
+    def randomize(self, rng=random, read_ratio=0.5, addr_range=None):
+        """Random read or write, word aligned below ``addr_range`` when it is given."""
+        if addr_range is None:
+            self.addr = rng.randint(0, (2**self.addr_width)-1)
+        else:
+            self.addr = rng.randrange(0, addr_range, self.data_width // 8)
+        if rng.random() >= read_ratio:
+            self.data = rng.randint(0, (2**self.data_width)-1)
+            self.strobe = rng.randint(0, (2**self.strobe_width)-1)
 
 class BusSeq(uvm.uvm_sequence):
     async def body(self):
@@ -45,6 +54,22 @@ class BusSeq(uvm.uvm_sequence):
             bus_tr.randomize()
             await self.finish_item(bus_tr)
 
+class StressSeq(uvm.uvm_sequence):
+    """``items`` back to back random reads and writes from a seeded generator."""
+    def __init__(self, name, items, seed=0, read_ratio=0.5, addr_range=1 << 16):
+        super().__init__(name)
+        self.items = items
+        self.seed = seed
+        self.read_ratio = read_ratio
+        self.addr_range = addr_range
+    async def body(self):
+        rng = random.Random(self.seed)
+        for i in range(self.items):
+            bus_tr = BusSeqItem("bus_tr")
+            await self.start_item(bus_tr)
+            bus_tr.randomize(rng,self.read_ratio,self.addr_range)
+            await self.finish_item(bus_tr)
+
 class BusDriver(uvm.uvm_driver):
     def connect_phase(self):
         self.bfm = self.cdb_get("BUS_BFM")
@@ -55,7 +80,7 @@ class BusDriver(uvm.uvm_driver):
                 await self.bfm['read'].addr.send(addr=transaction.addr)
             else:
                 await self.bfm['write'].req.send(addr=transaction.addr,data=transaction.data,strobe=transaction.strobe)
-            self.logger.debug(f"Sent transaction: {transaction}")
+            self.logger.debug("Sent transaction: %s",transaction)
             self.seq_item_port.item_done()
 
 class Coverage(uvm.uvm_subscriber):
@@ -94,6 +119,94 @@ class Scoreboard(uvm.uvm_component):
                     self.logger.error(f"FAILED: {ref} != {actual_result}")
                     assert False
 
+def stress_key(datum):
+    """Request fields seen on both sides, the bus strobe is the Wishbone sel."""
+    return datum['addr'], datum.get('data'), datum.get('strobe',datum.get('sel'))
+
+class StressInput(uvm.uvm_subscriber):
+    def write(self, datum):
+        self.get_parent().arrived(self.get_name(),datum)
+
+class InFlightScoreboard(uvm.uvm_component):
+    """Compares every Wishbone request with the oldest bus request when it arrives.
+
+    Only the requests in flight through the adapter are kept, matched ones are
+    dropped and counted in the latency histogram, in cycles.
+    """
+    def build_phase(self):
+        self.bus_input = StressInput("bus", self)
+        self.wb_input = StressInput("wb", self)
+        self.bus_export = self.bus_input.analysis_export
+        self.wb_export = self.wb_input.analysis_export
+        self.in_flight = deque()
+        self.latency = Counter()
+        self.matched = 0
+        self.mismatched = 0
+        self.first_cycle = None
+        self.last_cycle = None
+    def connect_phase(self):
+        bfm = self.cdb_get("WB_BFM")
+        self.period = bfm.period
+        self.period_unit = bfm.period_unit
+    def cycle(self):
+        return get_sim_time(self.period_unit) // self.period
+    def arrived(self, side, datum):
+        cycle = self.cycle()
+        if side == "bus":
+            if self.first_cycle is None:
+                self.first_cycle = cycle
+            self.in_flight.append((stress_key(datum),cycle))
+            return
+        self.last_cycle = cycle
+        if not self.in_flight:
+            self.mismatched += 1
+            self.logger.error("Wishbone request %s had no bus request",datum)
+            return
+        expected, issued = self.in_flight.popleft()
+        if stress_key(datum) != expected:
+            self.mismatched += 1
+            self.logger.error("FAILED: %s != %s",expected,stress_key(datum))
+            return
+        self.matched += 1
+        self.latency[cycle - issued] += 1
+    def results(self):
+        cycles = 0 if self.first_cycle is None else self.last_cycle - self.first_cycle + 1
+        result = dict(
+            matched = self.matched,
+            mismatched = self.mismatched,
+            in_flight = len(self.in_flight),
+            cycles = cycles,
+            transactions_per_cycle = round(self.matched / cycles,4) if cycles else None,
+        )
+        if self.matched:
+            latencies = sorted(self.latency.items())
+            def percentile(p):
+                seen = 0
+                for latency,count in latencies:
+                    seen += count
+                    if seen >= p * self.matched:
+                        return latency
+            result['latency'] = dict(
+                min = latencies[0][0],
+                mean = round(sum(l*c for l,c in latencies) / self.matched,3),
+                p50 = percentile(0.5),
+                p90 = percentile(0.9),
+                p99 = percentile(0.99),
+                max = latencies[-1][0],
+                histogram = {str(l):c for l,c in latencies},
+            )
+        return result
+    def check_phase(self):
+        if self.mismatched or self.in_flight:
+            self.logger.error("%d mismatched and %d unmatched requests",self.mismatched,len(self.in_flight))
+            assert False
+    def report_phase(self):
+        result = self.results()
+        Path('wishbone_stress.json').write_text(json.dumps(result,indent=2) + '\n')
+        summary = [[k,v] for k,v in result.items() if k != 'latency']
+        summary += [[f"latency {k}",v] for k,v in result.get('latency',{}).items() if k != 'histogram']
+        self.logger.info("Stress results:\n%s",tabulate(summary))
+
 class WbMonitor(uvm.uvm_component):
     def __init__(self, name, parent):
         super().__init__(name, parent)
@@ -102,8 +215,8 @@ class WbMonitor(uvm.uvm_component):
     def connect_phase(self):
         self.bfm = self.cdb_get("WB_BFM")
     async def run_phase(self):
-        while True:
-            datum = await anext(self.bfm.sink_receive())
+        ## One generator, every transfer is written once when it is accepted
+        async for datum in self.bfm.accepted():
             self.ap.write(datum)
 
 class BusMonitor(uvm.uvm_component):
@@ -145,3 +258,46 @@ class WbAdapterTest(uvm.uvm_test):
     def end_of_elaboration_phase(self):
         self.set_logging_level_hier(logging.DEBUG)
 
+class WbAdapterStressEnv(uvm.uvm_env):
+    def build_phase(self):
+        self.wb_mon = WbMonitor("wb_mon", self)
+        self.bus_mon = BusMonitor("bus_mon", self)
+        self.scoreboard = InFlightScoreboard("scoreboard", self)
+        self.driver = BusDriver("driver", self)
+        self.seqr = uvm.uvm_sequencer("seqr", self)
+        uvm.ConfigDB().set(None, "*", "SEQR", self.seqr)
+    def connect_phase(self):
+        self.bus_mon.ap.connect(self.scoreboard.bus_export)
+        self.wb_mon.ap.connect(self.scoreboard.wb_export)
+        self.driver.seq_item_port.connect(self.seqr.seq_item_export)
+
+class WbAdapterStressTest(uvm.uvm_test):
+    """Long random run, STRESS in the ConfigDB holds the ``StressSeq`` arguments.
+
+    The run stops after ``drain_cycles`` when bus requests were sent and no
+    Wishbone request came out of the adapter.
+    """
+    drain_cycles = 1000
+    def build_phase(self):
+        self.env = WbAdapterStressEnv.create("env", self)
+    async def run_phase(self):
+        self.raise_objection()
+        seqr = uvm.ConfigDB().get(self, "", "SEQR")
+        stress = uvm.ConfigDB().get(self, "", "STRESS")
+        clock = uvm.ConfigDB().get(self, "", "WB_BFM").clock
+        seq = StressSeq("stress_seq", **stress)
+        task = cocotb.start_soon(seq.start(seqr))
+        await First(task, ClockCycles(clock, self.drain_cycles))
+        scoreboard = self.env.scoreboard
+        if scoreboard.first_cycle is not None and scoreboard.last_cycle is None:
+            task.kill()
+            self.logger.critical("No Wishbone request after %d cycles, %d bus requests in flight",
+                self.drain_cycles, len(scoreboard.in_flight))
+            assert False, "WishboneAdapter never started a Wishbone cycle"
+        await task
+        ## Let the last requests through the adapter
+        for _ in range(self.drain_cycles):
+            if not self.env.scoreboard.in_flight:
+                break
+            await RisingEdge(clock)
+        self.drop_objection()
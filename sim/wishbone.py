@@ -1,14 +1,41 @@
+from collections import deque
+
 from cocotb_utils import SimpleBfm
 from cocotb.triggers import RisingEdge, ReadOnly, NextTimeStep, ClockCycles
 
+def accepted_transfer(cyc, stb, ack, stall=False, pipelined=False):
+    """Whether a request completes its handshake on this clock edge.
+
+    A classic request is held until its ack, so it is accepted with ``stb`` and
+    ``ack`` high. A pipelined request is accepted with ``stb`` high and ``stall`` low.
+    """
+    if not (cyc and stb):
+        return False
+    return not stall if pipelined else bool(ack)
+
 class WishboneBfm(SimpleBfm):
+    """Wishbone B4 source and sink, classic or pipelined.
+
+    In pipelined mode a request is accepted on every clock edge with ``stb``
+    high and ``stall`` low, and acknowledged in order by a later ``ack``.
+    ``cyc`` stays high while requests are outstanding. Without a ``stall``
+    signal the sink never stalls. Requests and replies are dicts like the ones
+    of ``sink_receive``: ``addr``, plus ``data`` and ``sel`` for writes.
+    """
     Signals = SimpleBfm.make_signals("WishboneBfm",[
         "adr", "datwr", "datrd",
         "we", "cyc", "stb", "ack",
-    ],optional=["sel"])
+    ],optional=["sel","stall"])
     has_sel = property(lambda self: self.bus.sel is not None)
-    def __init__(self, clock, entity = None, signals = None, reset=None, reset_n=None, period=10, period_unit="ns",prefix=None):
+    has_stall = property(lambda self: self.bus.stall is not None)
+    def __init__(self, clock, entity = None, signals = None, reset=None, reset_n=None, period=10, period_unit="ns",prefix=None,
+            pipelined=False, max_outstanding=4):
         super().__init__(clock, signals=signals, entity=entity, reset=reset, reset_n=reset_n, period=period, period_unit=period_unit, prefix=prefix)
+        self.pipelined = pipelined
+        self.max_outstanding = max_outstanding
+    @property
+    def stalled(self):
+        return self.has_stall and self.bus.stall.value.binstr == "1"
     def source_init(self):
         self.bus.cyc.setimmediatevalue(0)
         self.bus.stb.setimmediatevalue(0)
@@ -20,36 +47,92 @@ class WishboneBfm(SimpleBfm):
     def sink_init(self):
         self.bus.ack.setimmediatevalue(0)
         self.bus.datrd.setimmediatevalue(0)
+        if self.has_stall:
+            self.bus.stall.setimmediatevalue(0)
     def source_read(self,addr):
         return self.source_read_write(addr=addr,wr_enable=False)
     def source_write(self,data,addr,sel=None):
         return self.source_read_write(data=data,addr=addr,sel=sel,wr_enable=True)
     async def source_read_write(self,data=None,addr=None,sel=None,wr_enable=False):
+        request = dict(addr=addr,data=data,sel=sel) if wr_enable else dict(addr=addr)
+        if self.pipelined:
+            await self.source_burst([request])
+            return
         await RisingEdge(self.clock)
         self.bus.cyc.value = 1
+        self.drive_request(request)
+        while True:
+            await RisingEdge(self.clock)
+            await ReadOnly()
+            if self.bus.ack.value.binstr == "1":
+                break
+        await RisingEdge(self.clock)
+        self.bus.cyc.value = 0
+        self.bus.stb.value = 0
+    def drive_request(self,request):
         self.bus.stb.value = 1
+        self.bus.adr.value = request['addr']
+        wr_enable = 'data' in request
         self.bus.we.value = wr_enable
-        self.bus.adr.value = addr
         if wr_enable:
-            self.bus.datwr.value = data
+            self.bus.datwr.value = request['data']
             if self.has_sel:
+                sel = request.get('sel')
                 if sel is None:
                     sel = int("1"*self.bus.sel.value.n_bits,2)
                 self.bus.sel.value = sel
-        while True:
+    async def source_burst(self,requests,max_outstanding=None):
+        """Issue requests back to back in one pipelined cycle, return the reads data in order.
+
+        Writes return None. At most ``max_outstanding`` requests wait for their ack.
+        """
+        if max_outstanding is None:
+            max_outstanding = self.max_outstanding
+        requests = iter(requests)
+        current = next(requests,None)
+        outstanding = deque()
+        replies = []
+        if current is None:
+            return replies
+        await RisingEdge(self.clock)
+        self.bus.cyc.value = 1
+        self.drive_request(current)
+        driven = True
+        while current is not None or outstanding:
             await RisingEdge(self.clock)
             await ReadOnly()
-            if self.bus.ack.value.binstr == "1":
-                break
-        await RisingEdge(self.clock)
+            if driven and not self.stalled:
+                outstanding.append('data' in current)
+                current = next(requests,None)
+            if self.bus.ack.value.binstr == "1" and outstanding:
+                if outstanding.popleft():
+                    replies.append(None)
+                else:
+                    replies.append(self.bus.datrd.value.integer)
+            await NextTimeStep()
+            driven = current is not None and len(outstanding) < max_outstanding
+            if driven:
+                self.drive_request(current)
+            else:
+                self.bus.stb.value = 0
         self.bus.cyc.value = 0
-        self.bus.stb.value = 0
+        return replies
+    def source_read_burst(self,addr,count,stride=None,max_outstanding=None):
+        """Read ``count`` words from consecutive addresses, ``stride`` defaults to the data width in bytes."""
+        if stride is None:
+            stride = self.bus.datwr.value.n_bits // 8
+        return self.source_burst([dict(addr=addr + i*stride) for i in range(count)],max_outstanding)
+    def source_write_burst(self,addr,data,sel=None,stride=None,max_outstanding=None):
+        """Write the words of ``data`` to consecutive addresses."""
+        if stride is None:
+            stride = self.bus.datwr.value.n_bits // 8
+        return self.source_burst([dict(addr=addr + i*stride,data=d,sel=sel) for i,d in enumerate(data)],max_outstanding)
     async def source_receive(self):
         while True:
             await RisingEdge(self.clock)
             await ReadOnly()
             if self.in_reset:
-                self.log.debug(f"WB sink receive in_reset true, continue...")
+                self.log.debug("WB sink receive in_reset true, continue...")
                 continue
             if self.bus.ack.value.binstr == "1":
                 received = dict(ack=True)
@@ -61,22 +144,108 @@ class WishboneBfm(SimpleBfm):
             await RisingEdge(self.clock)
             await ReadOnly()
             if self.in_reset:
-                self.log.debug(f"WB sink receive in_reset true, continue...")
+                self.log.debug("WB sink receive in_reset true, continue...")
                 continue
-            if self.bus.cyc.value.binstr == "1" and self.bus.stb.value.binstr == "1":
-                self.log.debug("Enter if!")
-                received = dict(addr=int(self.bus.adr.value))
-                if self.bus.we.value.binstr == "1":
-                    received['data'] = int(self.bus.datwr.value)
-                    if self.has_sel:
-                        received['sel'] = int(self.bus.sel.value)
-                self.log.debug(f"Received {received}")
+            if self.bus.cyc.value.binstr == "1" and self.bus.stb.value.binstr == "1" and not self.stalled:
+                received = self.sampled_request()
+                self.log.debug("Received %s",received)
                 yield received
+    def sampled_request(self):
+        request = dict(addr=self.bus.adr.value.integer)
+        if self.bus.we.value.binstr == "1":
+            request['data'] = self.bus.datwr.value.integer
+            if self.has_sel:
+                request['sel'] = self.bus.sel.value.integer
+        return request
+    async def accepted(self):
+        """Yield every request once, on the edge its handshake completes, see ``accepted_transfer``.
+
+        ``sink_receive`` yields on every edge a classic request waits, use this
+        one to monitor transfers.
+        """
+        while True:
+            await RisingEdge(self.clock)
+            await ReadOnly()
+            if self.in_reset:
+                continue
+            if accepted_transfer(self.bus.cyc.value.binstr == "1",self.bus.stb.value.binstr == "1",
+                    self.bus.ack.value.binstr == "1",self.stalled,self.pipelined):
+                yield self.sampled_request()
     async def sink_reply(self,data=None):
         await RisingEdge(self.clock)
         self.bus.ack.value = 1
         if self.bus.we.value.binstr == "0":
             self.bus.datrd.value = data
-        await self.wait_for_signal(self.bus.stb,0)
+        if self.pipelined:
+            ## One ack per accepted request
+            await RisingEdge(self.clock)
+        else:
+            await self.wait_for_signal(self.bus.stb,0)
         self.bus.ack.value = 0
+    async def sink_serve(self,handler,latency=0,stall=None,max_outstanding=None):
+        """Pipelined slave, runs forever.
+
+        ``handler(request)`` is called when a request is accepted and returns the
+        read data, the ack follows ``latency`` cycles later, at least one. With a
+        ``stall`` signal, requests are stalled while ``max_outstanding`` are
+        waiting and on the cycles ``stall(cycle)`` is true.
+        """
+        if max_outstanding is None:
+            max_outstanding = self.max_outstanding
+        pending = deque()
+        cycle = 0
+        while True:
+            await RisingEdge(self.clock)
+            await ReadOnly()
+            cycle += 1
+            if self.in_reset or self.bus.cyc.value.binstr != "1":
+                pending.clear()
+            else:
+                if self.bus.ack.value.binstr == "1" and pending:
+                    pending.popleft()
+                if self.bus.stb.value.binstr == "1" and not self.stalled:
+                    pending.append((cycle + latency,handler(self.sampled_request())))
+            await NextTimeStep()
+            if pending and pending[0][0] <= cycle:
+                self.bus.ack.value = 1
+                if pending[0][1] is not None:
+                    self.bus.datrd.value = pending[0][1]
+            else:
+                self.bus.ack.value = 0
+            if self.has_stall:
+                self.bus.stall.value = int(len(pending) >= max_outstanding or (stall is not None and bool(stall(cycle))))
+
+class WishboneMemory:
+    """Wishbone slave serving a memory with ``read_word`` and ``write_word``, like ``PagedMemory``.
 
+    Addresses are byte addresses and writes honour ``sel``. Every ack comes
+    ``wait_states`` cycles after its request. ``mmio`` maps addresses to
+    handlers, called with the request dict, returning the read data.
+    """
+    def __init__(self, bfm, memory, wait_states=0, mmio=None):
+        self.bfm = bfm
+        self.memory = memory
+        self.wait_states = wait_states
+        self.mmio = {} if mmio is None else mmio
+        self.reads = 0
+        self.writes = 0
+    def access(self,request):
+        handler = self.mmio.get(request['addr'])
+        if handler is not None:
+            return handler(request)
+        if 'data' in request:
+            self.writes += 1
+            self.memory.write_word(request['addr'],request['data'],request.get('sel',0xF))
+            return None
+        self.reads += 1
+        return self.memory.read_word(request['addr'])
+    async def run(self):
+        self.bfm.sink_init()
+        if self.bfm.pipelined:
+            await self.bfm.sink_serve(self.access,latency=self.wait_states + 1)
+            return
+        async for request in self.bfm.sink_receive():
+            data = self.access(request)
+            if self.wait_states > 0:
+                await ClockCycles(self.bfm.clock,self.wait_states)
+            await self.bfm.sink_reply(data)